@@ -28,6 +28,18 @@ if [ -n "$SANDBOX_PID" ]; then
     echo $SANDBOX_PID | xargs kill
 fi
 
+# On pull requests, leave out the docs targets that the changes do not
+# need (see docs/scripts/plan_docs_build.py). The checkout is the merge
+# of the branch into its target.
+docs_skip=""
+if [[ "${BUILD_REASON:-}" == "PullRequest" ]]; then
+  # Any error of the planner builds all docs rather than failing.
+  docs_skip="$(python3 docs/scripts/plan_docs_build.py --base HEAD^1)" || docs_skip=""
+  if [[ " $docs_skip " == *" -//docs:docs "* ]]; then
+    echo "##vso[task.setvariable variable=skip_docs_bundle]true"
+  fi
+fi
+
 # Bazel test only builds targets that are dependencies of a test suite so do a full build first.
 bazel build //... \
   --build_tag_filters "$tag_filter" \
@@ -35,7 +47,8 @@ bazel build //... \
   --experimental_profile_include_target_label \
   --build_event_json_file build-events.json \
   --build_event_publish_all_actions \
-  --experimental_execution_log_file "$ARTIFACT_DIRS/logs/build_execution${execution_log_postfix}.log"
+  --experimental_execution_log_file "$ARTIFACT_DIRS/logs/build_execution${execution_log_postfix}.log" \
+  -- $docs_skip
 
 # Set up a shared PostgreSQL instance.
 export POSTGRESQL_ROOT_DIR="${TMPDIR:-/tmp}/daml/postgresql"
@@ -79,7 +92,8 @@ bazel test //... \
   --experimental_profile_include_target_label \
   --build_event_json_file test-events.json \
   --build_event_publish_all_actions \
-  --experimental_execution_log_file "$ARTIFACT_DIRS/logs/test_execution${execution_log_postfix}.log"
+  --experimental_execution_log_file "$ARTIFACT_DIRS/logs/test_execution${execution_log_postfix}.log" \
+  -- $docs_skip
 
 # Make sure that Bazel query works.
 bazel query 'deps(//...)' >/dev/null
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Benchmark for DAMLLexer.
+#
+# Lexes all .daml files under docs/source with DAMLLexer and with the
+# previous implementation, which extends Pygments' HaskellLexer with the
+# Daml keywords, and reports the throughput of both. The script fails if
+# the two lexers produce different tokens.
+#
+# Usage: docs/benchmarks/daml_lexer.py [--repeat N]
+
+import argparse
+import os
+import sys
+import timeit
+
+from pygments.lexer import inherit
+from pygments.lexers.haskell import HaskellLexer
+from pygments.token import Keyword, Operator
+
+DOCS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(DOCS_DIR, 'configs', 'static'))
+
+from pygments_daml_lexer import DAMLLexer
+
+class ReferenceDAMLLexer(HaskellLexer):
+    """The DAMLLexer as it was before it had its own state table."""
+
+    daml_reserved = ('template', 'with', 'controller', 'can', 'ensure', 'daml', 'observer', 'signatory', 'agreement', 'nonconsuming', 'return', 'this')
+
+    tokens = {
+        'root': [
+            (r'\b(%s)(?!\')\b' % '|'.join(daml_reserved), Keyword.Reserved),
+            (r'\b(True|False)\b', Keyword.Constant),
+            (r'≡', Operator),
+            inherit
+        ]
+    }
+
+def corpus():
+    """The .daml files under docs/source, as (name, text) pairs."""
+    files = []
+    for root, dirs, names in os.walk(os.path.join(DOCS_DIR, 'source')):
+        dirs.sort()
+        for name in sorted(names):
+            if name.endswith('.daml'):
+                path = os.path.join(root, name)
+                with open(path, encoding='utf-8') as f:
+                    files.append((os.path.relpath(path, DOCS_DIR), f.read()))
+    return files
+
+def time_lexer(lexer, text, repeat):
+    tokens = []
+    def lex():
+        tokens[:] = lexer.get_tokens(text)
+    seconds = min(timeit.repeat(lex, number=1, repeat=repeat))
+    return seconds, tokens
+
+def run(repeat):
+    reference = ReferenceDAMLLexer()
+    lexer = DAMLLexer()
+    files = corpus()
+    text = '\n'.join(t for _, t in files)
+    ref_seconds, ref_tokens = time_lexer(reference, text, repeat)
+    seconds, tokens = time_lexer(lexer, text, repeat)
+    return {
+        'files': len(files),
+        'chars': len(text),
+        'tokens': len(tokens),
+        'reference_seconds': ref_seconds,
+        'seconds': seconds,
+        'identical': ref_tokens == tokens,
+        'differences': [name for name, t in files
+                        if list(reference.get_tokens(t)) != list(lexer.get_tokens(t))]
+                       if ref_tokens != tokens else [],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    r = run(args.repeat)
+    print('%d files, %d chars, %d tokens' % (r['files'], r['chars'], r['tokens']))
+    print('%-12s %10s %12s' % ('lexer', 'ms', 'tokens/s'))
+    for name, seconds in [('reference', r['reference_seconds']), ('DAMLLexer', r['seconds'])]:
+        print('%-12s %10.2f %12.0f' % (name, seconds * 1000, r['tokens'] / seconds))
+    print('speedup: %.1fx' % (r['reference_seconds'] / r['seconds']))
+    if not r['identical']:
+        print('ERROR: DAMLLexer and the reference lexer produce different tokens for:')
+        for name in r['differences']:
+            print('  ' + name)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
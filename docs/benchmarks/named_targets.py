@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Benchmark for the list item labeling of the more_named_targets
+# extension on synthetic doctrees.
+#
+# The generated documents mimic long reference pages: many top-level
+# enumeration lists with deeply nested sub-lists and definition lists,
+# where every item carries a label. Each document is labelled with
+# list_item_names and with the previous implementation, which traversed
+# the tree once per kind of list and numbered every enumeration list
+# item from its ancestors, and the script fails if the names differ.
+#
+# Usage: docs/benchmarks/named_targets.py [--repeat N]
+
+import argparse
+import itertools
+import os
+import sys
+import timeit
+
+from docutils import nodes
+from docutils.utils import new_document
+from sphinx.util.nodes import clean_astext
+
+DOCS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(DOCS_DIR, 'source', 'concepts', 'ledger-model', 'exts'))
+
+from more_named_targets import list_item_names, toRoman
+
+ENUMTYPES = ['arabic', 'loweralpha', 'upperalpha', 'lowerroman', 'upperroman']
+
+# (lists, width, depth) of the generated documents.
+SIZES = [
+    (10, 10, 1),
+    (10, 10, 2),
+    (1, 5000, 1),
+    (10, 5, 5),
+    (2, 3, 9),
+]
+
+def reference_list_item_names(document):
+    """The names of list items as the extension computed them before
+    list_item_names."""
+    names = {}
+    for node in document.traverse(nodes.definition_list_item):
+        if node == node.parent.children[0]:
+            node_labels = node.parent['ids']
+        else:
+            node_labels = node['ids']
+        if node_labels:
+            term = clean_astext(node.children[0])
+            for label in node_labels:
+                names[label] = term
+
+    def list_item_enumerator(node):
+        start = node.parent.get('start', 1)
+        index = node.parent.children.index(node) + start
+        enumtype = node.parent['enumtype']
+        if enumtype == 'arabic':
+            suffix = str(index)
+        elif enumtype == 'loweralpha':
+            suffix = chr(ord('a') + index - 1)
+        elif enumtype == 'upperalpha':
+            suffix = chr(ord('A') + index - 1)
+        elif enumtype == 'lowerroman':
+            suffix = toRoman(index).lower()
+        elif enumtype == 'upperroman':
+            suffix = toRoman(index).upper()
+        else:
+            raise Exception("unknown enumeration list type")
+        if (isinstance(node.parent.parent, nodes.list_item)
+                and isinstance(node.parent.parent.parent, nodes.enumerated_list)):
+            prefix = list_item_enumerator(node.parent.parent) + '.'
+        else:
+            prefix = ''
+        return prefix + suffix
+
+    for node in document.traverse(nodes.enumerated_list):
+        child_labels = [node['ids']] + [c['ids'] for c in node.children[1:]]
+        for (i, child) in enumerate(node.children):
+            for label in child_labels[i]:
+                names[label] = list_item_enumerator(child)
+    return names
+
+def time_names(function, document, repeat):
+    names = {}
+    def label():
+        names.clear()
+        names.update(function(document))
+    seconds = min(timeit.repeat(label, number=1, repeat=repeat))
+    return seconds, names
+
+def make_document(lists, width, depth):
+    """A document with `lists` enumeration lists and as many definition
+    lists, each with `width` labelled items per level, nested `depth`
+    levels deep."""
+    counter = itertools.count()
+
+    def label():
+        return 'label-%d' % next(counter)
+
+    def enumerated_list(level):
+        result = nodes.enumerated_list(enumtype=ENUMTYPES[level % len(ENUMTYPES)])
+        result['ids'].append(label())
+        for _ in range(width):
+            item = nodes.list_item()
+            item['ids'].append(label())
+            item += nodes.paragraph(text='An item.')
+            if level + 1 < depth:
+                item += enumerated_list(level + 1)
+            result += item
+        return result
+
+    def definition_list(level):
+        result = nodes.definition_list()
+        result['ids'].append(label())
+        for i in range(width):
+            item = nodes.definition_list_item()
+            item['ids'].append(label())
+            item += nodes.term(text='term %d' % i)
+            definition = nodes.definition()
+            definition += nodes.paragraph(text='A definition.')
+            if level + 1 < depth:
+                definition += definition_list(level + 1)
+            item += definition
+            result += item
+        return result
+
+    document = new_document('<benchmark>')
+    for _ in range(lists):
+        section = nodes.section()
+        section += enumerated_list(0)
+        section += definition_list(0)
+        document += section
+    return document, next(counter)
+
+def run(repeat):
+    results = []
+    for lists, width, depth in SIZES:
+        document, labels = make_document(lists, width, depth)
+        ref_seconds, ref_names = time_names(reference_list_item_names, document, repeat)
+        seconds, names = time_names(list_item_names, document, repeat)
+        results.append({
+            'lists': lists,
+            'width': width,
+            'depth': depth,
+            'labels': labels,
+            'reference_seconds': ref_seconds,
+            'seconds': seconds,
+            'identical': names == ref_names,
+        })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print('%6s %6s %6s %9s %12s %10s %12s %8s' % (
+        'lists', 'width', 'depth', 'labels', 'reference ms', 'ms', 'labels/s', 'speedup'))
+    results = run(args.repeat)
+    for r in results:
+        print('%6d %6d %6d %9d %12.2f %10.2f %12.0f %7.1fx' % (
+            r['lists'], r['width'], r['depth'], r['labels'], r['reference_seconds'] * 1000,
+            r['seconds'] * 1000, r['labels'] / r['seconds'], r['reference_seconds'] / r['seconds']))
+    different = [r for r in results if not r['identical']]
+    if different:
+        print('ERROR: list_item_names and the previous implementation name the items differently for:')
+        for r in different:
+            print('  lists=%d width=%d depth=%d' % (r['lists'], r['width'], r['depth']))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Benchmark suite for the docs extensions and lexers, with baselines.
+#
+# Measures the throughput of DAMLLexer and LinearTypeScriptLexer on the
+# real corpora (see daml_lexer.py and typescript_lexer.py) and on the
+# corpora repeated to larger sizes, and the labeling time of
+# more_named_targets on generated doctrees of increasing size and
+# nesting (see named_targets.py).
+#
+# The results can be written to a JSON file and compared against such a
+# file from an earlier run: the script fails if a benchmark got slower
+# than the baseline by more than the tolerance. Timings depend on the
+# machine, so only compare results from the same machine, e.g.
+#
+#   git checkout main && docs/benchmarks/suite.py --output /tmp/base.json
+#   git checkout my-branch && docs/benchmarks/suite.py --baseline /tmp/base.json
+#
+# Usage: docs/benchmarks/suite.py [--repeat N] [--filter TEXT]
+#            [--output FILE] [--baseline FILE] [--tolerance FRACTION]
+
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+
+import docutils
+import pygments
+
+DOCS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(DOCS_DIR, 'configs', 'static'))
+sys.path.insert(0, os.path.join(DOCS_DIR, 'source', 'concepts', 'ledger-model', 'exts'))
+
+import daml_lexer
+import named_targets
+import typescript_lexer
+from more_named_targets import list_item_names
+from pygments_daml_lexer import DAMLLexer
+from typescript import LinearTypeScriptLexer
+
+# The corpora are repeated this many times for the scaled inputs.
+SCALES = [1, 4, 16]
+
+# Further doctree sizes (lists, width, depth), to see how the labeling
+# scales with the number of labels and with the nesting.
+DOCTREE_SIZES = named_targets.SIZES + [
+    (100, 10, 2),
+    (10, 10, 3),
+    (4, 4, 7),
+]
+
+# Every benchmark is a (name, unit, setup) triple, where setup() returns
+# the function to time, which returns the number of units it processed.
+
+def lexer_benchmarks(name, lexer, corpus):
+    def setup(scale):
+        text = '\n'.join([t for _, t in corpus()] * scale)
+        return lambda: sum(1 for _ in lexer.get_tokens(text))
+    for scale in SCALES:
+        yield '%s/x%d' % (name, scale), 'tokens', lambda scale=scale: setup(scale)
+
+def doctree_benchmarks():
+    def setup(lists, width, depth):
+        document, labels = named_targets.make_document(lists, width, depth)
+        def label():
+            list_item_names(document)
+            return labels
+        return label
+    for size in DOCTREE_SIZES:
+        yield 'named-targets/%dx%dx%d' % size, 'labels', lambda size=size: setup(*size)
+
+def benchmarks():
+    yield from lexer_benchmarks('daml-lexer', DAMLLexer(), daml_lexer.corpus)
+    yield from lexer_benchmarks('typescript-lexer', LinearTypeScriptLexer(), typescript_lexer.corpus)
+    yield from doctree_benchmarks()
+
+def measure(function, repeat):
+    """The best time of one call of `function`. Fast functions are called
+    repeatedly in every measurement, to get above the timer noise."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(number=number, repeat=repeat)) / number
+
+def run(repeat, name_filter):
+    results = {}
+    for name, unit, setup in benchmarks():
+        if name_filter and name_filter not in name:
+            continue
+        function = setup()
+        units = function()
+        seconds = measure(function, repeat)
+        results[name] = {
+            'unit': unit,
+            'units': units,
+            'seconds': seconds,
+            'rate': units / seconds,
+        }
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'pygments': pygments.__version__,
+            'docutils': docutils.__version__,
+            'machine': platform.machine(),
+            'node': platform.node(),
+        },
+        'results': results,
+    }
+
+def compare(report, baseline, tolerance):
+    """(name, rate, baseline rate, regressed) for the benchmarks present in
+    both runs."""
+    comparison = []
+    for name, result in report['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        regressed = result['rate'] < base['rate'] / (1 + tolerance)
+        comparison.append((name, result['rate'], base['rate'], regressed))
+    return comparison
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the docs extensions and lexers.')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--filter', help='only run the benchmarks whose name contains this')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against the results in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown against the baseline (default: 0.25, i.e. 25%%)')
+    args = parser.parse_args()
+
+    report = run(args.repeat, args.filter)
+    print('%-32s %9s %10s %14s' % ('benchmark', 'units', 'ms', 'units/s'))
+    for name, r in report['results'].items():
+        print('%-32s %9d %10.2f %14.0f %s' % (name, r['units'], r['seconds'] * 1000, r['rate'], r['unit']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+        print('results written to %s' % args.output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['environment'] != report['environment']:
+            print('WARNING: the baseline was recorded in a different environment: %s'
+                  % json.dumps(baseline['environment'], sort_keys=True))
+        comparison = compare(report, baseline, args.tolerance)
+        print()
+        print('%-32s %14s %14s %8s' % ('benchmark', 'units/s', 'baseline', 'change'))
+        for name, rate, base_rate, regressed in comparison:
+            print('%-32s %14.0f %14.0f %+7.1f%%%s' % (
+                name, rate, base_rate, 100.0 * (rate / base_rate - 1), '  REGRESSION' if regressed else ''))
+        regressions = [c for c in comparison if c[3]]
+        if regressions:
+            print('ERROR: %d benchmark(s) more than %.0f%% slower than the baseline.'
+                  % (len(regressions), args.tolerance * 100))
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
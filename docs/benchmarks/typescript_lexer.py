@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Benchmark for TypeScriptLexer and LinearTypeScriptLexer.
+#
+# The corpus consists of the real TypeScript sources in the repository
+# (the create-daml-app template that the getting started guide includes
+# and the TypeScript bindings) and of adversarial inputs that make the
+# backtracking rules of TypeScriptLexer blow up. For every input, the
+# tokens of both lexers are compared; the script fails if they differ.
+# LinearTypeScriptLexer only uses its scanners on texts that need them
+# (see needs_scanners in typescript.py), so the real sources measure its
+# regexes and the adversarial inputs its scanners.
+#
+# Usage: docs/benchmarks/typescript_lexer.py [--repeat N]
+
+import argparse
+import os
+import sys
+import timeit
+
+DOCS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(DOCS_DIR)
+sys.path.insert(0, os.path.join(DOCS_DIR, 'configs', 'static'))
+
+from typescript import TypeScriptLexer, LinearTypeScriptLexer
+
+CORPUS_DIRS = ['templates', os.path.join('language-support', 'ts')]
+
+# name -> (generator, sizes, largest size the reference lexer is run on)
+ADVERSARIAL = {
+    # An unterminated string of backslashes, exponential for the
+    # reference lexer.
+    'backslashes': (lambda n: '"' + '\\\\' * n + '\n', [8, 12, 14, 1000, 100000], 14),
+    # A long chain of dotted names, quadratic for the reference lexer.
+    'dotted-names': (lambda n: 'a.' * n + '\n', [1000, 4000, 100000], 4000),
+    # Many unterminated comments.
+    'comments': (lambda n: '/* ' * n + '\n', [1000, 4000, 100000], 4000),
+    # `module` followed by a long run of whitespace.
+    'module': (lambda n: 'module' + ' ' * n + ';\n', [1000, 4000, 100000], 4000),
+    # Unterminated JSX attributes.
+    'attributes': (lambda n: '<a b="' * n + '\n', [1000, 4000, 100000], 4000),
+}
+
+def corpus():
+    """The real .ts and .tsx files, as (name, text) pairs."""
+    files = []
+    for corpus_dir in CORPUS_DIRS:
+        for root, dirs, names in os.walk(os.path.join(REPO_DIR, corpus_dir)):
+            dirs[:] = sorted(d for d in dirs if d != 'node_modules')
+            for name in sorted(names):
+                if name.endswith(('.ts', '.tsx')):
+                    path = os.path.join(root, name)
+                    with open(path, encoding='utf-8') as f:
+                        files.append((os.path.relpath(path, REPO_DIR), f.read()))
+    return files
+
+def time_lexer(lexer, text, repeat):
+    tokens = []
+    def lex():
+        tokens[:] = lexer.get_tokens(text)
+    seconds = min(timeit.repeat(lex, number=1, repeat=repeat))
+    return seconds, tokens
+
+def run(repeat):
+    reference = TypeScriptLexer()
+    linear = LinearTypeScriptLexer()
+    results = []
+
+    files = corpus()
+    text = '\n'.join(t for _, t in files)
+    ref_seconds, ref_tokens = time_lexer(reference, text, repeat)
+    lin_seconds, lin_tokens = time_lexer(linear, text, repeat)
+    results.append({
+        'input': 'corpus (%d files)' % len(files),
+        'chars': len(text),
+        'tokens': len(lin_tokens),
+        'reference_seconds': ref_seconds,
+        'linear_seconds': lin_seconds,
+        'identical': ref_tokens == lin_tokens,
+    })
+
+    for name, (generate, sizes, reference_limit) in sorted(ADVERSARIAL.items()):
+        for size in sizes:
+            text = generate(size)
+            lin_seconds, lin_tokens = time_lexer(linear, text, repeat)
+            result = {
+                'input': '%s x%d' % (name, size),
+                'chars': len(text),
+                'tokens': len(lin_tokens),
+                'reference_seconds': None,
+                'linear_seconds': lin_seconds,
+                'identical': None,
+            }
+            if size <= reference_limit:
+                ref_seconds, ref_tokens = time_lexer(reference, text, 1)
+                result['reference_seconds'] = ref_seconds
+                result['identical'] = ref_tokens == lin_tokens
+            results.append(result)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    print('%-28s %9s %9s %12s %12s %10s' % ('input', 'chars', 'tokens', 'reference ms', 'linear ms', 'identical'))
+    for r in results:
+        print('%-28s %9d %9d %12s %12.2f %10s' % (
+            r['input'], r['chars'], r['tokens'],
+            '-' if r['reference_seconds'] is None else '%.2f' % (r['reference_seconds'] * 1000),
+            r['linear_seconds'] * 1000,
+            '-' if r['identical'] is None else r['identical']))
+    if any(r['identical'] is False for r in results):
+        print('ERROR: LinearTypeScriptLexer and TypeScriptLexer produce different tokens.')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
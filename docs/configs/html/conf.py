@@ -35,9 +35,25 @@ sys.path.insert(0, os.path.abspath('../static'))
 # ones.
 extensions = [
     'sphinx.ext.extlinks',
-    'sphinx_copybutton'
+    'sphinx_copybutton',
+    'warning_gate',
+    'doctree_cache',
+    'literalinclude_cache',
+    'split_pages',
+    'check_closing_quotes',
+    'subprojects',
+    'redirects',
+    'sitemap',
+    'search_shards',
+    'postprocess',
+    'reproducible',
+    'pdf_build',
+    'profiling',
 ]
 
+# Lines of the sources that check_closing_quotes does not check.
+closing_quotes_allowlist = os.path.abspath('../../scripts/check-closing-quotes.allow')
+
 # Add any paths that contain templates here, relative to this directory.
 templates_path = ['_templates']
 
@@ -57,12 +73,12 @@ author = u'Digital Asset'
 
 # The version info for the project you're documenting, acts as replacement for
 # |version| and |release|, also used in various other places throughout the
-# built documents.
+# built documents. The Bazel rules pass it in through DOCS_VERSION.
 #
 # The short X.Y version.
-version = u'__VERSION__'
+version = os.environ.get('DOCS_VERSION', u'__VERSION__')
 # The full version, including alpha/beta/rc tags.
-release = u'__VERSION__'
+release = version
 
 # The language for content autogenerated by Sphinx. Refer to documentation
 # for a list of supported languages.
@@ -171,16 +187,14 @@ texinfo_documents = [
      'Miscellaneous'),
 ]
 
-rst_prolog = """
-.. _installer: https://github.com/digital-asset/daml/releases/download/v{release}/daml-sdk-{release}-windows.exe
-.. _Artifactory: https://digitalasset.jfrog.io/ui/repos/tree/General/sdk-ee
-.. _protobufs: https://github.com/digital-asset/daml/releases/download/v{release}/protobufs-{release}.zip
-.. _api-test-tool: https://repo1.maven.org/maven2/com/daml/ledger-api-test-tool/{release}/ledger-api-test-tool-{release}.jar
-""".format(release = release)
+import prolog
+rst_prolog = prolog.rst_prolog(release)
 
 # Import the Daml lexer
 def setup(sphinx):
     from pygments_daml_lexer import DAMLLexer
     sphinx.add_lexer("daml", DAMLLexer())
-    from typescript import TypeScriptLexer
-    sphinx.add_lexer("tsx", TypeScriptLexer())
+    from typescript import LinearTypeScriptLexer
+    sphinx.add_lexer("tsx", LinearTypeScriptLexer())
+    # Cache the highlighted output of the lexers across builds
+    sphinx.setup_extension("highlight_cache")
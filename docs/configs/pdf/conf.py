@@ -37,7 +37,12 @@ sys.path.extend(map(os.path.abspath, glob.glob('packages/*')))
 # ones.
 extensions = [
     'sphinx.ext.autodoc',
-    'sphinx.ext.extlinks'
+    'sphinx.ext.extlinks',
+    'literalinclude_cache',
+    'image_converter',
+    'latex_driver',
+    'reproducible',
+    'profiling',
 ]
 
 # Add any paths that contain templates here, relative to this directory.
@@ -59,12 +64,12 @@ author = u'Digital Asset'
 
 # The version info for the project you're documenting, acts as replacement for
 # |version| and |release|, also used in various other places throughout the
-# built documents.
+# built documents. The Bazel rules pass it in through DOCS_VERSION.
 #
 # The short X.Y version.
-version = u'__VERSION__'
+version = os.environ.get('DOCS_VERSION', u'__VERSION__')
 # The full version, including alpha/beta/rc tags.
-release = u'__VERSION__'
+release = version
 
 # The language for content autogenerated by Sphinx. Refer to documentation
 # for a list of supported languages.
@@ -120,6 +125,14 @@ htmlhelp_basename = 'DigitalAssetSDKdoc'
 # -- Options for LaTeX output ---------------------------------------------
 latex_engine = 'lualatex'
 
+# Options for the lualatex runs of latex_driver. The binary itself is
+# passed in by the build through -D latex_driver_command=...
+latex_driver_args = ['-halt-on-error', '-interaction=batchmode']
+
+# The gif and svg images are converted to png by image_converter before
+# LaTeX runs. The convert binary is passed in by the build through
+# -D image_convert_command=...
+
 latex_elements = {
     # The paper size ('letterpaper' or 'a4paper').
     #
@@ -233,13 +246,6 @@ latex_elements = {
         \tymin=60pt
         \tymax=\maxdimen
 
-        \usepackage{epstopdf}
-
-        \epstopdfDeclareGraphicsRule{.gif}{png}{.png}{convert gif:#1[0] png:\OutputFile}
-        \AppendGraphicsExtensions{.gif}
-        \epstopdfDeclareGraphicsRule{.svg}{png}{.png}{convert svg:#1 png:\OutputFile}
-        \AppendGraphicsExtensions{.svg}
-
 
         \usepackage{titlesec}
         \titleformat{\chapter}[display]
@@ -281,7 +287,7 @@ latex_elements = {
         %% \listoftables
         \clearpage
         \pagenumbering{arabic}
-        ''',
+        '''.replace('__VERSION__', version),
     # Latex figure (float) alignment
     #
     # 'figure_align': 'htbp',
@@ -330,15 +336,14 @@ texinfo_documents = [
 ]
 
 
-rst_prolog = """
-.. _installer: https://github.com/digital-asset/daml/releases/download/v{release}/daml-sdk-{release}-windows.exe
-.. _protobufs: https://github.com/digital-asset/daml/releases/download/v{release}/protobufs-{release}.zip
-.. _api-test-tool: https://repo1.maven.org/maven2/com/daml/ledger-api-test-tool/{release}/ledger-api-test-tool-{release}.jar
-""".format(release = release)
+import prolog
+rst_prolog = prolog.rst_prolog(release)
 
 # Import the Daml lexer
 def setup(sphinx):
     from pygments_daml_lexer import DAMLLexer
     sphinx.add_lexer("daml", DAMLLexer())
-    from typescript import TypeScriptLexer
-    sphinx.add_lexer("tsx", TypeScriptLexer())
+    from typescript import LinearTypeScriptLexer
+    sphinx.add_lexer("tsx", LinearTypeScriptLexer())
+    # Cache the highlighted output of the lexers across builds
+    sphinx.setup_extension("highlight_cache")
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Check for invalid quote usage such as "variable `x``".
+#
+# A line is valid if its backquotes pair up as `...` or ``...``, with no
+# backquote in between. Lines matching any of the regexes in the
+# allow-list (grep basic regular expressions, one per line, `#` starts a
+# comment) are not checked.
+#
+# As a Sphinx extension, every source file is checked when it is read,
+# so the check runs in the parallel readers and only on documents that
+# changed. Inline literals and title references containing a backquote
+# are reported as well, as they are usually the result of a stray quote
+# the line check cannot see, unless they are on a line of the allow-list.
+# The allow-list is taken from the `closing_quotes_allowlist` config value.
+#
+# Usage: check_closing_quotes.py directory allow-list
+
+import argparse
+import multiprocessing
+import os
+import re
+import sys
+
+from docutils import nodes
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+FREE, OPEN_DOUBLE, IN_SINGLE, IN_DOUBLE, CLOSE_DOUBLE = range(5)
+
+# Transitions of the automaton recognising valid lines, on a backquote
+# and on any other character.
+ON_QUOTE = {
+    FREE: (IN_SINGLE, OPEN_DOUBLE),
+    OPEN_DOUBLE: (IN_DOUBLE,),
+    IN_SINGLE: (FREE,),
+    IN_DOUBLE: (CLOSE_DOUBLE,),
+    CLOSE_DOUBLE: (FREE,),
+}
+ON_OTHER = {
+    FREE: (FREE,),
+    IN_SINGLE: (IN_SINGLE,),
+    IN_DOUBLE: (IN_DOUBLE,),
+}
+
+_quotes = re.compile('`+')
+
+def quotes_balanced(line):
+    """Whether `line` matches ^([^`]*((`[^`]*`)|(``[^`]*``))[^`]*)*$, in
+    time linear in the length of the line."""
+    if '`' not in line:
+        return True
+    states = {FREE}
+    end = 0
+    for m in _quotes.finditer(line):
+        if m.start() > end:
+            states = {t for s in states for t in ON_OTHER.get(s, ())}
+        for _ in range(m.end() - m.start()):
+            states = {t for s in states for t in ON_QUOTE[s]}
+        if not states:
+            return False
+        end = m.end()
+    if len(line) > end:
+        states = {t for s in states for t in ON_OTHER.get(s, ())}
+    return FREE in states
+
+def bre_to_python(pattern):
+    """Translates a grep basic regular expression to a Python one."""
+    result = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\' and i + 1 < len(pattern):
+            c = pattern[i + 1]
+            if c in '(){}|+?':
+                result.append(c)
+            elif c in '<>':
+                result.append(r'\b')
+            else:
+                result.append('\\' + c)
+            i += 2
+            continue
+        if c == '[':
+            end = i + 1
+            if end < len(pattern) and pattern[end] == '^':
+                end += 1
+            if end < len(pattern) and pattern[end] == ']':
+                end += 1
+            end = pattern.find(']', end)
+            if end != -1:
+                result.append(pattern[i:end + 1].replace('\\', '\\\\'))
+                i = end + 1
+                continue
+        if c in '(){}|+?' or (c == '*' and i == 0):
+            result.append('\\' + c)
+        else:
+            result.append(c)
+        i += 1
+    return ''.join(result)
+
+def load_allowlist(filename):
+    """Compiles the regexes of an allow-list into one. Returns None if
+    there are none."""
+    patterns = []
+    with open(filename, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if line and not line.startswith('#'):
+                patterns.append('(?:%s)' % bre_to_python(line))
+    return re.compile('|'.join(patterns)) if patterns else None
+
+def check_text(text, allowlist):
+    """The (line number, line) pairs of all invalid lines in `text`."""
+    errors = []
+    for lineno, line in enumerate(text.splitlines(), 1):
+        if not quotes_balanced(line) and not (allowlist and allowlist.search(line)):
+            errors.append((lineno, line))
+    return errors
+
+_allowlist = None
+
+def _init_worker(allowlist):
+    global _allowlist
+    _allowlist = allowlist
+
+def _check_file(filename):
+    with open(filename, encoding='utf-8') as f:
+        return filename, check_text(f.read(), _allowlist)
+
+def check_files(filenames, allowlist, jobs=None):
+    """Checks files in parallel. Returns (filename, errors) pairs for the
+    files with errors, in the order of `filenames`."""
+    with multiprocessing.Pool(jobs, _init_worker, (allowlist,)) as pool:
+        results = pool.map(_check_file, filenames, chunksize=16)
+    return [(filename, errors) for filename, errors in results if errors]
+
+def find_sources(directory):
+    sources = []
+    for root, dirs, names in os.walk(directory):
+        dirs.sort()
+        sources.extend(os.path.join(root, name) for name in sorted(names) if name.endswith('.rst'))
+    return sources
+
+def main():
+    parser = argparse.ArgumentParser(description='Check for unpaired backquotes in .rst files.')
+    parser.add_argument('directory')
+    parser.add_argument('allowlist')
+    parser.add_argument('-j', '--jobs', type=int, default=None)
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.allowlist):
+        print('ERROR: Allow-list file not found: %s' % args.allowlist)
+        sys.exit(1)
+
+    results = check_files(find_sources(args.directory), load_allowlist(args.allowlist), args.jobs)
+    for filename, errors in results:
+        for lineno, line in errors:
+            print('%s:%d: unpaired quotes: %s' % (filename, lineno, line))
+    if results:
+        print('ERROR: %d file(s) found with errors, see above.' % len(results))
+        print("You can add lines to `%s' to ignore false positives." % args.allowlist)
+        sys.exit(1)
+
+# Sphinx extension
+
+def load_config(app, config):
+    filename = config.closing_quotes_allowlist
+    app.closing_quotes_allowlist = load_allowlist(filename) if filename else None
+
+def check_source(app, docname, source):
+    allowlist = app.closing_quotes_allowlist
+    errors = check_text(source[0], allowlist)
+    for lineno, line in errors:
+        logger.warning('unpaired quotes: %s', line, location=(docname, lineno))
+    app.env.temp_data['closing_quotes_errors'] = bool(errors)
+    app.env.temp_data['closing_quotes_allowed'] = [
+        line for line in source[0].splitlines() if '`' in line and allowlist and allowlist.search(line)]
+
+def check_doctree(app, doctree):
+    # A line with unpaired quotes usually also yields one of these nodes;
+    # report it only once.
+    if app.env.temp_data.get('closing_quotes_errors'):
+        return
+    allowed = app.env.temp_data.get('closing_quotes_allowed', [])
+    for node in doctree.traverse(lambda n: isinstance(n, (nodes.literal, nodes.title_reference))):
+        if '`' in node.astext():
+            # The allow-list applies to source lines: skip the node if it
+            # is written on one of the lines it matches.
+            source = node.rawsource or node.astext()
+            if any(source in line for line in allowed):
+                continue
+            logger.warning('unpaired quotes in %s: %s', node.tagname, node.astext(), location=node)
+
+def setup(app):
+    app.add_config_value('closing_quotes_allowlist', None, '')
+    app.connect('config-inited', load_config)
+    app.connect('source-read', check_source)
+    app.connect('doctree-read', check_doctree)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# A persistent, content-addressed cache of the Sphinx environment and
+# doctrees.
+#
+# Sphinx decides whether to re-read a document by comparing the mtime of
+# the source file (and of everything it depends on, e.g. literalinclude
+# targets) with the time it was last read. Our Bazel genrules copy the
+# sources into a fresh directory on every run, so all mtimes are new and
+# everything is re-read even when a single page changed.
+#
+# This extension keeps a copy of the doctree directory (including the
+# pickled environment) in `doctree_cache_dir` together with a manifest of
+# content hashes. On start-up, the cached doctrees are restored and every
+# document whose source and dependencies hash to the same value as
+# in the last build is marked as up to date, so only changed documents
+# are read again.
+#
+# The cache is disabled unless `doctree_cache_dir` is set, either in
+# conf.py or through the DOCS_DOCTREE_CACHE environment variable.
+#
+# In reproducible builds (see reproducible.py), the cache is written so
+# that the same sources give the same bytes, as //docs:doctrees hands it
+# on to the html builds through Bazel: the environment and doctrees are
+# pickled with dicts and sets in sorted order and equal strings shared,
+# the paths below the working directory (which is a different sandbox
+# every time) are made relative to it, and the read times are dropped.
+# mark_unchanged moves the read times of the unchanged documents past
+# their files again.
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from glob import glob
+
+import sphinx
+from sphinx.application import ENV_PICKLE_FILENAME
+from sphinx.util import logging
+
+from reproducible import sort_key
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = 'hashes.json'
+
+def file_hash(filename):
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+class HashCache(object):
+    """Memoizes file hashes for the duration of one build, as dependencies
+    are usually shared between many documents."""
+
+    def __init__(self, srcdir):
+        self.srcdir = srcdir
+        self.hashes = {}
+
+    def get(self, relpath):
+        if relpath not in self.hashes:
+            filename = os.path.join(self.srcdir, relpath)
+            self.hashes[relpath] = file_hash(filename) if os.path.isfile(filename) else None
+        return self.hashes[relpath]
+
+def doc_files(env, docname):
+    """The source of a document and its dependencies, relative to srcdir."""
+    files = [os.path.relpath(env.doc2path(docname), env.srcdir)]
+    files.extend(os.path.normpath(dep) for dep in sorted(env.dependencies.get(docname, ())))
+    return files
+
+class CanonicalPickler(pickle._Pickler):
+    """Pickles dicts and sets in sorted order, and equal strings once, with
+    the paths below `root` in them relative to it. Only the Python implementation
+    of the pickler lets the built-in types be pickled differently."""
+
+    dispatch = dict(pickle._Pickler.dispatch)
+
+    def __init__(self, file, root):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.root = os.path.join(root, '')
+        self.strings = {}
+
+    def save(self, obj, save_persistent_id=True):
+        if type(obj) is str:
+            obj = obj.replace(self.root, '')
+            # The memo is by identity, and whether equal strings are the
+            # same object depends on how the documents were read.
+            obj = self.strings.setdefault(obj, obj)
+        super().save(obj, save_persistent_id)
+
+    def save_dict(self, obj):
+        self.write(pickle.EMPTY_DICT)
+        self.memoize(obj)
+        self._batch_setitems(iter(sorted(obj.items(), key=sort_key)))
+    dispatch[dict] = save_dict
+
+    def save_set(self, obj):
+        self.write(pickle.EMPTY_SET)
+        self.memoize(obj)
+        self._batch_setitems_of_set(sorted(obj, key=str))
+    dispatch[set] = save_set
+
+    def _batch_setitems_of_set(self, items):
+        for i in range(0, len(items), self._BATCHSIZE):
+            self.write(pickle.MARK)
+            for item in items[i:i + self._BATCHSIZE]:
+                self.save(item)
+            self.write(pickle.ADDITEMS)
+
+    def save_reduce(self, func, args, state=None, listitems=None, dictitems=None, *rest, **kwargs):
+        # Subclasses of dict, e.g. defaultdict.
+        if dictitems is not None:
+            dictitems = iter(sorted(dictitems, key=sort_key))
+        super().save_reduce(func, args, state, listitems, dictitems, *rest, **kwargs)
+
+def canonicalize(directory, root):
+    """Pickles the environment and doctrees in `directory` again with
+    CanonicalPickler, without the read times."""
+    for filename in [os.path.join(directory, ENV_PICKLE_FILENAME)] + \
+            sorted(glob(os.path.join(directory, '**', '*.doctree'), recursive=True)):
+        with open(filename, 'rb') as f:
+            obj = pickle.load(f)
+        if filename.endswith(ENV_PICKLE_FILENAME):
+            obj.all_docs = dict.fromkeys(obj.all_docs, 0)
+        with open(filename, 'wb') as f:
+            CanonicalPickler(f, root).dump(obj)
+
+def cache_dir(config):
+    # Sphinx checks the environment version itself, but keying by the Sphinx
+    # version avoids throwing away the cache when switching back and forth.
+    return os.path.join(config.doctree_cache_dir, 'sphinx-' + sphinx.__display_version__)
+
+def copy_tree(src, dst):
+    # shutil.copytree only learned dirs_exist_ok in Python 3.8.
+    for root, _, files in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target, exist_ok=True)
+        for name in files:
+            shutil.copy2(os.path.join(root, name), os.path.join(target, name))
+
+def restore_cache(app, config):
+    if not config.doctree_cache_dir:
+        return
+    cached = cache_dir(config)
+    if not os.path.isfile(os.path.join(cached, ENV_PICKLE_FILENAME)):
+        logger.info('doctree cache: no cached environment in %s', cached)
+        return
+
+    copy_tree(cached, app.doctreedir)
+
+    # The environment remembers the absolute source directory, which is
+    # different in every Bazel sandbox. Sphinx discards environments whose
+    # srcdir has changed, so point it at the current one.
+    env_pickle = os.path.join(app.doctreedir, ENV_PICKLE_FILENAME)
+    try:
+        with open(env_pickle, 'rb') as f:
+            env = pickle.load(f)
+        env.srcdir = app.srcdir
+        with open(env_pickle, 'wb') as f:
+            pickle.dump(env, f, pickle.HIGHEST_PROTOCOL)
+    except Exception as err:
+        logger.info('doctree cache: ignoring unreadable environment: %s', err)
+        os.remove(env_pickle)
+        return
+    logger.info('doctree cache: restored environment from %s', cached)
+
+def mark_unchanged(app):
+    if not app.config.doctree_cache_dir:
+        return
+    manifest_file = os.path.join(app.doctreedir, MANIFEST_FILENAME)
+    if not os.path.isfile(manifest_file):
+        return
+    with open(manifest_file) as f:
+        manifest = json.load(f)
+
+    env = app.env
+    hashes = HashCache(env.srcdir)
+    unchanged = 0
+    for docname in env.all_docs:
+        files = doc_files(env, docname)
+        if any(manifest.get(f) is None or manifest[f] != hashes.get(f) for f in files):
+            continue
+        # Sphinx re-reads a document if any of its files is newer than the
+        # time it was last read, so move that time past the newest file.
+        newest = max(os.path.getmtime(os.path.join(env.srcdir, f)) for f in files)
+        env.all_docs[docname] = max(env.all_docs[docname], newest)
+        unchanged += 1
+    logger.info('doctree cache: %d of %d cached documents unchanged',
+                unchanged, len(env.all_docs))
+
+def save_cache(app, exception):
+    if exception is not None or not app.config.doctree_cache_dir:
+        return
+    env = app.env
+    hashes = HashCache(env.srcdir)
+    manifest = {}
+    for docname in env.all_docs:
+        for f in doc_files(env, docname):
+            manifest[f] = hashes.get(f)
+    with open(os.path.join(app.doctreedir, MANIFEST_FILENAME), 'w') as f:
+        json.dump(manifest, f, indent=0, sort_keys=True)
+
+    # Replace the cache in one step, so that concurrent or interrupted
+    # builds never see a half-written doctree directory.
+    cached = cache_dir(app.config)
+    staging = cached + '.tmp-%d' % os.getpid()
+    shutil.rmtree(staging, ignore_errors=True)
+    shutil.copytree(app.doctreedir, staging)
+    if getattr(app.config, 'reproducible_build', 0):
+        canonicalize(staging, os.getcwd())
+    shutil.rmtree(cached, ignore_errors=True)
+    os.rename(staging, cached)
+    logger.info('doctree cache: saved %d documents to %s', len(env.all_docs), cached)
+
+def setup(app):
+    app.add_config_value('doctree_cache_dir', os.environ.get('DOCS_DOCTREE_CACHE'), '')
+    app.connect('config-inited', restore_cache)
+    app.connect('builder-inited', mark_unchanged)
+    app.connect('build-finished', save_cache)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,148 @@
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# A persistent cache for the output of Pygments.
+#
+# Every html and pdf build highlights the same few hundred Daml and
+# TypeScript snippets again. This extension wraps
+# `PygmentsBridge.highlight_block`, which both the html and the latex
+# writers go through, and stores its result on disk, keyed by
+#
+# - the lexer (class, Pygments version and a hash of the module it is
+#   defined in, so that editing our own lexers invalidates the cache),
+# - the formatter (html or latex, style and options) and
+# - a hash of the code itself.
+#
+# Results are stored as one file per key, written atomically, so the
+# cache can be shared by concurrent builds and parallel writers.
+# Snippets for which Sphinx reported a warning are never cached, so the
+# warning shows up again in the next build.
+#
+# The cache is disabled unless `highlight_cache_dir` is set, either in
+# conf.py or through the DOCS_HIGHLIGHT_CACHE environment variable.
+
+import hashlib
+import inspect
+import logging as std_logging
+import multiprocessing
+import os
+
+import pygments
+from sphinx import highlighting
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+# Bump this when the format of cached entries changes.
+CACHE_VERSION = '1'
+
+# Shared with forked parallel writers, so that their hits and misses
+# are counted as well.
+hits = multiprocessing.Value('i', 0)
+misses = multiprocessing.Value('i', 0)
+
+_lexer_versions = {}
+
+def lexer_identity(lexer):
+    cls = type(lexer)
+    if cls not in _lexer_versions:
+        version = pygments.__version__
+        try:
+            with open(inspect.getsourcefile(cls), 'rb') as f:
+                version += ':' + hashlib.sha256(f.read()).hexdigest()
+        except (TypeError, OSError):
+            pass
+        _lexer_versions[cls] = '%s.%s:%s' % (cls.__module__, cls.__name__, version)
+    return _lexer_versions[cls]
+
+def style_identity(style):
+    return '%s.%s' % (style.__module__, style.__name__)
+
+def cache_key(bridge, source, lang, opts, kwargs):
+    lexer = highlighting.lexers.get(lang)
+    h = hashlib.sha256()
+    for part in [
+            CACHE_VERSION,
+            lexer_identity(lexer) if lexer is not None else 'pygments:' + pygments.__version__,
+            lang,
+            repr(sorted((opts or {}).items())),
+            bridge.dest,
+            style_identity(bridge.formatter_args['style']),
+            repr(sorted((k, v) for k, v in bridge.formatter_args.items() if k != 'style')),
+            repr(sorted(kwargs.items())),
+            repr(bridge.trim_doctest_flags)]:
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    h.update(source.encode('utf-8'))
+    return h.hexdigest()
+
+class WarningCounter(std_logging.Handler):
+    def __init__(self):
+        super(WarningCounter, self).__init__(std_logging.WARNING)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+def make_cached_highlight_block(cache_dir, highlight_block):
+    highlighting_logger = std_logging.getLogger('sphinx.' + highlighting.__name__)
+
+    def cached_highlight_block(self, source, lang, opts=None, location=None, force=False, **kwargs):
+        if not isinstance(source, str):
+            source = source.decode()
+        key = cache_key(self, source, lang, opts, kwargs)
+        filename = os.path.join(cache_dir, key[:2], key)
+        try:
+            with open(filename, encoding='utf-8') as f:
+                result = f.read()
+            with hits.get_lock():
+                hits.value += 1
+            return result
+        except OSError:
+            pass
+
+        counter = WarningCounter()
+        highlighting_logger.addHandler(counter)
+        try:
+            result = highlight_block(self, source, lang, opts, location, force, **kwargs)
+        finally:
+            highlighting_logger.removeHandler(counter)
+        with misses.get_lock():
+            misses.value += 1
+
+        if counter.count == 0:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            tmp = '%s.tmp-%d' % (filename, os.getpid())
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(result)
+            os.replace(tmp, filename)
+        return result
+
+    cached_highlight_block.uncached = highlight_block
+    return cached_highlight_block
+
+def install_cache(app, config):
+    if not config.highlight_cache_dir:
+        return
+    bridge = highlighting.PygmentsBridge
+    if not hasattr(bridge.highlight_block, 'uncached'):
+        bridge.highlight_block = make_cached_highlight_block(
+            os.path.abspath(config.highlight_cache_dir), bridge.highlight_block)
+
+def report_stats(app, exception):
+    if not app.config.highlight_cache_dir:
+        return
+    total = hits.value + misses.value
+    logger.info('highlight cache: %d hits, %d misses (%.0f%% hit rate)',
+                hits.value, misses.value, 100.0 * hits.value / total if total else 0)
+
+def setup(app):
+    app.add_config_value('highlight_cache_dir', os.environ.get('DOCS_HIGHLIGHT_CACHE'), '')
+    app.connect('config-inited', install_cache)
+    app.connect('build-finished', report_stats)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
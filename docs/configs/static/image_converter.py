@@ -0,0 +1,162 @@
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Converts the .gif and .svg images to .png for the latex builder.
+#
+# LaTeX cannot include gif or svg images. Rather than converting them
+# during the LaTeX run (which needs --shell-escape and converts every
+# image again in every pass), all images referenced by the documents are
+# converted with ImageMagick once the documents have been read, in
+# parallel threads. The resulting .png files are stored in
+# `image_cache_dir` (the DOCS_IMAGE_CACHE environment variable by
+# default), keyed by a hash of the image and the ImageMagick version, so
+# unchanged images are not converted again in later builds. An image converter then points
+# the image nodes to the converted files, as sphinx.ext.imgconverter
+# does.
+#
+# The extension is disabled unless `image_convert_command` is set to the
+# ImageMagick `convert` binary, in conf.py or through the
+# DOCS_IMAGE_CONVERT_COMMAND environment variable.
+
+import hashlib
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from sphinx.transforms.post_transforms.images import ImageConverter
+from sphinx.util import logging
+from sphinx.util.images import guess_mimetype
+
+logger = logging.getLogger(__name__)
+
+# Bump this when the conversion changes.
+CACHE_VERSION = '1'
+
+# The ImageMagick input for each format; only the first frame of an
+# animated gif ends up in the PDF.
+CONVERSIONS = {
+    'image/gif': 'gif:%s[0]',
+    'image/svg+xml': 'svg:%s',
+}
+
+def file_hash(filename):
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+class ImageCache(object):
+    def __init__(self, command, cache_dir):
+        self.command = command
+        self.cache_dir = cache_dir
+        self.converted = {}
+        self.hits = 0
+        self.misses = 0
+        try:
+            version = subprocess.run([command, '-version'], stdout=subprocess.PIPE).stdout
+        except OSError:
+            version = b''
+        self.version = version.decode('utf-8', 'replace').split('\n', 1)[0]
+
+    def cached_path(self, source, mimetype):
+        h = hashlib.sha256()
+        for part in [CACHE_VERSION, self.version, CONVERSIONS[mimetype]]:
+            h.update(part.encode('utf-8'))
+            h.update(b'\0')
+        h.update(file_hash(source).encode('ascii'))
+        key = h.hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key + '.png')
+
+    def fetch(self, source, mimetype):
+        """Converts `source` to png unless it is in the cache already.
+        Returns the path of the png, or None if the conversion failed, and
+        whether it was in the cache. Changes nothing in `self`, so it can
+        be called from several threads at once."""
+        target = self.cached_path(source, mimetype)
+        if os.path.isfile(target):
+            return target, True
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = '%s.tmp-%d-%d' % (target, os.getpid(), id(source))
+        result = subprocess.run([self.command, CONVERSIONS[mimetype] % source, 'png:' + tmp],
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        if result.returncode != 0 or not os.path.isfile(tmp):
+            logger.warning('cannot convert image %s: %s', source,
+                           result.stdout.decode('utf-8', 'replace').strip())
+            return None, False
+        os.replace(tmp, target)
+        return target, False
+
+    def record(self, source, target, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        if target is not None:
+            self.converted[source] = target
+
+    def convert(self, source, mimetype):
+        """Like `fetch`, but remembers the result."""
+        if source in self.converted:
+            return self.converted[source]
+        target, hit = self.fetch(source, mimetype)
+        self.record(source, target, hit)
+        return target
+
+def convert_images(app, env):
+    cache = getattr(app, 'image_cache', None)
+    if cache is None:
+        return
+    images = []
+    for relpath in sorted(env.images):
+        mimetype = guess_mimetype(relpath)
+        if mimetype in CONVERSIONS:
+            images.append((os.path.join(app.srcdir, relpath), mimetype))
+    # The conversions run in `convert` processes, and hashlib releases the
+    # GIL while hashing, so threads keep every core busy without the cost
+    # of starting and pickling for a process pool. The results are only
+    # recorded here, in the main thread.
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        results = list(pool.map(lambda image: cache.fetch(*image), images))
+    for (source, _), (target, hit) in zip(images, results):
+        cache.record(source, target, hit)
+    logger.info('image cache: %d images converted, %d taken from the cache', cache.misses, cache.hits)
+
+class CachedImageConverter(ImageConverter):
+    conversion_rules = [
+        ('image/gif', 'image/png'),
+        ('image/svg+xml', 'image/png'),
+    ]
+
+    def is_available(self):
+        return getattr(self.app, 'image_cache', None) is not None
+
+    def convert(self, _from, _to):
+        mimetype = guess_mimetype(_from)
+        target = self.app.image_cache.convert(_from, mimetype)
+        if target is None:
+            return False
+        shutil.copyfile(target, _to)
+        return True
+
+def init_cache(app):
+    config = app.config
+    if app.builder.name != 'latex' or not config.image_convert_command:
+        app.image_cache = None
+        return
+    cache_dir = config.image_cache_dir or os.path.join(app.doctreedir, 'images-cache')
+    app.image_cache = ImageCache(os.path.abspath(config.image_convert_command), os.path.abspath(cache_dir))
+
+def setup(app):
+    app.add_config_value('image_convert_command', os.environ.get('DOCS_IMAGE_CONVERT_COMMAND'), '')
+    app.add_config_value('image_cache_dir', os.environ.get('DOCS_IMAGE_CACHE'), '')
+    app.connect('builder-inited', init_cache)
+    app.connect('env-updated', convert_images)
+    app.add_post_transform(CachedImageConverter)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
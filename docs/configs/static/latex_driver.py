@@ -0,0 +1,146 @@
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Runs LaTeX on the output of the latex builder until it converges.
+#
+# LaTeX needs more than one pass to get references, the table of
+# contents and the PDF outline right: every pass writes the .aux, .toc
+# and .out files that the next pass reads. Rather than running a fixed
+# number of passes, this extension hashes those files after every pass
+# and stops as soon as a pass leaves them unchanged, or after
+# `latex_driver_max_passes` passes.
+#
+# If `latex_driver_cache_dir` is set, either in conf.py or through the
+# DOCS_LATEX_CACHE environment variable, the final .aux, .toc and .out
+# files are kept there, keyed by a hash of the LaTeX input. When the
+# input has not changed since, they are restored before the first pass,
+# which is then usually the only one.
+#
+# The extension is disabled unless `latex_driver_command` is set to the
+# LaTeX binary to run, in conf.py or through the DOCS_LATEX_COMMAND
+# environment variable.
+
+import hashlib
+import os
+import shutil
+import subprocess
+import time
+
+from sphinx.errors import ExtensionError
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+# The files passed from one pass to the next.
+STATE_EXTENSIONS = ['.aux', '.toc', '.out']
+
+# Files written by LaTeX that are not part of the input.
+OUTPUT_EXTENSIONS = STATE_EXTENSIONS + ['.log', '.pdf', '.idx', '.ilg', '.ind', '.fls', '.synctex.gz']
+
+def file_hash(filename):
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def input_hash(outdir, command, args):
+    """A hash of everything in `outdir` that LaTeX reads, and of how it is
+    run."""
+    h = hashlib.sha256()
+    h.update(repr((os.path.basename(command), args)).encode('utf-8'))
+    for root, dirs, names in os.walk(outdir):
+        # Skip the doctrees, which LaTeX does not read.
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(names):
+            if name.endswith(tuple(OUTPUT_EXTENSIONS)):
+                continue
+            filename = os.path.join(root, name)
+            h.update(os.path.relpath(filename, outdir).encode('utf-8'))
+            h.update(b'\0')
+            h.update(file_hash(filename).encode('ascii'))
+    return h.hexdigest()
+
+def state_files(outdir, basename):
+    return [os.path.join(outdir, basename + ext) for ext in STATE_EXTENSIONS]
+
+def state_hash(files):
+    return tuple(file_hash(f) if os.path.isfile(f) else None for f in files)
+
+def restore_state(cache_entry, files):
+    if not os.path.isdir(cache_entry):
+        return False
+    for f in files:
+        cached = os.path.join(cache_entry, os.path.basename(f))
+        if os.path.isfile(cached):
+            shutil.copy2(cached, f)
+    return True
+
+def save_state(cache_entry, files):
+    staging = cache_entry + '.tmp-%d' % os.getpid()
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for f in files:
+        if os.path.isfile(f):
+            shutil.copy2(f, staging)
+    shutil.rmtree(cache_entry, ignore_errors=True)
+    os.rename(staging, cache_entry)
+
+def run_latex(outdir, texfile, config):
+    command = os.path.abspath(config.latex_driver_command)
+    args = list(config.latex_driver_args)
+    basename = os.path.splitext(texfile)[0]
+    files = state_files(outdir, basename)
+
+    cache_entry = None
+    restored = False
+    if config.latex_driver_cache_dir:
+        key = input_hash(outdir, command, args)
+        cache_entry = os.path.join(os.path.abspath(config.latex_driver_cache_dir), basename + '-' + key)
+        restored = restore_state(cache_entry, files)
+
+    timings = []
+    before = state_hash(files)
+    converged = False
+    while len(timings) < config.latex_driver_max_passes:
+        start = time.time()
+        result = subprocess.run([command] + args + [texfile], cwd=outdir,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        timings.append(time.time() - start)
+        if result.returncode != 0:
+            logger.info(result.stdout.decode('utf-8', 'replace'))
+            raise ExtensionError('%s failed on %s in pass %d, see %s.log' % (
+                os.path.basename(command), texfile, len(timings), basename))
+        logger.info('latex: %s pass %d took %.1fs', texfile, len(timings), timings[-1])
+        after = state_hash(files)
+        if after == before:
+            converged = True
+            break
+        before = after
+
+    if not converged:
+        logger.warning('latex: %s did not converge after %d passes', texfile, len(timings))
+    logger.info('latex: %s built in %d pass(es), %.1fs in total%s', texfile, len(timings),
+                sum(timings), ' (restored .aux state from cache)' if restored else '')
+    if cache_entry is not None and converged:
+        save_state(cache_entry, files)
+
+def build_pdf(app, exception):
+    config = app.config
+    if exception is not None or app.builder.name != 'latex' or not config.latex_driver_command:
+        return
+    for document in config.latex_documents:
+        run_latex(app.outdir, document[1], config)
+
+def setup(app):
+    app.add_config_value('latex_driver_command', os.environ.get('DOCS_LATEX_COMMAND'), '')
+    app.add_config_value('latex_driver_args', ['-halt-on-error', '-interaction=batchmode'], '')
+    app.add_config_value('latex_driver_max_passes', 5, '')
+    app.add_config_value('latex_driver_cache_dir', os.environ.get('DOCS_LATEX_CACHE'), '')
+    app.connect('build-finished', build_pdf)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,146 @@
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# A per-build cache of the files included with `literalinclude`.
+#
+# Many of the Daml files in the docs are included dozens of times, each
+# time with different start-after/end-before markers. Sphinx reads,
+# decodes and splits the file again for every directive and then scans
+# it line by line for the markers. This extension replaces Sphinx's
+# LiteralIncludeReader with one that
+#
+# - reads every file once (per encoding and tab width) and hands out
+#   copies of its lines; a file is read again when its mtime or size
+#   changes, which matters for long running processes such as the live
+#   preview; large files are memory-mapped and decoded from the mapping,
+#   which saves a copy of their bytes, and
+# - indexes the lines on which each marker occurs the first time the
+#   marker is looked up in a file, so the start and end of every later
+#   selection with the same marker are found without a scan.
+#
+# The selected lines are exactly the ones Sphinx would select; when a
+# marker is missing, or `pyobject` has already narrowed the lines down,
+# Sphinx's own filters run and report errors as usual. The directive
+# itself is unchanged, so included files are still recorded as
+# dependencies of the including document.
+
+import bisect
+import codecs
+import mmap
+import multiprocessing
+import os
+
+from sphinx.directives import code
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+# Shared with forked parallel readers, so that their reads are counted
+# as well.
+includes = multiprocessing.Value('i', 0)
+reads = multiprocessing.Value('i', 0)
+
+class IncludedFile(object):
+    def __init__(self, lines, stat):
+        self.lines = lines
+        self.stat = stat
+        self.occurrences = {}
+
+    def find(self, marker, start):
+        """The first line at or after `start` containing `marker`, or
+        None."""
+        occurrences = self.occurrences.get(marker)
+        if occurrences is None:
+            occurrences = [i for i, line in enumerate(self.lines) if marker in line]
+            self.occurrences[marker] = occurrences
+        i = bisect.bisect_left(occurrences, start)
+        return occurrences[i] if i < len(occurrences) else None
+
+# Files of at least this many bytes are memory-mapped.
+MMAP_THRESHOLD = 1 << 20
+
+_files = {}
+
+def read_text(filename, encoding, size):
+    if size < MMAP_THRESHOLD:
+        with codecs.open(filename, 'r', encoding, errors='strict') as f:
+            return f.read()
+    with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return str(mapped, encoding, 'strict')
+
+def included_file(filename, encoding, tab_width):
+    st = os.stat(filename)
+    stat = (st.st_mtime_ns, st.st_size)
+    key = (filename, encoding, tab_width)
+    entry = _files.get(key)
+    if entry is None or entry.stat != stat:
+        text = read_text(filename, encoding, st.st_size)
+        if tab_width is not None:
+            text = text.expandtabs(tab_width)
+        entry = _files[key] = IncludedFile(tuple(text.splitlines(True)), stat)
+        with reads.get_lock():
+            reads.value += 1
+    return entry
+
+class CachedLiteralIncludeReader(code.LiteralIncludeReader):
+    def read_file(self, filename, location=None):
+        try:
+            self.included = included_file(filename, self.encoding, self.options.get('tab-width'))
+        except (IOError, OSError, UnicodeError, ValueError):
+            # Let Sphinx report the error.
+            return super().read_file(filename, location)
+        with includes.get_lock():
+            includes.value += 1
+        self.offset = 0
+        self.selected = list(self.included.lines)
+        return self.selected
+
+    def start_filter(self, lines, location=None):
+        if 'start-at' in self.options:
+            start, inclusive = self.options['start-at'], False
+        elif 'start-after' in self.options:
+            start, inclusive = self.options['start-after'], True
+        else:
+            start = None
+        if not start or lines is not getattr(self, 'selected', None):
+            return super().start_filter(lines, location)
+        lineno = self.included.find(start, 0)
+        if lineno is None:
+            return super().start_filter(lines, location)
+        if inclusive:
+            lineno += 1
+        if 'lineno-match' in self.options:
+            self.lineno_start += lineno
+        self.offset = lineno
+        self.selected = lines[lineno:]
+        return self.selected
+
+    def end_filter(self, lines, location=None):
+        if 'end-at' in self.options:
+            end, inclusive = self.options['end-at'], True
+        elif 'end-before' in self.options:
+            end, inclusive = self.options['end-before'], False
+        else:
+            end = None
+        if not end or lines is not getattr(self, 'selected', None):
+            return super().end_filter(lines, location)
+        lineno = self.included.find(end, self.offset)
+        if lineno is None:
+            return super().end_filter(lines, location)
+        lineno -= self.offset
+        return lines[:lineno + 1] if inclusive else lines[:lineno]
+
+def report_stats(app, exception):
+    if includes.value:
+        logger.info('literalinclude cache: %d includes served from %d file reads',
+                    includes.value, reads.value)
+
+def setup(app):
+    code.LiteralIncludeReader = CachedLiteralIncludeReader
+    app.connect('build-finished', report_stats)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
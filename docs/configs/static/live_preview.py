@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Serves a live preview of the html docs.
+#
+# Sphinx runs in this process and keeps its environment in memory between
+# builds. The source directory is polled for changes; on every change,
+# Sphinx reads the changed documents again and writes them together with
+# the documents that refer to their labels, terms or titles (Sphinx
+# itself only writes the documents it read). The references of every
+# document are recorded while it is read and kept in the environment, so
+# a restart of the preview is incremental as well.
+#
+# Pages are served with a small script that listens for finished builds
+# on a server-sent events channel and reloads the page. Changes to the
+# configuration (conf.py and the extensions) restart the whole process,
+# after which the open pages reload too.
+#
+# Usage: live_preview.py source-dir conf-dir out-dir [--watch dir ...]
+
+import argparse
+import functools
+import os
+import sys
+import threading
+import time
+import traceback
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from sphinx import addnodes
+from sphinx.application import Sphinx
+from sphinx.util import docname_join, logging
+
+logger = logging.getLogger(__name__)
+
+EVENTS_PATH = '/_preview/events'
+
+RELOAD_SCRIPT = b'''<script>
+(function () {
+  var build = null;
+  new EventSource('%s').onmessage = function (e) {
+    if (build !== null && build !== e.data) { location.reload(); }
+    build = e.data;
+  };
+})();
+</script>
+''' % EVENTS_PATH.encode('ascii')
+
+# Reference tracking
+
+def defined_keys(env, docname):
+    """The keys under which other documents can refer to `docname`."""
+    std = env.get_domain('std')
+    keys = {('doc', docname)}
+    for name, (doc, _, _) in std.data['labels'].items():
+        if doc == docname:
+            keys.add(('ref', name))
+    for name, (doc, _) in std.data['anonlabels'].items():
+        if doc == docname:
+            keys.add(('ref', name))
+    for (objtype, name), (doc, _) in std.data['objects'].items():
+        if doc == docname:
+            keys.add((objtype, name.lower()))
+    return keys
+
+def referenced_keys(docname, doctree):
+    keys = set()
+    for node in doctree.traverse(addnodes.pending_xref):
+        if node.get('refdomain') != 'std':
+            continue
+        reftype = node['reftype']
+        target = node['reftarget']
+        if reftype == 'doc':
+            keys.add(('doc', docname_join(docname, target)))
+        elif reftype == 'numref':
+            keys.add(('ref', target.lower()))
+        else:
+            keys.add((reftype, target.lower()))
+    return keys
+
+def purge_doc(app, env, docname):
+    # Called before the document is cleared from the domains, so this is
+    # the last chance to see what it defined.
+    app.preview_purged.add(docname)
+    app.preview_keys |= defined_keys(env, docname)
+    env.preview_references.pop(docname, None)
+
+def record_references(app, doctree):
+    env = app.env
+    env.preview_references[env.docname] = referenced_keys(env.docname, doctree)
+
+def merge_references(app, env, docnames, other):
+    for docname in docnames:
+        env.preview_references[docname] = other.preview_references[docname]
+
+def referencing_docs(app, env):
+    keys = app.preview_keys
+    for docname in app.preview_purged & set(env.all_docs):
+        keys |= defined_keys(env, docname)
+    docnames = {docname for docname, refs in env.preview_references.items() if refs & keys}
+    docnames -= app.preview_purged
+    app.preview_purged = set()
+    app.preview_keys = set()
+    if docnames:
+        logger.info('live preview: %d referencing document(s) to write', len(docnames))
+    return sorted(docnames)
+
+def track_references(app):
+    app.preview_purged = set()
+    app.preview_keys = set()
+    app.connect('env-purge-doc', purge_doc)
+    app.connect('doctree-read', record_references)
+    app.connect('env-merge-info', merge_references)
+    app.connect('env-get-updated', referencing_docs)
+
+# Server
+
+class BuildState(object):
+    """The id of the last successful build, which the open pages compare
+    with the one they were loaded with."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.started = int(time.time() * 1000)
+        self.builds = 0
+
+    @property
+    def build_id(self):
+        return '%d-%d' % (self.started, self.builds)
+
+    def finished(self):
+        with self.condition:
+            self.builds += 1
+            self.condition.notify_all()
+
+    def wait(self, build_id, timeout):
+        with self.condition:
+            self.condition.wait_for(lambda: self.build_id != build_id, timeout)
+            return self.build_id
+
+class PreviewHandler(SimpleHTTPRequestHandler):
+    def __init__(self, *args, state, **kwargs):
+        self.state = state
+        super().__init__(*args, **kwargs)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url_path = self.path.split('?', 1)[0].split('#', 1)[0]
+        if url_path == EVENTS_PATH:
+            self.send_events()
+            return
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and url_path.endswith('/'):
+            path = os.path.join(path, 'index.html')
+        if path.endswith('.html') and os.path.isfile(path):
+            self.send_page(path)
+        else:
+            super().do_GET()
+
+    def send_page(self, path):
+        with open(path, 'rb') as f:
+            page = f.read()
+        if b'</body>' in page:
+            page = page.replace(b'</body>', RELOAD_SCRIPT + b'</body>', 1)
+        else:
+            page += RELOAD_SCRIPT
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(page)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(page)
+
+    def send_events(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        sent = None
+        while True:
+            build_id = self.state.wait(sent, timeout=15)
+            message = ': keep-alive\n\n' if build_id == sent else 'data: %s\n\n' % build_id
+            sent = build_id
+            try:
+                self.wfile.write(message.encode('ascii'))
+                self.wfile.flush()
+            except OSError:
+                return
+
+def serve(out_dir, host, port, state):
+    handler = functools.partial(PreviewHandler, directory=out_dir, state=state)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+# Watching and building
+
+def snapshot(directories, exclude):
+    """The mtimes of all files below `directories`, skipping hidden files,
+    backup files and everything below `exclude`."""
+    mtimes = {}
+    for directory in directories:
+        for root, dirs, names in os.walk(directory):
+            dirs[:] = [d for d in dirs
+                       if not d.startswith('.') and os.path.join(root, d) != exclude]
+            for name in names:
+                if name.startswith('.') or name.endswith('~'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    mtimes[path] = os.stat(path).st_mtime_ns
+                except OSError:
+                    pass
+    return mtimes
+
+def make_app(args, freshenv=False):
+    return Sphinx(args.source_dir, args.conf_dir, args.out_dir, args.doctree_dir, 'html',
+                  confoverrides=dict(args.define), status=sys.stdout, warning=sys.stderr,
+                  freshenv=freshenv, parallel=args.jobs)
+
+def build(app, state):
+    start = time.time()
+    try:
+        app.build()
+    except Exception:
+        traceback.print_exc()
+        print('live preview: build failed after %.2fs' % (time.time() - start))
+        return
+    state.finished()
+    print('live preview: built in %.2fs' % (time.time() - start))
+
+def define(value):
+    name, sep, val = value.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError('expected name=value, got %r' % value)
+    return name, val
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a live preview of the docs.')
+    parser.add_argument('source_dir')
+    parser.add_argument('conf_dir')
+    parser.add_argument('out_dir')
+    parser.add_argument('--doctree-dir')
+    parser.add_argument('--watch', action='append', default=[],
+                        help='restart when files below this directory change (default: conf-dir)')
+    parser.add_argument('-D', dest='define', type=define, action='append', default=[])
+    parser.add_argument('-j', '--jobs', type=int, default=0)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--interval', type=float, default=0.3)
+    args = parser.parse_args()
+    for name in ['source_dir', 'conf_dir', 'out_dir']:
+        setattr(args, name, os.path.abspath(getattr(args, name)))
+    args.doctree_dir = os.path.abspath(args.doctree_dir or os.path.join(args.out_dir, '.doctrees'))
+    watched = [os.path.abspath(d) for d in args.watch or [args.conf_dir]]
+
+    app = make_app(args)
+    if not hasattr(app.env, 'preview_references'):
+        if app.env.all_docs:
+            # The references of the documents read before are unknown.
+            app = make_app(args, freshenv=True)
+        app.env.preview_references = {}
+    track_references(app)
+
+    sources = snapshot([args.source_dir], args.out_dir)
+    configs = snapshot(watched, args.out_dir)
+    state = BuildState()
+    build(app, state)
+    server = serve(args.out_dir, args.host, args.port, state)
+    print('live preview: serving on http://%s:%d/' % (args.host, args.port))
+
+    try:
+        while True:
+            time.sleep(args.interval)
+            if snapshot(watched, args.out_dir) != configs:
+                print('live preview: configuration changed, restarting')
+                server.server_close()
+                os.execv(sys.executable, [sys.executable] + sys.argv)
+            current = snapshot([args.source_dir], args.out_dir)
+            if current != sources:
+                sources = current
+                build(app, state)
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Builds the PDF from the documents read by the html build.
+#
+# The html and the PDF docs are built from the same sources, so reading
+# them twice (parsing the rst, highlighting the code, running all
+# transforms) is wasted work. When `pdf_build_confdir` is set, this
+# extension forks the html build once all documents have been read and
+# the environment is consistent, and runs the latex builder in the child
+# with the configuration in `pdf_build_confdir` (configs/pdf), while the
+# parent goes on writing the html pages. Forking at that point, rather
+# than running a second sphinx-build on the saved environment afterwards,
+# lets the PDF be written at the same time as the html pages.
+#
+# The child works in `pdf_build_dir`:
+#
+# - source/ holds hard links to the html sources, except for index.rst,
+#   which is the one from `pdf_build_confdir`; being newer than the
+#   environment, it is the only document read again,
+# - doctrees/ is a copy of the html doctrees, with the environment of
+#   the html build pointed at source/,
+# - latex/ gets the output; fonts and the like go there beforehand.
+#
+# Sphinx reads everything again when the configuration used for reading
+# changes. The PDF configuration excludes the license pages and loads
+# other extensions, none of which changes how documents are read (they
+# are listed in `pdf_build_neutral_extensions`). When these are the only
+# differences, the environment is used as it is: the excluded documents
+# are removed by Sphinx and the documents whose toctrees include them are
+# read again. The environment is not used either if its version differs
+# (Sphinx and extensions such as intersphinx add to it, so both builds
+# must load the same ones), and both configurations take rst_prolog from
+# prolog.py. For any other difference, the child reads all documents
+# itself, which is as slow as a separate build but correct, and the html
+# build warns about it.
+#
+# The status output of the PDF build goes to `sphinx-build.log` in
+# `pdf_build_dir`; its warnings go to stderr. The html build waits for the
+# PDF build at the end and fails if it failed.
+
+import os
+import pickle
+import shutil
+import signal
+import sys
+import time
+import traceback
+
+from sphinx.application import ENV_PICKLE_FILENAME, Sphinx
+from sphinx.environment import CONFIG_NEW, CONFIG_OK
+from sphinx.errors import SphinxError
+from sphinx.util import logging
+
+from doctree_cache import copy_tree
+
+logger = logging.getLogger(__name__)
+
+LOG_FILENAME = 'sphinx-build.log'
+
+# Extensions that only act on writing, or on the output of the builders,
+# so documents read with or without them are the same. autodoc would
+# matter, but none of our sources use its directives. subprojects and
+# split_pages only change the documents when sub-projects or pages to
+# split are configured, which docs-html-and-pdf does not do.
+NEUTRAL_EXTENSIONS = [
+    'check_closing_quotes',
+    'doctree_cache',
+    'image_converter',
+    'latex_driver',
+    'literalinclude_cache',
+    'pdf_build',
+    'postprocess',
+    'profiling',
+    'redirects',
+    'reproducible',
+    'search_shards',
+    'sitemap',
+    'sphinx.ext.autodoc',
+    'sphinx_copybutton',
+    'split_pages',
+    'subprojects',
+    'warning_gate',
+]
+
+# Configuration values used for reading that may differ: the excluded
+# documents are handled below, and suppressed warnings do not change the
+# documents.
+TOLERATED_CONFIG_VALUES = ['exclude_patterns', 'suppress_warnings']
+
+class PdfBuildError(SphinxError):
+    category = 'PDF build error'
+
+def link_tree(src, dst):
+    """Mirrors `src` in `dst` with hard links, or copies where linking is
+    not possible."""
+    for root, dirs, files in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target, exist_ok=True)
+        for name in files:
+            source = os.path.join(root, name)
+            try:
+                os.link(source, os.path.join(target, name))
+            except OSError:
+                shutil.copy2(source, os.path.join(target, name))
+
+def config_differences(html_config, pdf_config):
+    """The names of the configuration values used for reading that differ
+    between the html and the PDF configuration, with the extensions
+    counted separately."""
+    names = sorted(item.name for item in pdf_config.filter('env')
+                   if item.name in html_config and html_config[item.name] != item.value)
+    extensions = sorted(set(html_config.extensions) ^ set(pdf_config.extensions))
+    return names, extensions
+
+def reread_including(app, builder, added, changed, removed):
+    # The toctrees of the documents read by the html build still include
+    # the documents excluded from the PDF. (Sphinx 1.8 passes the builder
+    # rather than the environment.)
+    return [docname for docname, included in app.env.toctree_includes.items()
+            if docname not in removed and removed.intersection(included)]
+
+def reuse_environment(pdf_app, html_config):
+    """Makes the PDF build use the documents read by the html build.
+    Returns why it cannot, or None."""
+    env = pdf_app.env
+    if env.config_status == CONFIG_NEW:
+        # Sphinx could not load the environment and started a new one.
+        return 'the environment of the html build cannot be loaded'
+    if env.config_status == CONFIG_OK:
+        return None
+    names, extensions = config_differences(html_config, pdf_app.config)
+    unexpected = [name for name in names if name not in TOLERATED_CONFIG_VALUES]
+    unexpected += [name for name in extensions if name not in html_config.pdf_build_neutral_extensions]
+    if unexpected:
+        return 'the configurations differ in %s' % ', '.join(unexpected)
+    env.config_status = CONFIG_OK
+    pdf_app.connect('env-get-outdated', reread_including)
+    return None
+
+def build_pdf(html_app, log, fallback):
+    config = html_app.config
+    build_dir = os.path.abspath(config.pdf_build_dir)
+    confdir = os.path.abspath(config.pdf_build_confdir)
+    srcdir = os.path.join(build_dir, 'source')
+    doctreedir = os.path.join(build_dir, 'doctrees')
+    outdir = os.path.join(build_dir, 'latex')
+
+    shutil.rmtree(srcdir, ignore_errors=True)
+    link_tree(html_app.srcdir, srcdir)
+    os.remove(os.path.join(srcdir, 'index.rst'))
+    shutil.copyfile(os.path.join(confdir, 'index.rst'), os.path.join(srcdir, 'index.rst'))
+
+    shutil.rmtree(doctreedir, ignore_errors=True)
+    copy_tree(html_app.doctreedir, doctreedir)
+    # This is a forked copy of the environment of the html build, so it
+    # can be changed freely.
+    env = html_app.env
+    env.srcdir = srcdir
+    with open(os.path.join(doctreedir, ENV_PICKLE_FILENAME), 'wb') as f:
+        pickle.dump(env, f, pickle.HIGHEST_PROTOCOL)
+
+    # The directives and roles of the html build are still registered with
+    # docutils, so Sphinx warns about registering them again.
+    overrides = {'suppress_warnings': ['app.add_directive', 'app.add_role']}
+    app = Sphinx(srcdir, confdir, outdir, doctreedir, 'latex', confoverrides=overrides,
+                 status=log, warning=sys.stderr, parallel=html_app.parallel)
+    reason = reuse_environment(app, config)
+    if reason is None:
+        logger.info('pdf build: reusing %d documents read by the html build', len(app.env.all_docs))
+    else:
+        logger.info('pdf build: reading all documents again, as %s', reason)
+        fallback.write(reason)
+    fallback.close()
+    app.build()
+    return app.statuscode
+
+def start_pdf_build(app, env):
+    if not app.config.pdf_build_confdir or getattr(app, 'pdf_build', None) is not None:
+        return
+    if not app.config.pdf_build_dir:
+        raise PdfBuildError('pdf_build_dir must be set along with pdf_build_confdir')
+    os.makedirs(app.config.pdf_build_dir, exist_ok=True)
+    log_file = os.path.join(os.path.abspath(app.config.pdf_build_dir), LOG_FILENAME)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    # The child tells why it reads all documents again, if it does,
+    # through a pipe, so that the html build can warn about it.
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            os.close(read_fd)
+            with open(log_file, 'w') as log, os.fdopen(write_fd, 'w') as fallback:
+                status = build_pdf(app, log, fallback)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+    os.close(write_fd)
+    app.pdf_build = (pid, log_file, read_fd, time.time())
+    logger.info('pdf build: started in process %d, logging to %s', pid, log_file)
+
+def finish_pdf_build(app, exception):
+    if not app.config.pdf_build_confdir:
+        return
+    if getattr(app, 'pdf_build', None) is None:
+        if exception is not None:
+            return
+        # Nothing was read, so the consistency check did not run.
+        start_pdf_build(app, app.env)
+    pid, log_file, read_fd, start = app.pdf_build
+    app.pdf_build = None
+    if exception is not None:
+        os.close(read_fd)
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+        return
+    logger.info('pdf build: waiting for process %d', pid)
+    with os.fdopen(read_fd) as fallback:
+        reason = fallback.read()
+    if reason:
+        logger.warning('pdf build: the PDF build reads all documents again, as %s (see %s)', reason, log_file)
+    _, status = os.waitpid(pid, 0)
+    status = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    if status != 0:
+        with open(log_file) as f:
+            tail = f.readlines()[-20:]
+        raise PdfBuildError('the PDF build failed (status %d), see %s:\n%s'
+                            % (status, log_file, ''.join(tail)))
+    logger.info('pdf build: finished in %.1fs', time.time() - start)
+
+def setup(app):
+    app.add_config_value('pdf_build_confdir', os.environ.get('DOCS_PDF_CONFDIR'), '')
+    app.add_config_value('pdf_build_dir', os.environ.get('DOCS_PDF_BUILD_DIR'), '')
+    app.add_config_value('pdf_build_neutral_extensions', NEUTRAL_EXTENSIONS, '')
+    app.connect('env-check-consistency', start_pdf_build)
+    app.connect('build-finished', finish_pdf_build)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Post-processes the html output for serving.
+#
+# The steps, any of which can be left out, are
+#
+# - minify: html pages lose their comments and runs of whitespace outside
+#   of <pre>, <textarea>, <script> and <style>; stylesheets lose their
+#   comments and the whitespace around punctuation; scripts lose their
+#   comment lines, blank lines and indentation. Only what never changes
+#   the meaning is removed (lines of scripts stay lines, so automatic
+#   semicolons are not an issue; scripts with template literals and
+#   files named *.min.* are left as they are).
+# - fingerprint: the stylesheets and scripts matching
+#   `postprocess_fingerprint_patterns` (those in _static, i.e. the theme
+#   and Sphinx assets) are renamed to name.<hash>.ext, with the hash of
+#   their content, and the references to them in pages, stylesheets and
+#   scripts are rewritten, so that they can be cached for a long time.
+#   References are recognised as paths ending in the name of an asset,
+#   relative to the referencing file or to _static; paths built at run
+#   time are not seen, so assets must be referenced literally.
+# - compress: text files of at least COMPRESS_MIN_SIZE bytes get a .gz
+#   sibling (without a timestamp, so it is reproducible), for servers
+#   that serve precompressed files. Files matching
+#   `postprocess_compress_exclude` are left out: the sitemaps are
+#   patched after the build.
+#
+# The files are processed by a pool of `postprocess_jobs` processes (one
+# per CPU by default), with the assets minified and fingerprinted before
+# the pages that refer to them. The bytes saved by every step and the
+# time taken are logged at the end.
+#
+# As a Sphinx extension, this runs at the end of the html build with the
+# steps in `postprocess`, a comma-separated list that is empty by
+# default (and can be set through DOCS_POSTPROCESS). It has to come after
+# the extensions that write files at the end of the build (`redirects`,
+# `sitemap`, `search_shards`) in the list of extensions.
+#
+# Usage: postprocess.py site-dir [--steps minify,fingerprint,compress] [-j JOBS]
+
+import argparse
+import fnmatch
+import gzip
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import time
+
+from sphinx.errors import SphinxError
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+STEPS = ['minify', 'fingerprint', 'compress']
+
+FINGERPRINT_PATTERNS = ['_static/*.css', '_static/*.js']
+
+COMPRESS_EXCLUDE = ['sitemap*.xml']
+
+COMPRESSED_SUFFIXES = ('.html', '.css', '.js', '.json', '.svg', '.xml', '.txt', '.ttf', '.eot')
+
+# Smaller files fit in a packet either way.
+COMPRESS_MIN_SIZE = 1024
+
+HASH_LENGTH = 10
+
+_fingerprinted = re.compile(r'\.[0-9a-f]{%d}\.(css|js)$' % HASH_LENGTH)
+
+class PostprocessError(SphinxError):
+    category = 'Post-processing error'
+
+# Minification
+
+_html_token = re.compile(r'(<!--.*?-->)|(<(pre|textarea|script|style)\b.*?</\3\s*>)|([ \t\r\n\f]+)',
+                         re.S | re.I)
+
+def _html_replace(m):
+    comment, _, _, space = m.groups()
+    if comment is not None:
+        # Conditional comments are markup for old browsers.
+        return comment if comment.startswith(('<!--[', '<!--<!')) else ''
+    if space is not None:
+        return '\n' if '\n' in space else ' '
+    return m.group(0)
+
+def minify_html(text):
+    return _html_token.sub(_html_replace, text)
+
+_css_token = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(/\*.*?\*/)|([ \t\r\n\f]+)''', re.S)
+
+def minify_css(text):
+    out = []
+    pos = 0
+    for m in _css_token.finditer(text):
+        if m.start() > pos:
+            out.append(text[pos:m.start()])
+        pos = m.end()
+        string, comment, space = m.groups()
+        if string is not None:
+            out.append(string)
+        elif comment is not None:
+            if comment.startswith('/*!'):
+                out.append(comment)
+        else:
+            before = out[-1][-1] if out else ''
+            after = text[m.end():m.end() + 1]
+            # A space before a colon may be a descendant combinator, and
+            # around + and - it may be needed in calc().
+            if before and after and before not in '{};,>(:' and after not in '{};,>)!':
+                out.append(' ')
+    out.append(text[pos:])
+    return ''.join(out).replace(';}', '}')
+
+def minify_js(text):
+    # Template literals may span lines, which the line-based stripping
+    # below would change.
+    if '`' in text:
+        return text
+    out = []
+    in_comment = False
+    continued = False
+    for line in text.split('\n'):
+        if continued:
+            # A string continued with a backslash.
+            out.append(line)
+            continued = line.endswith('\\')
+            continue
+        stripped = line.strip()
+        if in_comment:
+            if '*/' in stripped:
+                in_comment = False
+                stripped = stripped.split('*/', 1)[1].strip()
+            else:
+                continue
+        elif stripped.startswith('/*') and not stripped.startswith('/*!'):
+            if '*/' not in stripped[2:]:
+                in_comment = True
+                continue
+            stripped = stripped[2:].split('*/', 1)[1].strip()
+        if not stripped or stripped.startswith('//'):
+            continue
+        out.append(stripped)
+        continued = stripped.endswith('\\')
+    # Keep the end as it is: Sphinx reads searchindex.js back in later
+    # builds, and does not expect a newline there.
+    return '\n'.join(out) + ('\n' if text.endswith('\n') else '')
+
+MINIFIERS = {
+    '.html': minify_html,
+    '.css': minify_css,
+    '.js': minify_js,
+}
+
+def minifier(rel):
+    name = os.path.basename(rel)
+    if '.min.' in name:
+        return None
+    return MINIFIERS.get(os.path.splitext(name)[1])
+
+# Fingerprinting
+
+_reference = re.compile(r'[\w./-]*\.(?:css|js)(?![\w-])')
+
+def resolve(reference, rel):
+    """The path of a referenced file relative to the site, for a reference
+    in the file at `rel`."""
+    if '_static/' in reference:
+        return '_static/' + reference.split('_static/', 1)[1]
+    if reference.startswith('/'):
+        return reference.lstrip('/')
+    return os.path.normpath(os.path.join(os.path.dirname(rel), reference)).replace(os.sep, '/')
+
+def rewrite_references(text, rel, renamed):
+    """`text` with the references to assets in `renamed` (which maps their
+    paths to their new names) rewritten."""
+    def replace(m):
+        reference = m.group(0)
+        name = renamed.get(resolve(reference, rel))
+        if name is None:
+            return reference
+        return reference[:len(reference) - len(os.path.basename(reference))] + name
+    return _reference.sub(replace, text)
+
+def references(text, rel, assets):
+    return {path for path in (resolve(m.group(0), rel) for m in _reference.finditer(text)) if path in assets}
+
+def fingerprint(site_dir, assets):
+    """Renames `assets` (paths relative to `site_dir`) after their content,
+    once the assets they refer to are renamed. Returns the new names."""
+    contents = {}
+    for rel in assets:
+        with open(os.path.join(site_dir, rel), encoding='utf-8') as f:
+            contents[rel] = f.read()
+    renamed = {}
+    visiting = set()
+    def visit(rel):
+        if rel in renamed:
+            return
+        if rel in visiting:
+            raise PostprocessError('cannot fingerprint %s, it refers to itself through other assets' % rel)
+        visiting.add(rel)
+        for dependency in sorted(references(contents[rel], rel, contents) - {rel}):
+            visit(dependency)
+        text = rewrite_references(contents[rel], rel, renamed)
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()[:HASH_LENGTH]
+        stem, ext = os.path.splitext(os.path.basename(rel))
+        name = '%s.%s%s' % (stem, digest, ext)
+        with open(os.path.join(site_dir, os.path.dirname(rel), name), 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.remove(os.path.join(site_dir, rel))
+        renamed[rel] = name
+        visiting.discard(rel)
+    for rel in sorted(contents):
+        visit(rel)
+    return renamed
+
+# Compression
+
+def compress(path, data):
+    """Writes the .gz sibling of `path`, if that is smaller. Returns its
+    size, or None."""
+    gz_path = path + '.gz'
+    buf = io.BytesIO()
+    with gzip.GzipFile(filename='', mode='wb', compresslevel=9, fileobj=buf, mtime=0) as f:
+        f.write(data)
+    if buf.tell() >= len(data):
+        if os.path.exists(gz_path):
+            os.remove(gz_path)
+        return None
+    with open(gz_path, 'wb') as f:
+        f.write(buf.getvalue())
+    return buf.tell()
+
+# Processing
+
+_site_dir = None
+_steps = None
+_renamed = None
+_compress_exclude = None
+
+def _init_worker(site_dir, steps, renamed, compress_exclude):
+    global _site_dir, _steps, _renamed, _compress_exclude
+    _site_dir, _steps, _renamed, _compress_exclude = site_dir, steps, renamed, compress_exclude
+
+def _process_file(job):
+    """Minifies, rewrites and compresses a file, as far as asked for.
+    Returns (rel, size before, size after minifying, compressed size)."""
+    rel, minify, rewrite, compress_file = job
+    path = os.path.join(_site_dir, rel)
+    with open(path, 'rb') as f:
+        data = f.read()
+    size = len(data)
+    if minify or rewrite:
+        try:
+            text = data.decode('utf-8')
+        except UnicodeDecodeError:
+            # Not ours (e.g. old Javadoc), leave it alone.
+            minify = rewrite = False
+    if minify or rewrite:
+        if rewrite:
+            text = rewrite_references(text, rel, _renamed)
+        if minify:
+            text = minifier(rel)(text)
+        new_data = text.encode('utf-8')
+        if new_data != data:
+            # Replace rather than write to the file, it may be hard linked.
+            os.remove(path)
+            with open(path, 'wb') as f:
+                f.write(new_data)
+            data = new_data
+    compressed = compress(path, data) if compress_file else None
+    return rel, size, len(data), compressed
+
+def find_files(site_dir):
+    files = []
+    for root, dirs, names in os.walk(site_dir):
+        # Not served: .doctrees, when it is kept in the output directory.
+        dirs[:] = sorted(name for name in dirs if not name.startswith('.'))
+        rel = os.path.relpath(root, site_dir).replace(os.sep, '/')
+        prefix = '' if rel == '.' else rel + '/'
+        files.extend(prefix + name for name in sorted(names) if not name.endswith('.gz'))
+    return files
+
+def matches(rel, patterns):
+    return any(fnmatch.fnmatch(rel, pattern) for pattern in patterns)
+
+def postprocess(site_dir, steps, jobs=None, fingerprint_patterns=FINGERPRINT_PATTERNS,
+                compress_exclude=COMPRESS_EXCLUDE):
+    """Runs `steps` on the files in `site_dir`. Returns the statistics of
+    every step."""
+    unknown = [step for step in steps if step not in STEPS]
+    if unknown:
+        raise PostprocessError('unknown post-processing steps %s, expected some of %s'
+                               % (', '.join(unknown), ', '.join(STEPS)))
+    files = find_files(site_dir)
+    assets = []
+    if 'fingerprint' in steps:
+        assets = [rel for rel in files
+                  if matches(rel, fingerprint_patterns) and not _fingerprinted.search(rel)]
+    asset_set = set(assets)
+    minify = 'minify' in steps
+    stats = {'minified': 0, 'minify_saved': 0, 'fingerprinted': 0, 'compressed': 0,
+             'compress_before': 0, 'compress_after': 0}
+
+    def account(results):
+        for rel, size, minified_size, compressed in results:
+            if minified_size < size:
+                stats['minified'] += 1
+                stats['minify_saved'] += size - minified_size
+            if compressed is not None:
+                stats['compressed'] += 1
+                stats['compress_before'] += minified_size
+                stats['compress_after'] += compressed
+
+    def compressible(rel):
+        return 'compress' in steps and rel.endswith(COMPRESSED_SUFFIXES) and not matches(rel, compress_exclude) \
+            and os.path.getsize(os.path.join(site_dir, rel)) >= COMPRESS_MIN_SIZE
+
+    if minify and assets:
+        # The assets are minified before they are hashed.
+        with multiprocessing.Pool(jobs, _init_worker, (site_dir, steps, {}, compress_exclude)) as pool:
+            account(pool.map(_process_file, [(rel, True, False, False) for rel in assets if minifier(rel)]))
+    renamed = fingerprint(site_dir, assets) if assets else {}
+    stats['fingerprinted'] = len(renamed)
+
+    jobs_list = []
+    for rel in files:
+        if rel in asset_set:
+            rel = os.path.join(os.path.dirname(rel), renamed[rel]).replace(os.sep, '/')
+            jobs_list.append((rel, False, False, compressible(rel)))
+            continue
+        text_file = rel.endswith(tuple(MINIFIERS))
+        jobs_list.append((rel, minify and text_file and minifier(rel) is not None,
+                          bool(renamed) and text_file, compressible(rel)))
+    jobs_list = [job for job in jobs_list if any(job[1:])]
+    with multiprocessing.Pool(jobs, _init_worker, (site_dir, steps, renamed, compress_exclude)) as pool:
+        account(pool.imap_unordered(_process_file, jobs_list, chunksize=16))
+    return stats
+
+def report(stats, elapsed):
+    return ('minified %d files (%.1f KiB saved), fingerprinted %d assets, compressed %d files '
+            '(%.1f KiB to %.1f KiB, %.1f KiB saved) in %.1fs' % (
+                stats['minified'], stats['minify_saved'] / 1024, stats['fingerprinted'],
+                stats['compressed'], stats['compress_before'] / 1024, stats['compress_after'] / 1024,
+                (stats['compress_before'] - stats['compress_after']) / 1024, elapsed))
+
+def main():
+    parser = argparse.ArgumentParser(description='Minify, fingerprint and compress a built site.')
+    parser.add_argument('site_dir')
+    parser.add_argument('--steps', default=','.join(STEPS),
+                        help='comma-separated list of the steps to run, of %s' % ', '.join(STEPS))
+    parser.add_argument('-j', '--jobs', type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.time()
+    stats = postprocess(args.site_dir, [step for step in args.steps.split(',') if step], args.jobs)
+    print('postprocess: ' + report(stats, time.time() - start))
+
+# Sphinx extension
+
+def postprocess_site(app, exception):
+    steps = [step for step in app.config.postprocess if step]
+    if exception is not None or app.builder.format != 'html' or not steps:
+        return
+    start = time.time()
+    stats = postprocess(app.outdir, steps, app.config.postprocess_jobs,
+                        app.config.postprocess_fingerprint_patterns, app.config.postprocess_compress_exclude)
+    logger.info('postprocess: ' + report(stats, time.time() - start))
+
+def setup(app):
+    app.add_config_value('postprocess', [step for step in os.environ.get('DOCS_POSTPROCESS', '').split(',') if step], '')
+    app.add_config_value('postprocess_jobs', None, '')
+    app.add_config_value('postprocess_fingerprint_patterns', FINGERPRINT_PATTERNS, '')
+    app.add_config_value('postprocess_compress_exclude', COMPRESS_EXCLUDE, '')
+    app.connect('build-finished', postprocess_site)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
+
+if __name__ == '__main__':
+    main()
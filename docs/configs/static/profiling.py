@@ -0,0 +1,295 @@
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Profiles the docs build.
+#
+# Records, per document, the wall time and the growth of the resident set
+# size of reading, resolving and writing it; per event handler (e.g. the
+# list item labelling of more_named_targets), the number of calls and the
+# time spent in it; and per code block, the lexer and the time it took to
+# highlight, which includes the blocks taken from highlight_cache, and
+# the part of it spent in Pygments, which does not.
+#
+# With parallel builds, part of the work happens in forked processes,
+# which do not report back to the main process. Every process therefore
+# appends its measurements to its own file in a temporary directory after
+# every document; the main process adds them up at the end of the build,
+# writes the JSON report to `profiling_report` and logs the slowest
+# documents, handlers, lexers and code blocks (`profiling_top` of each).
+#
+# The extension is disabled unless `profiling_report` is set, either in
+# conf.py or through the DOCS_PROFILE environment variable.
+
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+
+from sphinx import highlighting
+from sphinx.environment import BuildEnvironment
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+PHASES = ['read', 'resolve', 'write']
+
+def rss_kib():
+    """The current resident set size, or the peak one where the current
+    one is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize() // 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+class Recorder(object):
+    """Collects the measurements of one build. Measurements are kept in
+    memory until `flush` appends them to the file of the current
+    process."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.reset()
+
+    def reset(self):
+        self.phases = []
+        self.handlers = defaultdict(lambda: [0, 0.0, 0.0, None])
+        self.blocks = []
+
+    def phase(self, docname, phase, seconds, rss):
+        self.phases.append([docname, phase, seconds, rss])
+
+    def handler(self, name, seconds, docname):
+        stats = self.handlers[name]
+        stats[0] += 1
+        stats[1] += seconds
+        if seconds > stats[2]:
+            stats[2] = seconds
+            stats[3] = docname
+
+    def block(self, lexer, location, chars, seconds, pygments_seconds):
+        self.blocks.append([lexer, location, chars, seconds, pygments_seconds])
+
+    def flush(self):
+        if not (self.phases or self.handlers or self.blocks):
+            return
+        record = {'phases': self.phases, 'handlers': self.handlers, 'blocks': self.blocks}
+        with open(os.path.join(self.directory, '%d.jsonl' % os.getpid()), 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        self.reset()
+
+def timed_phase(recorder, phase, method):
+    def timed(docname, *args, **kwargs):
+        _current['docname'] = docname
+        rss = rss_kib()
+        start = time.perf_counter()
+        try:
+            return method(docname, *args, **kwargs)
+        finally:
+            recorder.phase(docname, phase, time.perf_counter() - start, rss_kib() - rss)
+            recorder.flush()
+    return timed
+
+def timed_handler(recorder, name, callback):
+    def timed(*args):
+        start = time.perf_counter()
+        try:
+            return callback(*args)
+        finally:
+            recorder.handler(name, time.perf_counter() - start, _current['docname'])
+    timed.profiled = callback
+    return timed
+
+def handler_name(event, callback):
+    name = getattr(callback, '__qualname__', None) or repr(callback)
+    return '%s: %s.%s' % (event, getattr(callback, '__module__', '?'), name)
+
+# Patched into Sphinx once; they report to the recorder of the running
+# application, if any.
+
+_current = {'recorder': None, 'docname': None, 'lexer': None, 'pygments_seconds': 0.0}
+
+def _forked():
+    # The measurements taken before the fork are flushed by the parent.
+    if _current['recorder'] is not None:
+        _current['recorder'].reset()
+
+os.register_at_fork(after_in_child=_forked)
+
+def _resolve(get_and_resolve_doctree):
+    def timed(self, docname, *args, **kwargs):
+        recorder = _current['recorder']
+        if recorder is None:
+            return get_and_resolve_doctree(self, docname, *args, **kwargs)
+        return timed_phase(recorder, 'resolve',
+                           lambda d: get_and_resolve_doctree(self, d, *args, **kwargs))(docname)
+    timed.profiled = get_and_resolve_doctree
+    return timed
+
+# This wraps highlight_cache, if it is used, so the blocks it returns
+# from its cache are timed as well; `_highlight` only sees the others.
+def _highlight_block(highlight_block):
+    def timed(self, source, lang, opts=None, location=None, *args, **kwargs):
+        recorder = _current['recorder']
+        if recorder is None:
+            return highlight_block(self, source, lang, opts, location, *args, **kwargs)
+        _current['lexer'] = None
+        _current['pygments_seconds'] = 0.0
+        start = time.perf_counter()
+        try:
+            return highlight_block(self, source, lang, opts, location, *args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            lexer = _current['lexer']
+            pygments_seconds = _current['pygments_seconds']
+            if lexer is None:
+                # Taken from the cache.
+                lexer = type(highlighting.lexers[lang]).__name__ if lang in highlighting.lexers else lang
+                pygments_seconds = None
+            if isinstance(location, tuple):
+                location = '%s:%s' % location
+            elif location is not None:
+                location = str(location)
+            recorder.block(lexer, location, len(source), seconds, pygments_seconds)
+    timed.profiled = highlight_block
+    return timed
+
+def _highlight(highlight):
+    def timed(code, lexer, formatter, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return highlight(code, lexer, formatter, *args, **kwargs)
+        finally:
+            _current['lexer'] = type(lexer).__name__
+            _current['pygments_seconds'] += time.perf_counter() - start
+    timed.profiled = highlight
+    return timed
+
+def install_patches():
+    if not hasattr(BuildEnvironment.get_and_resolve_doctree, 'profiled'):
+        BuildEnvironment.get_and_resolve_doctree = _resolve(BuildEnvironment.get_and_resolve_doctree)
+    bridge = highlighting.PygmentsBridge
+    if not hasattr(bridge.highlight_block, 'profiled'):
+        bridge.highlight_block = _highlight_block(bridge.highlight_block)
+    if not hasattr(highlighting.highlight, 'profiled'):
+        highlighting.highlight = _highlight(highlighting.highlight)
+
+# Report
+
+def collect(directory):
+    documents = defaultdict(dict)
+    handlers = defaultdict(lambda: {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'max_document': None})
+    blocks = []
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name)) as f:
+            for line in f:
+                record = json.loads(line)
+                for docname, phase, seconds, rss in record['phases']:
+                    doc = documents[docname]
+                    doc[phase] = doc.get(phase, 0.0) + seconds
+                    doc[phase + '_rss_kib'] = doc.get(phase + '_rss_kib', 0) + rss
+                for handler, (calls, seconds, max_seconds, max_document) in record['handlers'].items():
+                    stats = handlers[handler]
+                    stats['calls'] += calls
+                    stats['seconds'] += seconds
+                    if max_seconds > stats['max_seconds']:
+                        stats['max_seconds'] = max_seconds
+                        stats['max_document'] = max_document
+                blocks.extend({'lexer': lexer, 'location': location, 'chars': chars, 'seconds': seconds,
+                               'pygments_seconds': pygments_seconds or 0.0, 'cached': pygments_seconds is None}
+                              for lexer, location, chars, seconds, pygments_seconds in record['blocks'])
+    for doc in documents.values():
+        doc['total'] = sum(doc.get(phase, 0.0) for phase in PHASES)
+    lexers = defaultdict(lambda: {'blocks': 0, 'cached_blocks': 0, 'chars': 0, 'seconds': 0.0,
+                                  'pygments_seconds': 0.0})
+    for block in blocks:
+        stats = lexers[block['lexer']]
+        stats['blocks'] += 1
+        stats['cached_blocks'] += block['cached']
+        stats['chars'] += block['chars']
+        stats['seconds'] += block['seconds']
+        stats['pygments_seconds'] += block['pygments_seconds']
+    blocks.sort(key=lambda b: -b['seconds'])
+    return {
+        'documents': dict(documents),
+        'handlers': dict(handlers),
+        'lexers': dict(lexers),
+        'code_blocks': blocks,
+    }
+
+def log_summary(report, top):
+    logger.info('profile: %s build took %.1fs', report['builder'], report['seconds'])
+    documents = sorted(report['documents'].items(), key=lambda d: -d[1]['total'])[:top]
+    logger.info('profile: slowest documents (read / resolve / write):')
+    for docname, doc in documents:
+        logger.info('  %7.3fs  %s (%s)', doc['total'], docname,
+                    ' / '.join('%.3fs' % doc.get(phase, 0.0) for phase in PHASES))
+    handlers = sorted(report['handlers'].items(), key=lambda h: -h[1]['seconds'])[:top]
+    logger.info('profile: slowest event handlers:')
+    for name, stats in handlers:
+        logger.info('  %7.3fs  %s (%d calls)', stats['seconds'], name, stats['calls'])
+    logger.info('profile: lexers (highlighting / in Pygments):')
+    for name, stats in sorted(report['lexers'].items(), key=lambda l: -l[1]['seconds']):
+        logger.info('  %7.3fs / %7.3fs  %s (%d blocks, %d from the cache, %d chars)',
+                    stats['seconds'], stats['pygments_seconds'], name, stats['blocks'],
+                    stats['cached_blocks'], stats['chars'])
+    logger.info('profile: slowest code blocks:')
+    for block in report['code_blocks'][:top]:
+        logger.info('  %7.3fs  %s (%s, %d chars%s)', block['seconds'], block['location'], block['lexer'],
+                    block['chars'], ', from the cache' if block['cached'] else '')
+
+# Sphinx extension
+
+def start_profiling(app):
+    if not app.config.profiling_report:
+        app.profiler = None
+        return
+    recorder = Recorder(tempfile.mkdtemp(prefix='docs-profile-'))
+    app.profiler = recorder
+    app.profiling_start = time.perf_counter()
+    install_patches()
+    _current['recorder'] = recorder
+
+    builder = app.builder
+    builder.read_doc = timed_phase(recorder, 'read', builder.read_doc)
+    builder.write_doc_serialized = timed_phase(recorder, 'write', builder.write_doc_serialized)
+    builder.write_doc = timed_phase(recorder, 'write', builder.write_doc)
+
+    for event, listeners in app.events.listeners.items():
+        for listener_id, callback in listeners.items():
+            if event not in ('builder-inited', 'build-finished') and not hasattr(callback, 'profiled'):
+                listeners[listener_id] = timed_handler(recorder, handler_name(event, callback), callback)
+
+def write_report(app, exception):
+    recorder = app.profiler
+    if recorder is None:
+        return
+    _current['recorder'] = None
+    recorder.flush()
+    try:
+        report = collect(recorder.directory)
+    finally:
+        shutil.rmtree(recorder.directory, ignore_errors=True)
+    report['builder'] = app.builder.name
+    report['seconds'] = time.perf_counter() - app.profiling_start
+    filename = os.path.abspath(app.config.profiling_report)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, 'w') as f:
+        json.dump(report, f, indent=1, sort_keys=True)
+    log_summary(report, app.config.profiling_top)
+    logger.info('profile: report written to %s', filename)
+
+def setup(app):
+    app.add_config_value('profiling_report', os.environ.get('DOCS_PROFILE'), '')
+    app.add_config_value('profiling_top', 10, '')
+    app.connect('builder-inited', start_profiling)
+    app.connect('build-finished', write_report)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,18 @@
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# The rst_prolog of the html and the PDF configurations.
+#
+# Sphinx reads all documents again when rst_prolog changes, so the two
+# configurations share it: pdf_build.py only builds the PDF off the
+# documents read by the html build if it is the same in both.
+
+PROLOG = """
+.. _installer: https://github.com/digital-asset/daml/releases/download/v{release}/daml-sdk-{release}-windows.exe
+.. _Artifactory: https://digitalasset.jfrog.io/ui/repos/tree/General/sdk-ee
+.. _protobufs: https://github.com/digital-asset/daml/releases/download/v{release}/protobufs-{release}.zip
+.. _api-test-tool: https://repo1.maven.org/maven2/com/daml/ledger-api-test-tool/{release}/ledger-api-test-tool-{release}.jar
+"""
+
+def rst_prolog(release):
+    return PROLOG.format(release = release)
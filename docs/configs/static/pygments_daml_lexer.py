@@ -1,26 +1,244 @@
 # Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
 # SPDX-License-Identifier: Apache-2.0
 
+# A lexer for Daml.
+#
+# The rules are those of Pygments' HaskellLexer, plus the Daml keywords.
+# The token types of whitespace and of the gap in a string changed across
+# versions of Pygments, so those are taken from the HaskellLexer that is
+# installed, to give the same tokens as it does.
+# Rather than trying every rule in turn at every position, the rules of
+# each state are compiled into a single regular expression, and the rule
+# that matched is found from the index of its group. Keywords are not
+# part of the rules: every identifier is matched once and then looked up
+# in a table of reserved words.
+
+import re
+
+from pygments import unistring as uni
+from pygments.lexer import Lexer
 from pygments.lexers.haskell import HaskellLexer
-from pygments.lexer import inherit
 from pygments.token import *
+from pygments.token import _TokenType
+
+__all__ = ['DAMLLexer']
+
+SYMBOL = r'[:!#$%&*+.\\/<=>?@^|~-]'
+
+DAML_RESERVED = ('template', 'with', 'controller', 'can', 'ensure', 'daml', 'observer', 'signatory', 'agreement', 'nonconsuming', 'return', 'this')
+
+HASKELL_RESERVED = ('case', 'class', 'data', 'default', 'deriving', 'do', 'else',
+                    'family', 'if', 'in', 'infix', 'infixl', 'infixr', 'instance',
+                    'let', 'newtype', 'of', 'then', 'type', 'where', '_')
+
+ASCII = ('NUL', 'SOH', '[SE]TX', 'EOT', 'ENQ', 'ACK',
+         'BEL', 'BS', 'HT', 'LF', 'VT', 'FF', 'CR', 'S[OI]', 'DLE',
+         'DC[1-4]', 'NAK', 'SYN', 'ETB', 'CAN',
+         'EM', 'SUB', 'ESC', '[FGRU]S', 'SP', 'DEL')
+
+# Identifiers with a meaning of their own, as (token, state to push).
+# They only count as such if they do not continue a preceding word.
+RESERVED = dict(
+    [(word, (Keyword.Reserved, None)) for word in DAML_RESERVED + HASKELL_RESERVED] +
+    [('True', (Keyword.Constant, None)),
+     ('False', (Keyword.Constant, None)),
+     ('error', (Name.Exception, None)),
+     ('import', (Keyword.Reserved, 'import')),
+     ('module', (Keyword.Reserved, 'module'))])
+
+# `Text` up to Pygments 2.9, `Whitespace` since.
+WHITESPACE = next(rule[1] for rule in HaskellLexer.tokens['root'] if rule[0] == r'\s+')
+
+# A gap, `\` whitespace `\`, after the first backslash: a single escape up
+# to Pygments 2.9, whitespace and an escape since.
+STRING_GAP = HaskellLexer.tokens['escape'][-1]
+if callable(STRING_GAP[1]):
+    STRING_GAP = (r'(\s+)(\\)', (WHITESPACE, String.Escape), '#pop')
 
-class DAMLLexer(HaskellLexer):
+_word_char = re.compile(r'\w').match
+
+def word_start(text, pos):
+    return pos == 0 or not _word_char(text, pos - 1)
+
+def lower_identifier(text, pos, word):
+    if word_start(text, pos) and word in RESERVED:
+        return RESERVED[word]
+    if pos == 0 or text[pos - 1] == '\n':
+        return Name.Function, None
+    return Name, None
+
+def upper_identifier(text, pos, word):
+    if word_start(text, pos) and word in RESERVED:
+        return RESERVED[word]
+    return Keyword.Type, None
+
+# Each rule is (regex, action[, new state]), where the action is a token
+# type, a tuple of token types for the groups of the regex, a dict from the
+# matched text to (token type, new state), or a function from (text, pos,
+# matched text) to (token type, new state). Rules are tried in order.
+TOKENS = {
+    'root': [
+        (r'\s+', WHITESPACE),
+        (r'--(?![!#$%&*+./<=>?@^|_~:\\]).*?$', Comment.Single),
+        (r'\{-', Comment.Multiline, 'comment'),
+        # `True'` and friends: these words end at the quote, unlike keywords
+        (r"(?<!\w)(?:True|False|error|import|module)(?=')", RESERVED),
+        (r"[_" + uni.Ll + r"][\w']*", lower_identifier),
+        (r"[" + uni.Lu + r"][\w']*", upper_identifier),
+        (r"'[^\\]'", String.Char),  # this has to come before the TH quote
+        (r"'[_" + uni.Ll + r"][\w']*", Name),
+        (r"''[" + uni.Lu + r"][\w']*", Keyword.Type),
+        # promoted constructors, tuples, lists and type operators
+        (r"'(?:[" + uni.Lu + r"][\w']*|\[[^\]]*\]|\([^)]*\)|" + SYMBOL + r"+)", Keyword.Type),
+        (r'≡', Operator),
+        (r'\\(?!' + SYMBOL + r'+)', Name.Function),  # lambda operator
+        (r'(?:<-|::|->|=>|=)(?!' + SYMBOL + r'+)', Operator.Word),
+        (r':' + SYMBOL + r'*', Keyword.Type),  # constructor operators
+        (SYMBOL + r'+', Operator),
+        (r'0[xX]_*[\da-fA-F](_*[\da-fA-F])*_*[pP][+-]?\d(_*\d)*', Number.Float),
+        (r'0[xX]_*[\da-fA-F](_*[\da-fA-F])*\.[\da-fA-F](_*[\da-fA-F])*'
+         r'(_*[pP][+-]?\d(_*\d)*)?', Number.Float),
+        (r'\d(_*\d)*_*[eE][+-]?\d(_*\d)*', Number.Float),
+        (r'\d(_*\d)*\.\d(_*\d)*(_*[eE][+-]?\d(_*\d)*)?', Number.Float),
+        (r'0[bB]_*[01](_*[01])*', Number.Bin),
+        (r'0[oO]_*[0-7](_*[0-7])*', Number.Oct),
+        (r'0[xX]_*[\da-fA-F](_*[\da-fA-F])*', Number.Hex),
+        (r'\d(_*\d)*', Number.Integer),
+        (r"'", String.Char, 'character'),
+        (r'"', String, 'string'),
+        (r'\[\]', Keyword.Type),
+        (r'\(\)', Name.Builtin),
+        (r'[][(),;`{}]', Punctuation),
+    ],
+    'import': [
+        (r'\s+', WHITESPACE),
+        (r'"', String, 'string'),
+        (r'\)', Punctuation, '#pop'),
+        (r'qualified\b', Keyword),
+        (r'([' + uni.Lu + r'][\w.]*)(\s+)(as)(\s+)([' + uni.Lu + r'][\w.]*)',
+         (Name.Namespace, WHITESPACE, Keyword, WHITESPACE, Name), '#pop'),
+        (r'([' + uni.Lu + r'][\w.]*)(\s+)(hiding)(\s+)(\()',
+         (Name.Namespace, WHITESPACE, Keyword, WHITESPACE, Punctuation), 'funclist'),
+        (r'([' + uni.Lu + r'][\w.]*)(\s+)(\()',
+         (Name.Namespace, WHITESPACE, Punctuation), 'funclist'),
+        (r'[\w.]+', Name.Namespace, '#pop'),
+    ],
+    'module': [
+        (r'\s+', WHITESPACE),
+        (r'([' + uni.Lu + r'][\w.]*)(\s+)(\()',
+         (Name.Namespace, WHITESPACE, Punctuation), 'funclist'),
+        (r'[' + uni.Lu + r'][\w.]*', Name.Namespace, '#pop'),
+    ],
+    'funclist': [
+        (r'\s+', WHITESPACE),
+        (r'[' + uni.Lu + r']\w*', Keyword.Type),
+        (r'(?:_[\w\']+|[' + uni.Ll + r'][\w\']*)', Name.Function),
+        (r'--(?![!#$%&*+./<=>?@^|_~:\\]).*?$', Comment.Single),
+        (r'\{-', Comment.Multiline, 'comment'),
+        (r',', Punctuation),
+        (SYMBOL + r'+', Operator),
+        # one for the parenthesis, one for the `#pop:2` that closes it
+        (r'\(', Punctuation, ('funclist', 'funclist')),
+        (r'\)', Punctuation, '#pop:2'),
+    ],
+    'comment': [
+        (r'[^-{}]+', Comment.Multiline),
+        (r'\{-', Comment.Multiline, 'comment'),
+        (r'-\}', Comment.Multiline, '#pop'),
+        (r'[-{}]', Comment.Multiline),
+    ],
+    'character': [
+        (r"[^\\']'", String.Char, '#pop'),
+        (r"\\", String.Escape, 'escape'),
+        ("'", String.Char, '#pop'),
+    ],
+    'string': [
+        (r'[^\\"]+', String),
+        (r"\\", String.Escape, 'escape'),
+        ('"', String, '#pop'),
+    ],
+    'escape': [
+        (r'[abfnrtv"\'&\\]', String.Escape, '#pop'),
+        (r'\^[][' + uni.Lu + r'@^_]', String.Escape, '#pop'),
+        ('|'.join(ASCII), String.Escape, '#pop'),
+        (r'o[0-7]+', String.Escape, '#pop'),
+        (r'x[\da-fA-F]+', String.Escape, '#pop'),
+        (r'\d+', String.Escape, '#pop'),
+        STRING_GAP,
+    ],
+}
+
+def compile_state(rules):
+    """Compiles the rules of a state into a single regex. Returns its match
+    function and a list mapping the index of the group of each rule to
+    (index, action, new state)."""
+    parts = []
+    actions = [None]
+    for rule in rules:
+        regex, action = rule[:2]
+        new_state = rule[2] if len(rule) > 2 else None
+        if isinstance(new_state, str):
+            if new_state.startswith('#pop'):
+                new_state = -int(new_state[5:] or 1)
+            else:
+                new_state = (new_state,)
+        parts.append('(%s)' % regex)
+        index = len(actions)
+        actions.append((index, action, new_state))
+        actions.extend([None] * re.compile(regex, re.MULTILINE).groups)
+    return re.compile('|'.join(parts), re.MULTILINE).match, actions
+
+STATES = {name: compile_state(rules) for name, rules in TOKENS.items()}
+
+class DAMLLexer(Lexer):
 
     name = 'Daml'
     aliases = ['daml']
     filenames = ['*.daml']
 
-    daml_reserved = ('template', 'with', 'controller', 'can', 'ensure', 'daml', 'observer', 'signatory', 'agreement', 'controller', 'nonconsuming', 'return', 'this')
-
-    tokens = {
-        'root': [
-            (r'\b(%s)(?!\')\b' % '|'.join(daml_reserved), Keyword.Reserved),
-            (r'\b(True|False)\b', Keyword.Constant),
-            (r'≡', Operator),
-            inherit
-        ]
-    }
-
+    def get_tokens_unprocessed(self, text):
+        pos = 0
+        stack = ['root']
+        match, actions = STATES['root']
+        while True:
+            m = match(text, pos)
+            if m is None:
+                if pos >= len(text):
+                    break
+                if text[pos] == '\n':
+                    # at the end of a line, reset to the root state
+                    stack = ['root']
+                    match, actions = STATES['root']
+                    yield pos, WHITESPACE, '\n'
+                else:
+                    yield pos, Error, text[pos]
+                pos += 1
+                continue
 
+            index, action, new_state = actions[m.lastindex]
+            if type(action) is _TokenType:
+                yield pos, action, m.group()
+            elif type(action) is tuple:
+                for group, token in enumerate(action, index + 1):
+                    yield m.start(group), token, m.group(group)
+            elif type(action) is dict:
+                token, new_state = action[m.group()]
+                if new_state is not None:
+                    new_state = (new_state,)
+                yield pos, token, m.group()
+            else:
+                token, new_state = action(text, pos, m.group())
+                if new_state is not None:
+                    new_state = (new_state,)
+                yield pos, token, m.group()
+            pos = m.end()
 
+            if new_state is not None:
+                if type(new_state) is int:
+                    if -new_state >= len(stack):
+                        del stack[1:]
+                    else:
+                        del stack[new_state:]
+                else:
+                    stack.extend(new_state)
+                match, actions = STATES[stack[-1]]
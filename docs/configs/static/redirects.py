@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Writes the redirect pages listed in docs/redirects.map.
+#
+# Every line of the map of the form `from -> to` yields a page at `from`
+# that redirects to `to`, made from the redirect template by replacing
+# __URL__. Lines without a target are ignored. Relative targets are
+# resolved against the directory of the page, like the browser does.
+#
+# Before anything is written, every target is checked against the pages
+# of the site: the build fails if a target does not exist (a dangling
+# redirect) or is itself redirected (a chained redirect, which should
+# point to the final page instead). Redirects from pages that exist are
+# not written.
+#
+# As a Sphinx extension, this runs at the end of the html build when
+# `redirects_map` and `redirects_template` are set, and reports problems
+# as warnings. Stand-alone, it works on an already built site, or, as
+# //docs:redirects, before the site is built: the pages of the sources
+# in a manifest (see docs/scripts/stage_sources.py) and those listed in
+# a file count as existing, and the site directory only gets the
+# redirects. Sphinx is not needed then.
+#
+# Usage: redirects.py redirects.map redirect_template.html site-dir
+#            [--sources source-manifest.json] [--pages pages.txt]
+
+import argparse
+import json
+import os
+import posixpath
+import sys
+
+try:
+    from sphinx.util import logging
+except ImportError:
+    import logging
+
+logger = logging.getLogger(__name__)
+
+class Redirect(object):
+    def __init__(self, lineno, source, target):
+        self.lineno = lineno
+        self.source = source
+        self.target = target
+
+    def target_page(self):
+        """The page the target points to, relative to the root of the
+        site, or None for external targets."""
+        if '://' in self.target:
+            return None
+        path = self.target.split('#', 1)[0].split('?', 1)[0]
+        if path.startswith('/'):
+            path = path[1:]
+        else:
+            path = posixpath.join(posixpath.dirname(self.source), path)
+        if path == '' or path.endswith('/'):
+            path += 'index.html'
+        return posixpath.normpath(path)
+
+def parse_map(filename):
+    redirects = []
+    with open(filename, encoding='utf-8') as f:
+        for lineno, line in enumerate(f, 1):
+            source, sep, target = line.strip().partition(' -> ')
+            if sep and target:
+                redirects.append(Redirect(lineno, source, target))
+    return redirects
+
+def find_pages(site_dir):
+    pages = set()
+    for root, _, names in os.walk(site_dir):
+        rel = os.path.relpath(root, site_dir)
+        for name in names:
+            if name.endswith('.html'):
+                pages.add(posixpath.normpath(posixpath.join(rel.replace(os.sep, '/'), name)))
+    return pages
+
+# The pages Sphinx writes besides those of the sources.
+SPHINX_PAGES = ['genindex.html', 'search.html']
+
+def source_pages(manifest_file):
+    """The pages that the html build makes of the sources in a manifest."""
+    with open(manifest_file, encoding='utf-8') as f:
+        files = json.load(f)['files']
+    pages = set(SPHINX_PAGES)
+    for dest in files:
+        if dest.startswith('source/') and dest.endswith('.rst'):
+            pages.add(dest[len('source/'):-len('.rst')] + '.html')
+    return pages
+
+def listed_pages(filename):
+    with open(filename, encoding='utf-8') as f:
+        return {posixpath.normpath(line.strip()) for line in f if line.strip().endswith('.html')}
+
+def check_redirects(redirects, pages):
+    """Returns a list of (redirect, message) for every dangling, chained or
+    conflicting redirect."""
+    errors = []
+    by_source = {}
+    for r in redirects:
+        first = by_source.setdefault(r.source, r)
+        if first.target != r.target:
+            errors.append((r, 'conflicts with line %d (%s)' % (first.lineno, first.target)))
+    for r in redirects:
+        page = r.target_page()
+        if page is None or page in pages:
+            continue
+        if page in by_source:
+            errors.append((r, 'chained redirect: %s redirects to %s' % (page, by_source[page].target)))
+        else:
+            errors.append((r, 'dangling redirect: %s does not exist' % page))
+    return errors
+
+def render(template, redirect):
+    return template.replace('__URL__', redirect.target)
+
+def write_redirects(redirects, template, site_dir, pages):
+    """Writes the redirect pages that do not clash with existing pages.
+    Returns the number of pages written."""
+    written = set()
+    for r in redirects:
+        if r.source in pages or r.source in written:
+            continue
+        filename = os.path.join(site_dir, *r.source.split('/'))
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(render(template, r))
+        written.add(r.source)
+    return len(written)
+
+def previous_redirects(redirects, template, site_dir, pages):
+    """The redirect pages left in `site_dir` by an earlier run."""
+    previous = set()
+    for r in redirects:
+        if r.source in pages:
+            with open(os.path.join(site_dir, *r.source.split('/')), encoding='utf-8') as f:
+                if f.read() == render(template, r):
+                    previous.add(r.source)
+    return previous
+
+def build_redirects(map_file, template_file, site_dir, other_pages=()):
+    """Checks and writes all redirects, counting `other_pages` as pages of
+    the site. Returns the list of errors and the number of pages written;
+    nothing is written if there are errors."""
+    redirects = parse_map(map_file)
+    with open(template_file, encoding='utf-8') as f:
+        template = f.read()
+    pages = find_pages(site_dir)
+    pages -= previous_redirects(redirects, template, site_dir, pages)
+    pages |= set(other_pages)
+    errors = check_redirects(redirects, pages)
+    if errors:
+        return errors, 0
+    return [], write_redirects(redirects, template, site_dir, pages)
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the redirect pages of the docs.')
+    parser.add_argument('map')
+    parser.add_argument('template')
+    parser.add_argument('site_dir')
+    parser.add_argument('--sources', help='count the pages of the sources in this manifest as existing')
+    parser.add_argument('--pages', help='count the pages listed in this file as existing')
+    args = parser.parse_args()
+
+    other_pages = set()
+    if args.sources:
+        other_pages |= source_pages(args.sources)
+    if args.pages:
+        other_pages |= listed_pages(args.pages)
+    os.makedirs(args.site_dir, exist_ok=True)
+    errors, written = build_redirects(args.map, args.template, args.site_dir, other_pages)
+    for r, message in errors:
+        print('%s:%d: %s -> %s: %s' % (args.map, r.lineno, r.source, r.target, message))
+    if errors:
+        print('ERROR: %d invalid redirect(s), see above.' % len(errors))
+        sys.exit(1)
+    print('%d redirects written to %s' % (written, args.site_dir))
+
+# Sphinx extension
+
+def write_html_redirects(app, exception):
+    config = app.config
+    if exception is not None or app.builder.format != 'html' or not config.redirects_map:
+        return
+    errors, written = build_redirects(config.redirects_map, config.redirects_template, app.outdir)
+    for r, message in errors:
+        logger.warning('%s -> %s: %s', r.source, r.target, message,
+                       location='%s:%d' % (os.path.abspath(config.redirects_map), r.lineno))
+    if not errors:
+        logger.info('redirects: %d pages written', written)
+
+def setup(app):
+    app.add_config_value('redirects_map', None, '')
+    app.add_config_value('redirects_template', None, '')
+    app.connect('build-finished', write_html_redirects)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Makes the output of the docs builds reproducible.
+#
+# Bazel only reuses the outputs of the docs rules (and of everything that
+# depends on them) from the remote cache if they are byte for byte the
+# same. Most of what Sphinx writes is, but not everything:
+#
+# - the tables of the domains (labels, objects, ...) are in the order the
+#   documents were read in, which varies with parallel reads; they are
+#   sorted once all documents are read, after the labels of
+#   more_named_targets have been added,
+# - the object types of the search index are numbered in the order they
+#   were first seen, which for incremental builds depends on the index of
+#   the previous build; they are numbered in sorted order, for
+#   searchindex.js as well as for the sharded index (see search_shards.py),
+# - the copies of downloadable files go to a directory named after the
+#   hash of their absolute path, which is a different sandbox every time;
+#   they are keyed by their path relative to the source directory, which
+#   the html builder copies them from just as well,
+# - lualatex puts the time of the build into the PDF; SOURCE_DATE_EPOCH
+#   (unless set already) and FORCE_SOURCE_DATE pin it to `EPOCH`, and the
+#   date on the title page, which would be the same, is left out.
+#
+# .buildinfo and the doctrees are specific to a build as well; the Bazel
+# rules leave them out of the tarballs (except for //docs:doctrees, whose
+# doctree cache is written reproducibly, see doctree_cache.py), which are written by mktgz without
+# timestamps. The only stamped value, the release date in the sitemaps,
+# is filled in by //docs:docs from //docs:docs-version-date.
+#
+# This happens when `reproducible_build` is set (to 1, through
+# DOCS_REPRODUCIBLE or -D). docs/scripts/check-reproducible.sh builds a
+# docs target twice and compares the tarballs.
+
+import os
+
+from sphinx.util import DownloadFiles, logging
+
+logger = logging.getLogger(__name__)
+
+# The time the tarballs are stamped with (see bazel_tools/sh/mktgz.sh),
+# 2000-01-01 00:00 UTC.
+EPOCH = 946684800
+
+def sort_key(item):
+    # Some tables have tuples with None as keys.
+    return str(item[0])
+
+def sort_domain_data(app, env):
+    if not app.config.reproducible_build:
+        return
+    for data in env.domaindata.values():
+        for key, table in list(data.items()):
+            if isinstance(table, dict):
+                data[key] = dict(sorted(table.items(), key=sort_key))
+
+class RelativeDownloadFiles(DownloadFiles):
+    """Downloadable files by their path relative to `srcdir`."""
+
+    srcdir = None
+
+    def add_file(self, docname, filename):
+        # Merging the files of parallel reads adds them again by their key.
+        if os.path.isabs(filename):
+            filename = os.path.relpath(filename, self.srcdir)
+        return super().add_file(docname, filename)
+
+def relative_download_files(app, env, docnames):
+    if not app.config.reproducible_build:
+        return
+    if not isinstance(env.dlfiles, RelativeDownloadFiles):
+        dlfiles = RelativeDownloadFiles()
+        dlfiles.update(env.dlfiles)
+        env.dlfiles = dlfiles
+    env.dlfiles.srcdir = env.srcdir
+
+def canonical_index(index):
+    """A frozen search index with the object types numbered in the order
+    of their names."""
+    objtypes = index['objtypes']
+    renumber = {old: new for new, old in enumerate(sorted(objtypes, key=objtypes.get))}
+    index = dict(index)
+    index['objects'] = {
+        prefix: {name: (entry[0], renumber[entry[1]]) + tuple(entry[2:]) for name, entry in sorted(objects.items())}
+        for prefix, objects in sorted(index['objects'].items())
+    }
+    index['objtypes'] = {renumber[old]: name for old, name in objtypes.items()}
+    index['objnames'] = {renumber[old]: names for old, names in index['objnames'].items()}
+    return index
+
+def canonical_search_index(app, *args):
+    # The index is frozen when searchindex.js is written, after the
+    # additional pages are collected.
+    indexer = getattr(app.builder, 'indexer', None)
+    if not app.config.reproducible_build or indexer is None or 'freeze' in vars(indexer):
+        return []
+    freeze = indexer.freeze
+    indexer.freeze = lambda: canonical_index(freeze())
+    return []
+
+def pin_dates(app, config):
+    if not config.reproducible_build:
+        return
+    os.environ.setdefault('SOURCE_DATE_EPOCH', str(EPOCH))
+    os.environ.setdefault('FORCE_SOURCE_DATE', '1')
+    config.latex_elements.setdefault('date', '')
+
+def setup(app):
+    app.add_config_value('reproducible_build', int(os.environ.get('DOCS_REPRODUCIBLE', '0')), '')
+    app.connect('config-inited', pin_dates)
+    app.connect('env-before-read-docs', relative_download_files)
+    app.connect('env-updated', sort_domain_data)
+    app.connect('html-collect-pages', canonical_search_index)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,111 @@
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Writes the full-text search index in shards.
+#
+# Sphinx writes one searchindex.js with the terms of all documents, which
+# the search page has to download and parse before it can show a single
+# result; with the generated API docs, that is most of the index. This
+# extension writes the same index to `search_shards_dir` (_search) in
+# the output directory as
+#
+# - manifest.json: everything but the terms (the document names, titles
+#   and objects, which are needed to show any result) and the list of
+#   shards, and
+# - shards/<key>.json: the terms and title terms whose first
+#   `search_shards_prefix_length` characters are the shard key, in hex as
+#   in the API search index (see docs/scripts/hoogle_index.py), but of the
+#   UTF-16 code units, which is what the browser sees.
+#
+# The search of da_theme (searchtools-da.js) loads the manifest and then
+# only the shards of the terms in the query. At the end of the build, the
+# sizes of both indexes are logged, with the data a one-word query needs
+# and the time it takes to parse it here, as an estimate of the time to
+# the first result.
+
+import json
+import os
+import statistics
+import time
+
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+def shard_key(term, prefix_length):
+    return term.encode('utf-16-be')[:2 * prefix_length].hex()
+
+def shard_index(index, prefix_length):
+    """(manifest, shards) of a frozen Sphinx search index."""
+    shards = {}
+    for field in ('terms', 'titleterms'):
+        for term, files in index[field].items():
+            shard = shards.setdefault(shard_key(term, prefix_length), {'terms': {}, 'titleterms': {}})
+            shard[field][term] = files
+    manifest = {key: value for key, value in index.items() if key not in ('terms', 'titleterms')}
+    manifest['prefixLength'] = prefix_length
+    manifest['shards'] = sorted(shards)
+    return manifest, shards
+
+def dumps(data):
+    return json.dumps(data, separators=(',', ':'), sort_keys=True, ensure_ascii=False).encode('utf-8')
+
+def parse_time(*blobs):
+    """The time it takes to parse the given JSON documents."""
+    start = time.perf_counter()
+    for blob in blobs:
+        json.loads(blob.decode('utf-8'))
+    return time.perf_counter() - start
+
+def write_shards(app, exception):
+    builder = app.builder
+    if exception is not None or builder.format != 'html' or not app.config.search_shards_dir \
+            or getattr(builder, 'indexer', None) is None:
+        return
+    index = builder.indexer.freeze()
+    manifest, shards = shard_index(index, app.config.search_shards_prefix_length)
+
+    directory = os.path.join(builder.outdir, app.config.search_shards_dir)
+    os.makedirs(os.path.join(directory, 'shards'), exist_ok=True)
+    for name in os.listdir(os.path.join(directory, 'shards')):
+        if name[:-len('.json')] not in shards:
+            os.remove(os.path.join(directory, 'shards', name))
+    sizes = {}
+    blobs = {}
+    for key, shard in shards.items():
+        blob = blobs[key] = dumps(shard)
+        sizes[key] = len(blob)
+        with open(os.path.join(directory, 'shards', key + '.json'), 'wb') as f:
+            f.write(blob)
+    manifest_blob = dumps(manifest)
+    with open(os.path.join(directory, 'manifest.json'), 'wb') as f:
+        f.write(manifest_blob)
+
+    full_blob = dumps(index)
+    full_size = os.path.getsize(os.path.join(builder.outdir, builder.searchindex_filename))
+    median_key = sorted(sizes, key=sizes.get)[len(sizes) // 2] if sizes else None
+    largest_key = max(sizes, key=sizes.get) if sizes else None
+    logger.info('search shards: %s is %.1f KiB; %d shards in %s, manifest %.1f KiB, shards %.1f KiB median, '
+                '%.1f KiB largest', builder.searchindex_filename, full_size / 1024, len(shards),
+                app.config.search_shards_dir, len(manifest_blob) / 1024,
+                statistics.median(sizes.values()) / 1024 if sizes else 0,
+                sizes[largest_key] / 1024 if sizes else 0)
+    if sizes:
+        # What a one-word query has to load before it shows a result.
+        typical = [manifest_blob, blobs[median_key]]
+        worst = [manifest_blob, blobs[largest_key]]
+        logger.info('search shards: first result of a one-word query after %.1f KiB (%.1f KiB at most) '
+                    'instead of %.1f KiB, parsed in %.1f ms (%.1f ms at most) instead of %.1f ms',
+                    sum(map(len, typical)) / 1024, sum(map(len, worst)) / 1024, full_size / 1024,
+                    parse_time(*typical) * 1000, parse_time(*worst) * 1000, parse_time(full_blob) * 1000)
+
+def setup(app):
+    app.add_config_value('search_shards_dir', '_search', 'html')
+    app.add_config_value('search_shards_prefix_length', 2, 'html')
+    app.connect('build-finished', write_shards)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Writes sitemap.xml for all .html pages of the site.
+#
+# The pages are those in the output directory at the end of the html
+# build, so pages copied in before Sphinx runs (Javadoc, TypeScript
+# docs, the cheat sheet) and the redirect pages are included as well.
+# For the latter, this extension has to come after `redirects` in the
+# list of extensions.
+#
+# A sitemap may hold at most 50,000 URLs and 50MB. Beyond that, the
+# URLs are split over sitemap-1.xml, sitemap-2.xml, ... and sitemap.xml
+# becomes a sitemap index pointing to them.
+#
+# As a Sphinx extension, this runs at the end of the html build when
+# `sitemap_base_url` is set; `sitemap_lastmod` is used as the lastmod
+# date of all pages.
+#
+# Usage: sitemap.py site-dir base-url [lastmod]
+
+import argparse
+import glob
+import os
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_URLS = 50000
+MAX_BYTES = 50 * 1000 * 1000
+
+SITEMAP_HEAD = ("<?xml version='1.0' encoding='UTF-8'?>"
+                "<urlset xmlns='http://www.sitemaps.org/schemas/sitemap/0.9' "
+                "xmlns:xsi='http://www.w3.org/2001/XMLSchema-instance' "
+                "xsi:schemaLocation='http://www.sitemaps.org/schemas/sitemap/0.9 "
+                "http://www.sitemaps.org/schemas/sitemap/0.9/sitemap.xsd'>\n")
+SITEMAP_FOOT = "</urlset>\n"
+INDEX_HEAD = ("<?xml version='1.0' encoding='UTF-8'?>"
+              "<sitemapindex xmlns='http://www.sitemaps.org/schemas/sitemap/0.9'>\n")
+INDEX_FOOT = "</sitemapindex>\n"
+
+def find_pages(site_dir):
+    """The .html pages below `site_dir`, as sorted relative URLs."""
+    pages = []
+    for root, _, names in os.walk(site_dir):
+        rel = os.path.relpath(root, site_dir).replace(os.sep, '/')
+        prefix = '' if rel == '.' else rel + '/'
+        pages.extend(prefix + name for name in names if name.endswith('.html'))
+    pages.sort()
+    return pages
+
+def url_entry(url, lastmod):
+    entry = '<url><loc>%s</loc>' % escape(url)
+    if lastmod:
+        entry += '<lastmod>%s</lastmod>' % escape(lastmod)
+    return entry + '<changefreq>daily</changefreq><priority>0.8</priority></url>\n'
+
+class ShardWriter(object):
+    """Streams <url> entries to sitemap-N.xml files, starting a new file
+    whenever the current one would exceed the protocol limits."""
+
+    def __init__(self, site_dir):
+        self.site_dir = site_dir
+        self.shards = []
+        self.file = None
+
+    def write(self, entry):
+        size = len(entry.encode('utf-8'))
+        if self.file is None or self.urls == MAX_URLS or self.bytes + size + len(SITEMAP_FOOT) > MAX_BYTES:
+            self.open_shard()
+        self.file.write(entry)
+        self.urls += 1
+        self.bytes += size
+
+    def open_shard(self):
+        self.close()
+        name = 'sitemap-%d.xml' % (len(self.shards) + 1)
+        self.shards.append(name)
+        self.file = open(os.path.join(self.site_dir, name), 'w', encoding='utf-8')
+        self.file.write(SITEMAP_HEAD)
+        self.urls = 0
+        self.bytes = len(SITEMAP_HEAD)
+
+    def close(self):
+        if self.file is not None:
+            self.file.write(SITEMAP_FOOT)
+            self.file.close()
+            self.file = None
+
+def write_sitemap(site_dir, base_url, lastmod=None):
+    """Writes the sitemap of `site_dir`. Returns the number of pages and
+    the names of the sitemap files."""
+    if not base_url.endswith('/'):
+        base_url += '/'
+    for stale in glob.glob(os.path.join(site_dir, 'sitemap-*.xml')):
+        os.remove(stale)
+    pages = find_pages(site_dir)
+    writer = ShardWriter(site_dir)
+    try:
+        for page in pages:
+            writer.write(url_entry(base_url + quote(page), lastmod))
+    finally:
+        writer.close()
+
+    sitemap = os.path.join(site_dir, 'sitemap.xml')
+    if len(writer.shards) <= 1:
+        # Everything fits into one file, which needs no index.
+        if writer.shards:
+            os.replace(os.path.join(site_dir, writer.shards[0]), sitemap)
+        else:
+            with open(sitemap, 'w', encoding='utf-8') as f:
+                f.write(SITEMAP_HEAD + SITEMAP_FOOT)
+        return len(pages), ['sitemap.xml']
+
+    with open(sitemap, 'w', encoding='utf-8') as f:
+        f.write(INDEX_HEAD)
+        for name in writer.shards:
+            f.write('<sitemap><loc>%s</loc>' % escape(base_url + name))
+            if lastmod:
+                f.write('<lastmod>%s</lastmod>' % escape(lastmod))
+            f.write('</sitemap>\n')
+        f.write(INDEX_FOOT)
+    return len(pages), ['sitemap.xml'] + writer.shards
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the sitemap of the docs.')
+    parser.add_argument('site_dir')
+    parser.add_argument('base_url')
+    parser.add_argument('lastmod', nargs='?')
+    args = parser.parse_args()
+
+    pages, files = write_sitemap(args.site_dir, args.base_url, args.lastmod)
+    print('sitemap: %d pages in %s' % (pages, ', '.join(files)))
+
+# Sphinx extension
+
+def write_html_sitemap(app, exception):
+    config = app.config
+    if exception is not None or app.builder.format != 'html' or not config.sitemap_base_url:
+        return
+    pages, files = write_sitemap(app.outdir, config.sitemap_base_url, config.sitemap_lastmod)
+    logger.info('sitemap: %d pages in %s', pages, ', '.join(files))
+
+def setup(app):
+    app.add_config_value('sitemap_base_url', None, '')
+    app.add_config_value('sitemap_lastmod', None, '')
+    app.connect('build-finished', write_html_sitemap)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Helpers for the tests of the docs extensions, which build small
+# generated projects with Sphinx (see the *_test.py files next to the
+# extensions, and their py_test rules in docs/BUILD.bazel).
+#
+# The tests run Sphinx in a process of its own, given with --sphinx-build
+# (the sphinx-build of the docs rules in Bazel, `python -m sphinx` by
+# default), so they need no Sphinx themselves: whatever they check is
+# written by the project as JSON.
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+STATIC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def parse_args(description, options=()):
+    """The arguments of a test, with `sphinx_build` as a command line.
+    `options` are (args, kwargs) of further options."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--sphinx-build', help='the sphinx-build to build with (python -m sphinx by default)')
+    for args, kwargs in options:
+        parser.add_argument(*args, **kwargs)
+    args = parser.parse_args()
+    if args.sphinx_build:
+        args.sphinx_build = [os.path.abspath(args.sphinx_build)]
+    else:
+        args.sphinx_build = [sys.executable, '-m', 'sphinx']
+    return args
+
+class Project(object):
+    """A Sphinx project in a temporary directory, removed on exit."""
+
+    def __init__(self, sphinx_build):
+        self.sphinx_build = sphinx_build
+        self.root = None
+
+    def __enter__(self):
+        self.root = tempfile.mkdtemp()
+        self.srcdir = os.path.join(self.root, 'source')
+        os.makedirs(self.srcdir)
+        return self
+
+    def __exit__(self, *exc_info):
+        shutil.rmtree(self.root)
+
+    def write(self, name, text):
+        filename = os.path.join(self.srcdir, *name.split('/'))
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    def path(self, *names):
+        return os.path.join(self.root, *names)
+
+    def build(self, name, *options):
+        """Builds the project into `name`, with `options` for sphinx-build,
+        and returns the exit status and the output."""
+        result = subprocess.run(
+            self.sphinx_build + ['-q'] + list(options) + [
+                '-d', self.path(name, 'doctrees'), self.srcdir, self.path(name, 'out')],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            env=dict(os.environ, PYTHONWARNINGS='ignore::FutureWarning'))
+        return result.returncode, result.stdout.decode('utf-8', 'replace')
+
+def finish(failures, success):
+    """Prints the failures, and exits with 1 if there are any."""
+    for failure in failures:
+        print(failure)
+    if failures:
+        sys.exit(1)
+    print(success)
@@ -0,0 +1,301 @@
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Splits large generated pages into a page per section.
+#
+# The generated API references come as very long pages: the Ledger API
+# reference (proto-docs.rst) has every message, enum and service of the
+# protobufs, and a module of the standard library has all its functions.
+# Sphinx resolves and writes each of them as a whole, and readers load
+# and search them as a whole. `split_pages` maps patterns of document
+# names to the underline of the titles of the sections to split them at,
+# e.g. {'proto-docs': '='}. For every matching document with such
+# sections, this extension
+#
+# - moves every such section, with the labels above its title and up to
+#   the next title of the same or a higher level, to a document of its
+#   own, `<page>/<id of its first label or title>.rst`, which it writes
+#   into the sources when the configuration is read,
+# - replaces the sections by toctrees of the new documents when the page
+#   is read, so that the page becomes their index, at the same address,
+# - turns the links to the labels of the page that docutils resolves
+#   within the document (`text <label_>`_) into :ref:, which resolves
+#   across documents, and
+# - adds a script to the html page that sends links to the anchors that
+#   moved (e.g. proto-docs.html#com-daml-ledger-api-v1-createcommand) on
+#   to their new page.
+#
+# Only titles with an underline and no overline are recognized, which is
+# how the generators write them. `split_pages` is empty by default: the
+# API sub-projects set it (see API_SUBPROJECTS in BUILD.bazel), and the
+# PDF keeps the pages whole. This comes before check_closing_quotes in
+# the list of extensions, so that the sections that moved are only
+# checked in their new documents.
+
+import fnmatch
+import json
+import os
+import re
+
+from docutils import nodes
+from sphinx.errors import SphinxError
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+# The first line of the documents split out of a page.
+MARKER = '.. Split out of {docname} (see split_pages.py).'
+
+ADORNMENT = set('!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~')
+
+TOCTREE = ['', '.. toctree::', '   :maxdepth: 1', '']
+
+# Sends the anchors that moved on to their page. An anchor that is not
+# listed goes to the page of its longest listed prefix (up to a '-'),
+# which covers e.g. the fields of a message.
+SCRIPT = '''<script>
+(function () {
+  var pages = %s;
+  var anchors = %s;
+  var id = decodeURIComponent(window.location.hash.slice(1));
+  if (!id || document.getElementById(id)) {
+    return;
+  }
+  for (var key = id; key; key = key.slice(0, Math.max(key.lastIndexOf('-'), 0))) {
+    if (anchors.hasOwnProperty(key)) {
+      window.location.replace(pages[anchors[key]] + '#' + id);
+      return;
+    }
+  }
+})();
+</script>'''
+
+_label = re.compile(r'^\.\. _([^:`]+):\s*$')
+# Labels anywhere, e.g. those of the fields in a list-table.
+_any_label = re.compile(r'^(?:\s*\* -)?\s*\.\. _([^:`]+):\s*$')
+_local_link = re.compile(r'`([^`<]*?)\s*<([^`<>\s]+)_>`__?')
+
+class SplitPagesError(SphinxError):
+    category = 'Split pages error'
+
+class Section(object):
+    def __init__(self, name, title, lines):
+        self.name = name
+        self.title = title
+        self.lines = lines
+
+class SplitPage(object):
+    """A page split at the titles underlined with `underline`: the text that
+    replaces the page and the sections moved out of it."""
+
+    def __init__(self, docname, lines, underline):
+        self.docname = docname
+        self.sections = []
+        self.index = []
+        found = titles(lines)
+        levels = []
+        for _, char in found:
+            if char not in levels:
+                levels.append(char)
+        if underline not in levels:
+            return
+        level = levels.index(underline)
+
+        # (first line, title line, end) of the sections at the level.
+        spans = []
+        current = None
+        for i, char in found:
+            if levels.index(char) > level:
+                continue
+            start = section_start(lines, i)
+            if current is not None:
+                spans.append(current + (start,))
+                current = None
+            if char == underline:
+                current = (start, i)
+        if current is not None:
+            spans.append(current + (len(lines),))
+
+        labels = {normalize(m.group(1)) for m in map(_any_label.match, lines) if m}
+        basename = docname.rsplit('/', 1)[-1]
+        names = set()
+        toctree = []
+        pos = 0
+        for start, title, end in spans:
+            if start > pos:
+                self.flush(toctree)
+                self.index.extend(local_refs(line, labels) for line in lines[pos:start])
+            first = next((m.group(1) for m in map(_label.match, lines[start:title]) if m), lines[title])
+            name = unique(nodes.make_id(first) or 'section', names)
+            section = Section(name, lines[title].strip(),
+                              [local_refs(line, labels) for line in lines[start:end]])
+            self.sections.append(section)
+            toctree.append('   %s/%s' % (basename, name))
+            pos = end
+        self.flush(toctree)
+        self.index.extend(local_refs(line, labels) for line in lines[pos:])
+
+    def flush(self, toctree):
+        if toctree:
+            self.index.extend(TOCTREE + toctree + [''])
+            del toctree[:]
+
+    def section_docname(self, section):
+        return self.docname + '/' + section.name
+
+    def text(self):
+        return '\n'.join(self.index) + '\n'
+
+    def section_text(self, section):
+        return '\n'.join([MARKER.format(docname=self.docname), ''] + section.lines) + '\n'
+
+    def anchors(self):
+        """The ids of the anchors that moved, to the section they moved to,
+        leaving out those that the prefix of a listed one leads to."""
+        moved = {}
+        for section in self.sections:
+            ids = [nodes.make_id(m.group(1)) for m in map(_any_label.match, section.lines) if m]
+            for id in ids + [nodes.make_id(section.title)]:
+                moved.setdefault(id, section.name)
+        anchors = {}
+        for id in sorted(moved, key=len):
+            key = id
+            while key and key not in anchors:
+                key = key[:max(key.rfind('-'), 0)]
+            if anchors.get(key) != moved[id]:
+                anchors[id] = moved[id]
+        return anchors
+
+def normalize(name):
+    return ' '.join(name.split()).lower()
+
+def unique(name, names):
+    candidate = name
+    n = 1
+    while candidate in names:
+        n += 1
+        candidate = '%s-%d' % (name, n)
+    names.add(candidate)
+    return candidate
+
+def titles(lines):
+    """(line number, underline character) of the titles with an underline
+    and no overline."""
+    found = []
+    for i in range(len(lines) - 1):
+        title = lines[i].rstrip()
+        underline = lines[i + 1].rstrip()
+        if not title or title[0].isspace() or (i > 0 and lines[i - 1].strip()):
+            continue
+        if not underline or underline[0] not in ADORNMENT or underline != underline[0] * len(underline) \
+                or len(underline) < len(title):
+            continue
+        found.append((i, underline[0]))
+    return found
+
+def section_start(lines, i):
+    """The first line of the section whose title is at line `i`: that of
+    the labels right above it, if any."""
+    start = i
+    j = i - 1
+    while j >= 0 and (not lines[j].strip() or _label.match(lines[j])):
+        if lines[j].strip():
+            start = j
+        j -= 1
+    return start
+
+def local_refs(line, labels):
+    """Links to labels of the page resolved by docutils, as :ref:."""
+    def ref(m):
+        if normalize(m.group(2)) not in labels:
+            return m.group(0)
+        return ':ref:`%s <%s>`' % (m.group(1), m.group(2))
+    return _local_link.sub(ref, line) if '_>`_' in line else line
+
+def write_section(srcdir, page, section):
+    filename = os.path.join(srcdir, *page.section_docname(section).split('/')) + '.rst'
+    text = page.section_text(section)
+    if os.path.exists(filename):
+        with open(filename, encoding='utf-8') as f:
+            current = f.read()
+        if current == text:
+            return
+        if not current.startswith(MARKER.split('{', 1)[0]):
+            raise SplitPagesError('%s is in the sources, and a section of %s' % (filename, page.docname))
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+def remove_stale_sections(srcdir, page):
+    """Removes the documents split out of the page by a previous build that
+    it does not have anymore."""
+    directory = os.path.join(srcdir, *page.docname.split('/'))
+    current = {section.name + '.rst' for section in page.sections}
+    for name in os.listdir(directory):
+        filename = os.path.join(directory, name)
+        if name.endswith('.rst') and name not in current:
+            with open(filename, encoding='utf-8') as f:
+                split_out = f.readline().startswith(MARKER.format(docname=page.docname))
+            if split_out:
+                os.remove(filename)
+
+def split_configured_pages(app, config):
+    app.split_pages = {}
+    if not config.split_pages:
+        return
+    marker = MARKER.split('{', 1)[0]
+    for root, dirs, files in os.walk(app.srcdir):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.endswith('.rst'):
+                continue
+            rel = os.path.relpath(os.path.join(root, name), app.srcdir)
+            docname = rel[:-len('.rst')].replace(os.sep, '/')
+            underline = next((underline for pattern, underline in sorted(config.split_pages.items())
+                              if fnmatch.fnmatchcase(docname, pattern)), None)
+            if not underline:
+                continue
+            with open(os.path.join(root, name), encoding='utf-8') as f:
+                text = f.read()
+            if text.startswith(marker):
+                continue
+            page = SplitPage(docname, text.splitlines(), underline)
+            if not page.sections:
+                continue
+            os.makedirs(os.path.join(app.srcdir, *docname.split('/')), exist_ok=True)
+            for section in page.sections:
+                write_section(app.srcdir, page, section)
+            remove_stale_sections(app.srcdir, page)
+            app.split_pages[docname] = page
+    if app.split_pages:
+        logger.info('split_pages: split %d pages into %d', len(app.split_pages),
+                    sum(len(page.sections) for page in app.split_pages.values()))
+
+def replace_page(app, docname, source):
+    page = getattr(app, 'split_pages', {}).get(docname)
+    if page is not None:
+        source[0] = page.text()
+
+def add_anchor_script(app, doctree, docname):
+    page = getattr(app, 'split_pages', {}).get(docname)
+    if page is None or app.builder.format != 'html':
+        return
+    anchors = page.anchors()
+    names = sorted(set(anchors.values()))
+    pages = [app.builder.get_relative_uri(docname, docname + '/' + name) for name in names]
+    index = {name: i for i, name in enumerate(names)}
+    script = SCRIPT % (json.dumps(pages, separators=(',', ':')),
+                       json.dumps({id: index[name] for id, name in anchors.items()},
+                                  separators=(',', ':'), sort_keys=True))
+    doctree.append(nodes.raw('', script, format='html'))
+
+def setup(app):
+    app.add_config_value('split_pages', {}, 'env')
+    app.connect('config-inited', split_configured_pages)
+    app.connect('source-read', replace_page)
+    app.connect('doctree-resolved', add_anchor_script)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
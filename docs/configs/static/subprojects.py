@@ -0,0 +1,233 @@
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Stitches separately built sub-projects into the html docs.
+#
+# The generated API references (the standard library, daml-script,
+# triggers and the Ledger API protobufs) change on a different cadence
+# from the hand-written docs, so they are built as Sphinx projects of
+# their own (//docs:api-*, with the html configuration), in parallel and
+# cached independently. `subprojects` lists them as `docname=directory`,
+# with the document their master document becomes in the site and a
+# directory with their objects.inv and, for the html builds, their pages.
+# For every sub-project, this extension
+#
+# - adds its objects.inv as an intersphinx inventory, so that :ref: to
+#   its labels resolves, and resolves :doc: to its documents, which
+#   intersphinx would only find under their name in the sub-project,
+# - writes a stub of its master document into the sources, with the
+#   title from the inventory, so that toctrees can include it,
+# - adds its search index to that of the site, and
+# - at the end of the html build, copies its pages into the site, without
+#   what the site has already (SHARED: _static, the search page, ...),
+#   and points the links to those at the copies of the site.
+#
+# The pages have to be in place before the extensions that look at the
+# pages of the site at the end of the build (`redirects`, `sitemap`,
+# `postprocess`), so this comes before them in the list of extensions.
+# The list of sub-projects can be set through DOCS_SUBPROJECTS.
+
+import os
+import posixpath
+import re
+import shutil
+
+from docutils import nodes
+from docutils.utils import relative_path
+from sphinx.errors import SphinxError
+from sphinx.ext.intersphinx import InventoryAdapter
+from sphinx.search import js_index
+from sphinx.util import docname_join, logging
+from sphinx.util.inventory import InventoryFile
+
+logger = logging.getLogger(__name__)
+
+# What the sub-projects write at their root that the site has already.
+SHARED = [
+    '.buildinfo',
+    '_search',
+    '_sources',
+    '_static',
+    'genindex.html',
+    'objects.inv',
+    'search.html',
+    'searchindex.js',
+]
+
+STUB = '''.. Stands in for the master document of the {name} sub-project, whose
+   pages replace it at the end of the build (see subprojects.py).
+
+{title}
+{underline}
+'''
+
+_link = re.compile(r'''(\b(?:href|src)=)(["'])([^"']*)\2''')
+_url_root = re.compile(r'''(\bdata-url_root=["']|\bURL_ROOT:\s*')[^"']*''')
+
+class SubprojectError(SphinxError):
+    category = 'Sub-project error'
+
+class Subproject(object):
+    def __init__(self, entry):
+        docname, sep, directory = entry.partition('=')
+        if not sep or not docname or not directory:
+            raise SubprojectError('invalid entry %r in subprojects, expected docname=directory' % entry)
+        self.docname = docname.strip('/')
+        self.path, self.master = posixpath.split(self.docname)
+        self.name = self.path.replace('/', '-') or self.master
+        self.directory = os.path.abspath(directory)
+        self.inventory = os.path.join(self.directory, 'objects.inv')
+
+def subprojects(config):
+    return [Subproject(entry) for entry in config.subprojects if entry]
+
+def read_inventory(filename):
+    with open(filename, 'rb') as f:
+        return InventoryFile.load(f, '', posixpath.join)
+
+def write_stub(srcdir, subproject):
+    entry = read_inventory(subproject.inventory).get('std:doc', {}).get(subproject.master)
+    title = entry[3] if entry and entry[3] != '-' else subproject.master
+    stub = STUB.format(name=subproject.name, title=title, underline='=' * len(title))
+    filename = os.path.join(srcdir, *subproject.docname.split('/')) + '.rst'
+    if os.path.exists(filename):
+        with open(filename, encoding='utf-8') as f:
+            current = f.read()
+        if current == stub:
+            return
+        if not current.startswith(STUB.split('{', 1)[0]):
+            raise SubprojectError('%s is in the sources and in the %s sub-project' % (filename, subproject.name))
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(stub)
+
+def add_subprojects(app, config):
+    if not subprojects(config):
+        return
+    # intersphinx adds to the version of the environment, which the PDF
+    # build has to share with the html build (see pdf_build.py), so it is
+    # only loaded when there are sub-projects.
+    app.setup_extension('sphinx.ext.intersphinx')
+    mapping = dict(config.intersphinx_mapping)
+    for subproject in subprojects(config):
+        if not os.path.isfile(subproject.inventory):
+            raise SubprojectError('no objects.inv for the %s sub-project in %s' % (
+                subproject.name, subproject.directory))
+        # Relative paths, so that the environment can be reused from other
+        # directories (see doctree_cache.py).
+        mapping[subproject.name] = (subproject.path + '/', os.path.relpath(subproject.inventory, app.srcdir))
+        write_stub(app.srcdir, subproject)
+    config.intersphinx_mapping = mapping
+
+def resolve_doc(app, env, node, contnode):
+    if node.get('refdomain') != 'std' or node['reftype'] != 'doc':
+        return None
+    docname = docname_join(node['refdoc'], node['reftarget'])
+    for subproject in subprojects(app.config):
+        if not docname.startswith(subproject.path + '/'):
+            continue
+        docs = InventoryAdapter(env).named_inventory.get(subproject.name, {}).get('std:doc', {})
+        entry = docs.get(docname[len(subproject.path) + 1:])
+        if entry is None:
+            return None
+        proj, version, uri, dispname = entry
+        uri = posixpath.join(relative_path(node['refdoc'], '.'), uri)
+        newnode = nodes.reference('', '', internal=True, refuri=uri)
+        if node.get('refexplicit') or dispname == '-':
+            newnode.append(contnode)
+        else:
+            newnode.append(contnode.__class__(dispname, dispname))
+        return newnode
+    return None
+
+def add_search_indexes(app, *args):
+    indexer = getattr(app.builder, 'indexer', None)
+    if indexer is None:
+        return []
+    added = set()
+    for subproject in subprojects(app.config):
+        filename = os.path.join(subproject.directory, 'searchindex.js')
+        if not os.path.isfile(filename):
+            continue
+        with open(filename, encoding='utf-8') as f:
+            index = js_index.loads(f.read())
+        docnames = [posixpath.join(subproject.path, docname) for docname in index['docnames']]
+        indexer._titles.update(zip(docnames, index['titles']))
+        indexer._filenames.update(zip(docnames, (posixpath.join(subproject.path, name)
+                                                 for name in index['filenames'])))
+        for field, mapping in (('terms', indexer._mapping), ('titleterms', indexer._title_mapping)):
+            for term, docs in index[field].items():
+                docs = [docs] if isinstance(docs, int) else docs
+                mapping.setdefault(term, set()).update(docnames[i] for i in docs)
+        added.update(docnames)
+    if added and 'prune' not in vars(indexer):
+        # The builder prunes the index to the documents of the environment
+        # before dumping it, which would drop those of the sub-projects.
+        prune = indexer.prune
+        indexer.prune = lambda docnames: prune(set(docnames) | added)
+    return []
+
+def rewrite_links(text, rel, subproject_path, files):
+    """The page at `rel` in a sub-project, moved to `subproject_path` in
+    the site: links to files that are not among `files` go to the root of
+    the site."""
+    to_root = '../' * (rel.count('/') + subproject_path.count('/') + 1)
+    def link(m):
+        url = m.group(3)
+        if not url or '://' in url or url.startswith(('#', '/', 'mailto:', 'javascript:', 'data:')):
+            return m.group(0)
+        path = re.split(r'[?#]', url, 1)[0]
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(rel), path))
+        if not path or target in files or target.startswith('../'):
+            return m.group(0)
+        return m.group(1) + m.group(2) + to_root + target + url[len(path):] + m.group(2)
+    text = _link.sub(link, text)
+    return _url_root.sub(lambda m: m.group(1) + to_root, text)
+
+def copy_pages(site_dir, subproject):
+    """Copies the pages of a sub-project into the site. Returns the number
+    of pages copied."""
+    files = set()
+    for root, dirs, names in os.walk(subproject.directory):
+        rel = os.path.relpath(root, subproject.directory).replace(os.sep, '/')
+        if rel == '.':
+            dirs[:] = [d for d in dirs if d not in SHARED]
+            names = [name for name in names if name not in SHARED]
+        files.update(posixpath.normpath(posixpath.join(rel, name)) for name in names)
+    pages = 0
+    for rel in sorted(files):
+        src = os.path.join(subproject.directory, *rel.split('/'))
+        dst = os.path.join(site_dir, *(subproject.path.split('/') + rel.split('/')))
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        if rel.endswith('.html'):
+            with open(src, encoding='utf-8') as f:
+                text = rewrite_links(f.read(), rel, subproject.path, files)
+            with open(dst, 'w', encoding='utf-8') as f:
+                f.write(text)
+            pages += 1
+        else:
+            shutil.copyfile(src, dst)
+    return pages
+
+def copy_subprojects(app, exception):
+    if exception is not None or app.builder.format != 'html':
+        return
+    for subproject in subprojects(app.config):
+        if not os.path.isfile(os.path.join(subproject.directory, subproject.master + '.html')):
+            continue
+        pages = copy_pages(app.outdir, subproject)
+        logger.info('subprojects: %d pages of %s copied to %s', pages, subproject.name, subproject.path)
+
+def setup(app):
+    app.add_config_value('subprojects', [entry for entry in os.environ.get('DOCS_SUBPROJECTS', '').split(',')
+                                         if entry], '')
+    app.connect('config-inited', add_subprojects)
+    app.connect('missing-reference', resolve_doc)
+    app.connect('html-collect-pages', add_search_indexes)
+    app.connect('build-finished', copy_subprojects)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
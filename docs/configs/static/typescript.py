@@ -10,13 +10,13 @@
     :license: BSD, see LICENSE for details.
 """
 import re
-from pygments.lexer import RegexLexer, include, bygroups, default, using, \
-    this, words, combined
+from pygments.lexer import RegexLexer, RegexLexerMeta, include, bygroups, \
+    default, using, this, words, combined
 from pygments.token import Text, Comment, Operator, Keyword, Name, String, \
     Number, Punctuation, Other
 from pygments.util import get_bool_opt
 import pygments.unistring as uni
-__all__ = ['TypeScriptLexer']
+__all__ = ['TypeScriptLexer', 'PlainTypeScriptLexer', 'LinearTypeScriptLexer']
 JS_IDENT_START = ('(?:[$_' + uni.combine('Lu', 'Ll', 'Lt', 'Lm', 'Lo', 'Nl') +
                   ']|\\\\u[a-fA-F0-9]{4})')
 JS_IDENT_PART = ('(?:[$' + uni.combine('Lu', 'Ll', 'Lt', 'Lm', 'Lo', 'Nl',
@@ -136,3 +136,247 @@ class TypeScriptLexer(RegexLexer):
             include('root'),
         ],
     }
+
+
+# The rules above are taken from Pygments and rely on backtracking. Some
+# of them take quadratic or even exponential time on unusual input, e.g.
+# an unterminated string full of backslashes, a long chain of dotted
+# names, or many unterminated comments. LinearTypeScriptLexer uses the
+# same rule table, but replaces those rules by hand-written scanners (or
+# by regexes without overlapping quantifiers), so that lexing takes time
+# linear in the size of the input. On input that the rules above can lex
+# without backtracking, both lexers produce exactly the same tokens.
+#
+# Each scanner is called like the `match` method of a compiled regex,
+# with the text and a position, and returns a ScanMatch or None.
+
+class ScanMatch(object):
+    """Mimics the parts of `re.Match` that RegexLexer and bygroups use.
+    `spans` holds the (start, end) of the whole match, followed by those
+    of the groups."""
+
+    __slots__ = ('text', 'spans')
+
+    def __init__(self, text, spans):
+        self.text = text
+        self.spans = spans
+
+    def start(self, group=0):
+        return self.spans[group][0]
+
+    def end(self, group=0):
+        return self.spans[group][1]
+
+    def group(self, group=0):
+        start, end = self.spans[group]
+        return self.text[start:end]
+
+def delimited_scanner(opening, closing):
+    """Matches `opening`, anything, and the first `closing` after it,
+    like `opening.*?closing` with re.DOTALL.
+
+    The result of the last search is remembered: when a text has no
+    `closing` after some position, later attempts in the same text fail
+    immediately instead of searching to the end again."""
+    last = [None, 0, -1]  # text, searched from, found at
+
+    def scan(text, pos):
+        if not text.startswith(opening, pos):
+            return None
+        start = pos + len(opening)
+        last_text, last_from, last_found = last
+        if last_text is text and last_from <= start and (last_found == -1 or last_found >= start):
+            found = last_found
+        else:
+            found = text.find(closing, start)
+            last[:] = [text, start, found]
+        if found == -1:
+            return None
+        return ScanMatch(text, [(pos, found + len(closing))])
+    return scan
+
+def string_scanner(quote):
+    """Equivalent to the regex `q(\\\\|\\q|[^q])*q` for the quote q.
+
+    Normally, that regex matches up to the first quote that is not
+    escaped by a backslash. If there is none, backtracking eventually
+    treats the backslash of the last escaped quote as an ordinary
+    character, so the match ends at that quote instead. Finding that
+    by backtracking takes time exponential in the number of backslashes;
+    here it takes one pass."""
+    def scan(text, pos):
+        if not text.startswith(quote, pos):
+            return None
+        n = len(text)
+        i = pos + 1
+        last_escaped = -1
+        while i < n:
+            c = text[i]
+            if c == quote:
+                return ScanMatch(text, [(pos, i + 1)])
+            if c == '\\' and i + 1 < n:
+                if text[i + 1] == quote:
+                    last_escaped = i + 1
+                    i += 2
+                    continue
+                if text[i + 1] == '\\':
+                    i += 2
+                    continue
+            i += 1
+        if last_escaped == -1:
+            return None
+        return ScanMatch(text, [(pos, last_escaped + 1)])
+    return scan
+
+NAME_CHARS = re.compile(r'[\w?.$]*')
+NAME_START = re.compile(r'[a-zA-Z_?.$]')
+NAME_START_OR_DIGIT = re.compile(r'[\w?.$]')
+COLON = re.compile(r'\s*:\s*')
+
+def name_run_end():
+    """Returns a function that finds the end of the run of `[\\w?.$]`
+    characters starting at a position. Every position inside a run has
+    the same end, so the last run found is remembered, which makes
+    repeated lookups in e.g. a long chain of dotted names constant time."""
+    last = [None, 0, 0]  # text, run start, run end
+
+    def end(text, pos):
+        last_text, start, stop = last
+        if last_text is text and start <= pos <= stop:
+            return stop
+        stop = NAME_CHARS.match(text, pos).end()
+        last[:] = [text, pos, stop]
+        return stop
+    return end
+
+def function_name_scanner():
+    """Equivalent to `([a-zA-Z_?.$][\\w?.$]*)\\(\\) \\{`."""
+    run_end = name_run_end()
+
+    def scan(text, pos):
+        if not NAME_START.match(text, pos):
+            return None
+        end = run_end(text, pos + 1)
+        if not text.startswith('() {', end):
+            return None
+        return ScanMatch(text, [(pos, end + 4), (pos, end)])
+    return scan
+
+def type_annotation_scanner():
+    """Equivalent to `([\\w?.$][\\w?.$]*)(\\s*:\\s*)([\\w?.$][\\w?.$]*)`."""
+    run_end = name_run_end()
+
+    def scan(text, pos):
+        if not NAME_START_OR_DIGIT.match(text, pos):
+            return None
+        name_end = run_end(text, pos + 1)
+        colon = COLON.match(text, name_end)
+        if not colon:
+            return None
+        type_start = colon.end()
+        if not NAME_START_OR_DIGIT.match(text, type_start):
+            return None
+        type_end = run_end(text, type_start + 1)
+        return ScanMatch(text, [(pos, type_end), (pos, name_end),
+                                (name_end, type_start), (type_start, type_end)])
+    return scan
+
+# Maps the regexes of the rules above to linear-time scanners.
+SCANNERS = {
+    r'//.*?\n': delimited_scanner('//', '\n'),
+    r'/\*.*?\*/': delimited_scanner('/*', '*/'),
+    '".*?"': delimited_scanner('"', '"'),
+    "'.*?'": delimited_scanner("'", "'"),
+    r'"(\\\\|\\"|[^"])*"': string_scanner('"'),
+    r"'(\\\\|\\'|[^'])*'": string_scanner("'"),
+    r'([a-zA-Z_?.$][\w?.$]*)\(\) \{': function_name_scanner(),
+    r'([\w?.$][\w?.$]*)(\s*:\s*)([\w?.$][\w?.$]*)': type_annotation_scanner(),
+}
+
+# Maps the regexes of the rules above to equivalent regexes that take
+# linear time. `\s*` twice in a row, and `\s*` after a class that
+# contains `\s`, backtrack quadratically on long runs of whitespace.
+# Dropping the redundant `\s*` does not change what the groups match.
+LINEAR_REGEXES = {
+    r'\b(module)(\s*)(\s*[\w?.$][\w?.$]*)(\s*)': r'\b(module)(\s*)([\w?.$][\w?.$]*)(\s*)',
+    r'(super)(\s*)(\([\w,?.$\s]+\s*\))': r'(super)(\s*)(\([\w,?.$\s]+\))',
+}
+
+# Faster regexes for comments and strings, which match the same as the
+# rules above on the texts that PlainTypeScriptLexer lexes (the string
+# regexes differ when a string is not closed).
+PLAIN_REGEXES = dict(LINEAR_REGEXES, **{
+    r'//.*?\n': r'//[^\n]*\n',
+    r'/\*.*?\*/': r'/\*[^*]*\*+(?:[^/*][^*]*\*+)*/',
+    r'"(\\\\|\\"|[^"])*"': r'"(?:[^"\\]|\\.)*"',
+    r"'(\\\\|\\'|[^'])*'": r"'(?:[^'\\]|\\.)*'",
+})
+
+# The scanners are called from Python for almost every token, which
+# makes them slower than the regexes they replace on ordinary code. The
+# regexes only take more than linear time when some attempt to match
+# them fails far from where it started, and `needs_scanners` rules that
+# out with a few linear searches over the text: every `/*` is closed,
+# the last line has no `//` (get_tokens adds a final newline anyway),
+# there is no backslash right before or anywhere after the last quote
+# of either kind, so a string can only fail to close at that quote and
+# without backslashes to backtrack over, and no run of name characters is longer than
+# MAX_NAME_RUN, which bounds the backtracking over each of them. Only
+# texts that fail these checks are lexed with the scanners. (The quoted
+# JSX attribute values can only fail after the last quote of the text,
+# so they are linear either way.)
+MAX_NAME_RUN = 256
+
+def needs_scanners(text):
+    opening = text.rfind('/*')
+    if opening != -1 and text.find('*/', opening + 2) == -1:
+        return True
+    if '//' in text[text.rfind('\n') + 1:]:
+        return True
+    for quote in '"\'':
+        last = text.rfind(quote)
+        if last != -1 and '\\' in text[max(last - 1, 0):]:
+            return True
+    # The words between whitespace are at least as long as the runs of
+    # name characters, and much faster to find.
+    return max(map(len, text.split()), default=0) > MAX_NAME_RUN
+
+def linear_rules(rules, replacements):
+    return [(replacements.get(rule[0], rule[0]),) + rule[1:] if isinstance(rule, tuple) else rule
+            for rule in rules]
+
+class ScannerLexerMeta(RegexLexerMeta):
+    """Accepts scanner functions in place of regexes in token rules."""
+
+    def _process_regex(cls, regex, rflags, state):
+        if callable(regex):
+            return regex
+        return RegexLexerMeta._process_regex(cls, regex, rflags, state)
+
+class PlainTypeScriptLexer(TypeScriptLexer):
+    """
+    TypeScriptLexer with faster regexes, for the texts on which none of
+    its rules can backtrack excessively (see `needs_scanners`).
+    """
+    name = 'TypeScript (plain)'
+    aliases = []
+    tokens = {state: linear_rules(rules, PLAIN_REGEXES) for state, rules in TypeScriptLexer.tokens.items()}
+
+class LinearTypeScriptLexer(TypeScriptLexer, metaclass=ScannerLexerMeta):
+    """
+    TypeScriptLexer with the rules that can backtrack excessively replaced
+    by linear-time scanners where the text needs it.
+    """
+    name = 'TypeScript (linear)'
+    aliases = []
+    tokens = {state: linear_rules(rules, dict(LINEAR_REGEXES, **SCANNERS))
+              for state, rules in TypeScriptLexer.tokens.items()}
+
+    def __init__(self, **options):
+        TypeScriptLexer.__init__(self, **options)
+        self.plain = PlainTypeScriptLexer(**options)
+
+    def get_tokens_unprocessed(self, text, stack=('root',)):
+        if needs_scanners(text):
+            return TypeScriptLexer.get_tokens_unprocessed(self, text, stack)
+        return self.plain.get_tokens_unprocessed(text, stack)
@@ -0,0 +1,154 @@
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Fails the build on warnings, as they are reported.
+#
+# This extension listens to the warnings (and errors) logged by Sphinx.
+# Python warnings raised during the build are logged as Sphinx warnings
+# too, so that they are collected from parallel workers as well, except
+# for the categories in `warning_gate_ignored_categories` (FutureWarning
+# by default: Sphinx 1.8.3 triggers one about Node.traverse() with our
+# version of docutils). Warnings matching any of the regexes in
+# `warning_gate_allowlist`, which are searched for in "location: message",
+# and warnings suppressed by `suppress_warnings` are ignored.
+#
+# `warning_gate_mode` is one of
+#
+# - 'off': nothing happens (the default),
+# - 'fail-fast': the build is aborted on the first warning,
+# - 'full': the build runs to the end and then fails if there were any
+#   warnings.
+#
+# If `warning_gate_report` is set, the warnings are also written to that
+# file as a JSON list of objects with the file, line, level, type and
+# message of every warning. Both can be set in conf.py or through the
+# DOCS_WARNING_GATE and DOCS_WARNING_REPORT environment variables.
+#
+# This extension comes first in the list of extensions, so that it sees
+# the warnings of the others from the start. Its check at the end of
+# the build, though, has to come after the build-finished handlers of
+# all the others (e.g. redirects.py warns about broken redirects then),
+# so it is only connected once the builder is initialized, after the
+# extensions and conf.py have connected theirs.
+
+import copy
+import json
+import logging as std_logging
+import os
+import re
+import warnings
+
+from sphinx.errors import SphinxError
+from sphinx.util import logging
+from sphinx.util.logging import WarningLogRecordTranslator, is_suppressed_warning
+
+logger = logging.getLogger(__name__)
+
+MODES = ['off', 'fail-fast', 'full']
+
+class WarningGateError(SphinxError):
+    category = 'Warning gate'
+
+def split_location(location):
+    """(file, line) of a location of the form "file:line"."""
+    if not location:
+        return None, None
+    path, sep, line = location.rpartition(':')
+    if sep and line.isdigit():
+        return path, int(line)
+    return location, None
+
+class WarningGate(std_logging.Handler):
+    def __init__(self, app):
+        super().__init__(std_logging.WARNING)
+        self.app = app
+        self.translator = WarningLogRecordTranslator(app)
+        config = app.config
+        self.fail_fast = config.warning_gate_mode == 'fail-fast'
+        self.allowlist = [re.compile(pattern) for pattern in config.warning_gate_allowlist]
+        self.warnings = []
+
+    def emit(self, record):
+        # Warnings logged while Sphinx holds them back (e.g. while
+        # writing) come by a second time when they are released.
+        if getattr(record, 'warning_gate_seen', False):
+            return
+        record.warning_gate_seen = True
+        type_, subtype = getattr(record, 'type', None), getattr(record, 'subtype', None)
+        if is_suppressed_warning(type_, subtype, self.app.config.suppress_warnings):
+            return
+        # Translate a copy, the record still has to go through the
+        # handlers of Sphinx.
+        record = copy.copy(record)
+        self.translator.filter(record)
+        filename, line = split_location(getattr(record, 'location', None))
+        self.add({
+            'file': filename,
+            'line': line,
+            'level': record.levelname,
+            'type': '.'.join(t for t in [type_, subtype] if t) or None,
+            'message': std_logging.LogRecord.getMessage(record),
+        })
+
+    def add(self, warning):
+        location = warning['file'] or ''
+        if warning['line'] is not None:
+            location += ':%d' % warning['line']
+        text = '%s: %s' % (location, warning['message'])
+        if any(pattern.search(text) for pattern in self.allowlist):
+            return
+        self.warnings.append(warning)
+        if self.fail_fast:
+            raise WarningGateError('aborting on the first warning (warning_gate_mode = fail-fast):\n' + text)
+
+def install_gate(app, config):
+    if config.warning_gate_mode not in MODES:
+        raise WarningGateError('warning_gate_mode must be one of %s, not %r'
+                               % (', '.join(MODES), config.warning_gate_mode))
+    if config.warning_gate_mode == 'off':
+        app.warning_gate = None
+        return
+    gate = app.warning_gate = WarningGate(app)
+    std_logging.getLogger(logging.NAMESPACE).addHandler(gate)
+
+    # Builds in the same process (e.g. in the live preview) replace the
+    # function of the previous one if it was not restored.
+    showwarning = getattr(warnings.showwarning, 'warning_gate_original', warnings.showwarning)
+    def log_warning(message, category, filename, lineno, *args, **kwargs):
+        if category.__name__ in config.warning_gate_ignored_categories:
+            showwarning(message, category, filename, lineno, *args, **kwargs)
+        else:
+            logger.warning('%s: %s', category.__name__, message, location='%s:%d' % (filename, lineno),
+                           type='python', subtype=category.__name__)
+    log_warning.warning_gate_original = showwarning
+    warnings.showwarning = log_warning
+
+def check_warnings(app, exception):
+    gate = app.warning_gate
+    if gate is None:
+        return
+    std_logging.getLogger(logging.NAMESPACE).removeHandler(gate)
+    warnings.showwarning = getattr(warnings.showwarning, 'warning_gate_original', warnings.showwarning)
+    if app.config.warning_gate_report:
+        with open(app.config.warning_gate_report, 'w') as f:
+            json.dump(gate.warnings, f, indent=1)
+    if exception is None and gate.warnings:
+        logger.info('warning gate: %d warning(s), failing the build', len(gate.warnings))
+        app.statuscode = 1
+
+def connect_check(app):
+    app.connect('build-finished', check_warnings)
+
+def setup(app):
+    app.add_config_value('warning_gate_mode', os.environ.get('DOCS_WARNING_GATE', 'off'), '')
+    app.add_config_value('warning_gate_report', os.environ.get('DOCS_WARNING_REPORT'), '')
+    app.add_config_value('warning_gate_allowlist', [], '')
+    app.add_config_value('warning_gate_ignored_categories', ['FutureWarning'], '')
+    app.connect('config-inited', install_gate)
+    app.connect('builder-inited', connect_check)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Checks that the warning gate counts the warnings logged at the end of
+# the build by the extensions that come after it, as redirects.py does.
+#
+# Builds a one page project whose only warning is logged by an extension
+# in its build-finished handler, once in each mode of the gate, and
+# fails unless the build fails, and in full mode the warning is in the
+# report.
+#
+# Usage: warning_gate_test.py [--sphinx-build PATH]
+
+import json
+
+import sphinx_testing
+
+CONF = '''
+import os
+import sys
+sys.path.insert(0, os.path.abspath('.'))
+sys.path.insert(0, %r)
+extensions = ['warning_gate', 'late_warning']
+master_doc = 'index'
+'''
+
+EXTENSION = '''
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+def warn(app, exception):
+    logger.warning('logged at the end of the build', location='index')
+
+def setup(app):
+    app.connect('build-finished', warn)
+'''
+
+def main():
+    args = sphinx_testing.parse_args('Check that the warning gate counts warnings at the end of the build.')
+    failures = []
+    with sphinx_testing.Project(args.sphinx_build) as project:
+        project.write('conf.py', CONF % sphinx_testing.STATIC_DIR)
+        project.write('late_warning.py', EXTENSION)
+        project.write('index.rst', 'Index\n=====\n')
+        for mode in ['full', 'fail-fast']:
+            report = project.path(mode + '.json')
+            status, output = project.build(mode, '-b', 'html', '-D', 'warning_gate_mode=' + mode,
+                                           '-D', 'warning_gate_report=' + report)
+            print('%s: exit status %d' % (mode, status))
+            if status == 0:
+                failures.append('%s: the build did not fail:\n%s' % (mode, output))
+            if mode == 'full':
+                with open(report) as f:
+                    messages = [warning['message'] for warning in json.load(f)]
+                if messages != ['logged at the end of the build']:
+                    failures.append('%s: unexpected warnings in the report: %r' % (mode, messages))
+    sphinx_testing.finish(failures, 'the late warning fails the build')
+
+if __name__ == '__main__':
+    main()
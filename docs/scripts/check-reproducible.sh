@@ -0,0 +1,57 @@
+#!/usr/bin/env bash
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Checks that docs targets are reproducible: builds each twice from
+# scratch and compares the tarballs byte for byte. Bazel would take the
+# second build from the cache, so every build gets an action environment
+# of its own (which the docs rules ignore), and the remote and disk caches
+# are not used. On a difference, the files that differ are listed.
+#
+# //docs:doctrees is checked as well as the html docs by default, as they
+# start from it: if it differed, the html docs would never be taken from
+# the cache, even where they are the same.
+#
+# Usage: check-reproducible.sh [target...] (//docs:doctrees and
+# //docs:docs-no-pdf by default)
+
+set -euo pipefail
+
+cd "$(dirname "$0")/../.."
+TARGETS=${@:-//docs:doctrees //docs:docs-no-pdf}
+WORK_DIR=$(mktemp -d)
+trap 'rm -rf $WORK_DIR' EXIT
+
+build() {
+    local target=$1 n=$2
+    bazel build --noremote_accept_cached --disk_cache= \
+        --action_env=DOCS_REPRODUCIBLE_CHECK=$n $target 2>&1 | tee $WORK_DIR/build-$n.log
+    # Bazel lists the outputs after "Target ... up-to-date:".
+    local output=$(grep -A1 "up-to-date:" $WORK_DIR/build-$n.log | tail -1 | tr -d ' ')
+    cp -L "$output" $WORK_DIR/$n.tar.gz
+}
+
+check() {
+    local target=$1
+    rm -rf $WORK_DIR/*
+    build $target 1
+    build $target 2
+
+    if cmp -s $WORK_DIR/1.tar.gz $WORK_DIR/2.tar.gz; then
+        echo "$target is reproducible ($(sha256sum < $WORK_DIR/1.tar.gz | cut -d' ' -f1))"
+        return 0
+    fi
+
+    echo "$target differs between two builds:"
+    mkdir $WORK_DIR/1 $WORK_DIR/2
+    tar -xzf $WORK_DIR/1.tar.gz -C $WORK_DIR/1
+    tar -xzf $WORK_DIR/2.tar.gz -C $WORK_DIR/2
+    diff -rq $WORK_DIR/1 $WORK_DIR/2 | sed -e "s,$WORK_DIR/[12]/,,g" || true
+    return 1
+}
+
+STATUS=0
+for target in $TARGETS; do
+    check $target || STATUS=1
+done
+exit $STATUS
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Builds the API search index of the docs from the Hoogle databases.
+#
+# damlc writes the documentation of the standard library, daml-script and
+# triggers as Hoogle text databases (see
+# compiler/damlc/daml-doc/src/DA/Daml/Doc/Render/Hoogle.hs). This script
+# parses them into an index that the docs theme searches in the browser
+# (see theme/js/searchSettings.js), without a search server and without
+# downloading all of it:
+#
+# - every declaration is indexed under the tokens of its name (the whole
+#   name, its camelCase parts and the components of module names) and the
+#   names in its type signature, in lower case,
+# - the tokens are sharded by their first PREFIX_LENGTH characters, and
+#   every shard holds the tokens with that prefix together with the
+#   declarations they point to, so a query needs a single shard,
+# - manifest.json lists the shards, so that the theme knows which ones
+#   exist.
+#
+# Usage: hoogle_index.py out-dir hoogle.txt ... [--base-url URL]
+
+import argparse
+import json
+import os
+import re
+import sys
+
+INDEX_VERSION = 1
+
+PREFIX_LENGTH = 2
+
+# How well a token matches the declaration it points to; the theme ranks
+# results by this.
+NAME, NAME_PART, SIGNATURE = 0, 1, 2
+
+# Kept short, the shards carry the docs of every declaration in them.
+DOC_LENGTH = 160
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_']*")
+CAMEL_CASE_PART = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z0-9']+")
+
+class Declaration(object):
+    def __init__(self, name, kind, signature, module, package, url, doc):
+        self.name = name
+        self.kind = kind
+        self.signature = signature
+        self.module = module
+        self.package = package
+        self.url = url
+        self.doc = doc
+
+    def to_json(self):
+        return [self.name, self.kind, self.signature, self.module, self.package, self.url, self.doc]
+
+def unwrap(name):
+    """The name of an operator, without the parentheses."""
+    if name.startswith('(') and name.endswith(')'):
+        return name[1:-1]
+    return name
+
+def summary(doc_lines):
+    """The first paragraph of the docs, shortened to DOC_LENGTH."""
+    paragraph = []
+    for line in doc_lines:
+        if not line.strip():
+            if paragraph:
+                break
+            continue
+        paragraph.append(line.strip())
+    text = ' '.join(paragraph)
+    if len(text) > DOC_LENGTH:
+        text = text[:DOC_LENGTH - 1].rsplit(' ', 1)[0] + '…'
+    return text
+
+def declaration_name(line):
+    """(name, kind) of a declaration line of a Hoogle database."""
+    keyword, _, rest = line.partition(' ')
+    if keyword in ('data', 'type', 'newtype'):
+        return unwrap(rest.split()[0]), keyword
+    if keyword == 'class':
+        # class [Super a =>] Name a
+        head = rest.rsplit('=>', 1)[-1].split()
+        return unwrap(head[0]), 'class'
+    name, sep, _ = line.partition(' :: ')
+    if not sep:
+        return None, None
+    name = name.strip()
+    if name.startswith('[') and name.endswith(']'):
+        return unwrap(name[1:-1]), 'field'
+    name = unwrap(name)
+    return name, 'constructor' if name[:1].isupper() else 'function'
+
+def parse(lines):
+    """The declarations of a Hoogle text database."""
+    package = None
+    module = None
+    module_url = None
+    last_url = None
+    doc = []
+    url = None
+    for line in lines:
+        line = line.rstrip('\n')
+        if line.startswith('-- | '):
+            doc = [line[5:]]
+        elif line.startswith('--   ') and doc:
+            doc.append(line[5:])
+        elif line.startswith('--'):
+            doc = []
+        elif line.startswith('@url '):
+            url = line[5:].strip()
+        elif line.startswith('@package '):
+            package = line[9:].strip()
+            doc, url = [], None
+        elif line.startswith('@') or not line.strip():
+            # The docs and the url belong to the next declaration: damlc
+            # writes a blank line in place of the url of the declarations
+            # without an anchor, between their docs and themselves.
+            pass
+        elif line.startswith('module '):
+            module = line[7:].strip()
+            module_url = last_url = url
+            yield Declaration(module, 'module', line, module, package, url, summary(doc))
+            doc, url = [], None
+        else:
+            name, kind = declaration_name(line)
+            if name is None:
+                doc, url = [], None
+                continue
+            # Record fields have no anchor of their own; they are
+            # documented with their constructor.
+            if url is None:
+                url = last_url if kind == 'field' else module_url
+            last_url = url
+            yield Declaration(name, kind, line, module, package, url, summary(doc))
+            doc, url = [], None
+
+def tokens(declaration):
+    """(token, match) pairs of a declaration, best match first."""
+    seen = set()
+    def new(token):
+        token = token.lower()
+        if token in seen:
+            return False
+        seen.add(token)
+        return True
+    name = declaration.name
+    result = []
+    if new(name):
+        result.append((name.lower(), NAME))
+    parts = name.split('.') if declaration.kind == 'module' else CAMEL_CASE_PART.findall(name)
+    for part in parts:
+        if len(part) > 1 and new(part):
+            result.append((part.lower(), NAME_PART))
+    # The names in the signature, leaving out the keyword and type
+    # variables.
+    signature = declaration.signature.partition(' :: ')[2] if ' :: ' in declaration.signature \
+        else declaration.signature.partition(' ')[2]
+    for identifier in IDENTIFIER.findall(signature):
+        if len(identifier) > 1 and new(identifier):
+            result.append((identifier.lower(), SIGNATURE))
+    return result
+
+def shard_key(token):
+    return ''.join('%04x' % ord(c) for c in token[:PREFIX_LENGTH])
+
+def rewrite_url(url, base_url):
+    """Makes links into the docs relative to the site root, so that they
+    work in previews and on every version of the docs."""
+    if url and base_url and url.startswith(base_url):
+        return '/' + url[len(base_url):].lstrip('/')
+    return url
+
+def build_index(declarations, base_url):
+    """(manifest, shards), where shards maps shard keys to their
+    contents."""
+    shards = {}
+    for declaration in declarations:
+        declaration.url = rewrite_url(declaration.url, base_url)
+        for token, match in tokens(declaration):
+            shard = shards.setdefault(shard_key(token), {'items': [], 'index': {}, 'tokens': {}})
+            item = shard['index'].get(id(declaration))
+            if item is None:
+                item = shard['index'][id(declaration)] = len(shard['items'])
+                shard['items'].append(declaration.to_json())
+            shard['tokens'].setdefault(token, []).append([item, match])
+    for shard in shards.values():
+        del shard['index']
+    manifest = {
+        'version': INDEX_VERSION,
+        'prefixLength': PREFIX_LENGTH,
+        'fields': ['name', 'kind', 'signature', 'module', 'package', 'url', 'doc'],
+        'declarations': len(declarations),
+        'shards': sorted(shards),
+    }
+    return manifest, shards
+
+def write_index(out_dir, manifest, shards):
+    """Writes the index, and returns the sizes of the shards in bytes."""
+    os.makedirs(os.path.join(out_dir, 'shards'), exist_ok=True)
+    sizes = {}
+    for key, shard in sorted(shards.items()):
+        data = json.dumps(shard, separators=(',', ':'), sort_keys=True, ensure_ascii=False).encode('utf-8')
+        with open(os.path.join(out_dir, 'shards', key + '.json'), 'wb') as f:
+            f.write(data)
+        sizes[key] = len(data)
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, separators=(',', ':'), sort_keys=True)
+    return sizes
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the API search index from Hoogle databases.')
+    parser.add_argument('out_dir')
+    parser.add_argument('databases', nargs='+')
+    parser.add_argument('--base-url', default='https://docs.daml.com/',
+                        help='links below this URL are made relative to the site root')
+    args = parser.parse_args()
+
+    declarations = []
+    for database in args.databases:
+        with open(database, encoding='utf-8') as f:
+            declarations.extend(parse(f))
+    if not declarations:
+        sys.exit('hoogle_index: no declarations in %s' % ', '.join(args.databases))
+    manifest, shards = build_index(declarations, args.base_url)
+    sizes = write_index(args.out_dir, manifest, shards)
+    largest = max(sizes, key=sizes.get)
+    print('hoogle_index: %d declarations in %d shards, %d KiB in total, %.1f KiB on average, '
+          'largest %.1f KiB (%s)' % (
+              len(declarations), len(shards), sum(sizes.values()) // 1024,
+              sum(sizes.values()) / len(sizes) / 1024, sizes[largest] / 1024,
+              bytes.fromhex(largest).decode('utf-16-be')))
+
+if __name__ == '__main__':
+    main()
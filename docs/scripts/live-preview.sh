@@ -16,7 +16,7 @@ cleanup()
 {
   echo "Caught Signal ... cleaning up."
   rm -rf $TEMPLATES_DIR/
-  rm -rf $BUILD_DIR
+  find $BUILD_DIR -mindepth 1 -maxdepth 1 ! -name gen -exec rm -rf {} +
   cd $SCRIPT_DIR
   rm -rf ../source/getting-started/code
   rm -rf ../source/daml/stdlib
@@ -27,7 +27,11 @@ cleanup()
   exit 1
 }
 
-rm -rf $BUILD_DIR
+# Keep the output and the Sphinx environment in $BUILD_DIR/gen from the
+# last run, so that only the documents that changed since are rebuilt.
+if [ -d $BUILD_DIR ]; then
+    find $BUILD_DIR -mindepth 1 -maxdepth 1 ! -name gen -exec rm -rf {} +
+fi
 mkdir -p $BUILD_DIR/gen
 
 ln -s ../source $BUILD_DIR
@@ -64,6 +68,8 @@ do
         bazel build //compiler/damlc:daml-base-hoogle.txt
         mkdir -p $BUILD_DIR/gen/hoogle_db
         cp -L ../../bazel-bin/compiler/damlc/daml-base-hoogle.txt $BUILD_DIR/gen/hoogle_db/base.txt
+        bazel build //docs:hoogle_search_index
+        tar -zxf ../../bazel-bin/docs/hoogle_search_index.tar.gz -C $BUILD_DIR/gen
 
         # Javadoc
         bazel build //language-support/java:javadoc
@@ -85,4 +91,6 @@ DATE=$(date +"%Y-%m-%d")
 echo { \"$DATE\" : \"$DATE\" } >  $BUILD_DIR/gen/versions.json
 
 pipenv install
-pipenv run sphinx-autobuild -c $BUILD_DIR/configs/html $BUILD_DIR/source $BUILD_DIR/gen
+pipenv run python $BUILD_DIR/configs/static/live_preview.py \
+    $BUILD_DIR/source $BUILD_DIR/configs/html $BUILD_DIR/gen \
+    --watch $BUILD_DIR/configs
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Decides which docs targets a change needs to rebuild.
+#
+# CI builds //... on every pull request, and with it the html docs and
+# the PDF (//docs:docs-no-pdf and //docs:pdf-docs, which //docs:docs puts
+# together), even when only a page, the redirects or the theme changed.
+# This script maps the changed paths to the docs targets that are
+# actually affected:
+#
+# - the theme (docs/theme) only affects the html, and the html build
+#   restores the Sphinx environment from //docs:doctrees, which does not
+#   depend on the theme and so comes from the cache: only the pages are
+#   written again, without the read phase (the API sub-projects are
+#   written again with the theme, but their inventories, which are all
+#   doctrees reads of them, stay the same),
+# - docs/redirects.map and the redirect template only need
+#   //docs:redirects, which checks the redirects against the pages the
+#   docs will have,
+# - a page (or a file it includes) under docs/source needs the html, and
+#   the PDF only if the page is part of it, i.e. reachable from the
+#   toctrees of docs/configs/pdf/index.rst; a file that was deleted or
+#   renamed needs both,
+# - docs/configs/pdf only needs the PDF,
+# - README.md, the benchmarks, the tests of the extensions and the
+#   developer scripts need nothing,
+# - anything else (the Bazel rules, the shared extensions and
+#   configuration, and all changes outside of docs/, which may change the
+#   generated docs) needs all of them, and nothing is skipped.
+#
+# The decision and the time it saves, from typical durations of the
+# targets on CI (DURATIONS, or those of a Bazel profile of a previous
+# build), are printed on stderr, and the Bazel target patterns that leave
+# out the targets not needed on stdout:
+#
+#   bazel build -- //... $(plan_docs_build.py --base origin/main)
+#
+# Usage: plan_docs_build.py [--base REV | path ...] [--profile build-profile.json]
+
+import argparse
+import fnmatch
+import json
+import os
+import posixpath
+import re
+import subprocess
+import sys
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+SOURCE_DIR = 'docs/source'
+PDF_INDEX = 'docs/configs/pdf/index.rst'
+
+# The docs targets a plan can leave out; their dependencies (the theme,
+# the sources, the search indexes) are left to Bazel.
+THEME = '//docs:theme'
+DOCTREES = '//docs:doctrees'
+REDIRECTS = '//docs:redirects'
+HTML = '//docs:docs-no-pdf'
+PDF = '//docs:pdf-docs'
+DOCS = '//docs:docs'
+TARGETS = [REDIRECTS, HTML, PDF, DOCS]
+
+# Rough durations of the docs targets on the Linux CI agents, in seconds,
+# for the time a plan saves. --profile reads them from a Bazel profile
+# instead.
+DURATIONS = {
+    THEME: 60,
+    DOCTREES: 240,
+    REDIRECTS: 5,
+    HTML: 420,
+    PDF: 840,
+    DOCS: 30,
+}
+
+# What a change needs.
+NOTHING, REDIRECTS_ONLY, THEME_ONLY, PAGES, PDF_ONLY, EVERYTHING = \
+    'nothing', 'redirects', 'theme', 'pages', 'pdf', 'everything'
+
+# (pattern, need, reason), first match wins. docs/source is classified
+# page by page (see Planner.classify_source).
+RULES = [
+    ('docs/README.md', NOTHING, 'not part of any build'),
+    ('docs/benchmarks/**', NOTHING, 'not part of any build'),
+    ('docs/*_test.py', NOTHING, 'test of an extension'),
+    ('docs/configs/static/sphinx_testing.py', NOTHING, 'test of an extension'),
+    ('docs/scripts/plan_docs_build.py', NOTHING, 'developer script'),
+    ('docs/scripts/check-reproducible.sh', NOTHING, 'developer script'),
+    ('docs/scripts/live-preview.sh', NOTHING, 'developer script'),
+    ('docs/scripts/preview.sh', NOTHING, 'developer script'),
+    ('docs/scripts/Pipfile*', NOTHING, 'developer script'),
+    ('docs/redirects.map', REDIRECTS_ONLY, 'redirects'),
+    ('docs/redirect_template.html', REDIRECTS_ONLY, 'redirects'),
+    ('docs/theme/**', THEME_ONLY, 'html theme'),
+    ('docs/error.html', PAGES, 'html page'),
+    ('docs/scripts/check-closing-quotes.allow', PAGES, 'html build'),
+    ('docs/scripts/hoogle_index.py', PAGES, 'html search'),
+    ('docs/configs/pdf/**', PDF_ONLY, 'PDF configuration'),
+    (SOURCE_DIR + '/**', None, None),
+    ('docs/**', EVERYTHING, 'docs build'),
+    ('**', EVERYTHING, 'outside of docs/'),
+]
+
+TOCTREE = re.compile(r'^(\s*)\.\. toctree::\s*$')
+REFERENCE = re.compile(r'^\s*\.\. (?:include|literalinclude|image|figure)::\s*(\S+)')
+EXPLICIT_TITLE = re.compile(r'^.*<(.+)>$')
+
+def read_lines(filename):
+    with open(filename, encoding='utf-8', errors='replace') as f:
+        return f.read().splitlines()
+
+def toctree_entries(lines):
+    """(entry, glob) of the toctrees in the given lines."""
+    entries = []
+    i = 0
+    while i < len(lines):
+        m = TOCTREE.match(lines[i])
+        i += 1
+        if not m:
+            continue
+        indent = len(m.group(1))
+        glob = False
+        block = []
+        while i < len(lines) and (not lines[i].strip() or len(lines[i]) - len(lines[i].lstrip()) > indent):
+            line = lines[i].strip()
+            i += 1
+            if line == ':glob:':
+                glob = True
+            elif line and not line.startswith(':'):
+                block.append(line)
+        entries.extend((entry, glob) for entry in block)
+    return entries
+
+class Planner(object):
+    def __init__(self, root):
+        self.root = root
+        self.source_dir = os.path.join(root, SOURCE_DIR)
+        self.docnames = set()
+        for dirpath, dirs, names in os.walk(self.source_dir):
+            dirs.sort()
+            rel = os.path.relpath(dirpath, self.source_dir).replace(os.sep, '/')
+            for name in names:
+                if name.endswith('.rst'):
+                    self.docnames.add(posixpath.normpath(posixpath.join(rel, name[:-len('.rst')])))
+        self.pdf_files = self.pdf_closure()
+        self.referenced = set()
+        for docname in self.docnames:
+            self.referenced.update(self.references(docname, read_lines(self.doc_path(docname))))
+
+    def doc_path(self, docname):
+        return os.path.join(self.source_dir, *docname.split('/')) + '.rst'
+
+    def resolve(self, docname, target):
+        """A path in a document, relative to the source directory."""
+        if target.startswith('/'):
+            return posixpath.normpath(target[1:])
+        return posixpath.normpath(posixpath.join(posixpath.dirname(docname), target))
+
+    def references(self, docname, lines):
+        """The files a document includes, relative to the source directory."""
+        return {self.resolve(docname, m.group(1)) for m in map(REFERENCE.match, lines) if m}
+
+    def children(self, docname, lines):
+        """The documents in the toctrees of a document."""
+        children = set()
+        for entry, glob in toctree_entries(lines):
+            m = EXPLICIT_TITLE.match(entry)
+            if m:
+                entry = m.group(1)
+            if '://' in entry or entry == 'self':
+                continue
+            if entry.endswith('.rst'):
+                entry = entry[:-len('.rst')]
+            child = self.resolve(docname, entry)
+            if glob:
+                children.update(fnmatch.filter(self.docnames, child))
+            elif child in self.docnames:
+                children.add(child)
+        return children
+
+    def pdf_closure(self):
+        """The files of the PDF, relative to the source directory: the pages
+        reachable from its index, and the files they include."""
+        files = set()
+        todo = [('index', read_lines(os.path.join(self.root, PDF_INDEX)))]
+        seen = set()
+        while todo:
+            docname, lines = todo.pop()
+            files.update(self.references(docname, lines))
+            for child in self.children(docname, lines):
+                if child not in seen:
+                    seen.add(child)
+                    files.add(child + '.rst')
+                    todo.append((child, read_lines(self.doc_path(child))))
+        return files
+
+    def classify_source(self, path):
+        rel = path[len(SOURCE_DIR) + 1:]
+        # The pages are classified by the new tree, in which a file that was
+        # deleted (or renamed) is not reachable from the PDF anymore,
+        # although the PDF may break without it.
+        if not os.path.exists(os.path.join(self.root, *path.split('/'))):
+            return EVERYTHING, 'deleted or renamed, may have been part of the PDF'
+        if rel in self.pdf_files:
+            return EVERYTHING, 'part of the html and the PDF'
+        if rel.endswith('.rst'):
+            return PAGES, 'html page, not in the PDF'
+        if rel in self.referenced:
+            return PAGES, 'included by html pages only'
+        return EVERYTHING, 'not included by any page, may be used by the builds'
+
+    def classify(self, path):
+        for pattern, need, reason in RULES:
+            # fnmatch's * matches across directories.
+            if fnmatch.fnmatchcase(path, pattern):
+                if need is None:
+                    return self.classify_source(path)
+                return need, reason
+
+def plan(needs):
+    """The docs targets to build for the given needs, and the remark on the
+    targets that are not rebuilt although they are built."""
+    if EVERYTHING in needs or (needs & {PAGES, THEME_ONLY} and PDF_ONLY in needs):
+        return list(TARGETS), []
+    build = []
+    reused = []
+    if REDIRECTS_ONLY in needs:
+        build.append(REDIRECTS)
+    if needs & {PAGES, THEME_ONLY}:
+        build.append(HTML)
+    if THEME_ONLY in needs and PAGES not in needs:
+        reused.append(DOCTREES)
+    if PDF_ONLY in needs:
+        build.append(PDF)
+    return build, reused
+
+def profile_durations(filename):
+    """The time spent on the actions of every target in a Bazel profile
+    (written with --experimental_profile_include_target_label)."""
+    with open(filename, encoding='utf-8') as f:
+        profile = json.load(f)
+    events = profile['traceEvents'] if isinstance(profile, dict) else profile
+    durations = {}
+    for event in events:
+        target = (event.get('args') or {}).get('target')
+        if target and event.get('ph') == 'X':
+            durations[target] = durations.get(target, 0) + event.get('dur', 0) / 1e6
+    return durations
+
+def changed_paths(base):
+    output = subprocess.check_output(
+        ['git', 'diff', '--name-only', '--no-renames', base + '...HEAD'], cwd=ROOT)
+    return output.decode('utf-8').splitlines()
+
+def format_duration(seconds):
+    return '%dm%02ds' % divmod(int(round(seconds)), 60)
+
+def main():
+    parser = argparse.ArgumentParser(description='Plan the docs targets a change needs to rebuild.')
+    parser.add_argument('paths', nargs='*', help='changed paths, relative to the root of the repository')
+    parser.add_argument('--base', help='take the paths changed since the merge base with this revision')
+    parser.add_argument('--profile', help='take the durations of the targets from this Bazel profile')
+    args = parser.parse_args()
+
+    paths = args.paths
+    if args.base:
+        try:
+            paths = changed_paths(args.base)
+        except (OSError, subprocess.CalledProcessError) as err:
+            print('plan_docs_build: cannot diff against %s (%s), building all docs' % (args.base, err),
+                  file=sys.stderr)
+            return
+    if not paths:
+        print('plan_docs_build: no changes, building all docs', file=sys.stderr)
+        return
+
+    durations = dict(DURATIONS)
+    if args.profile:
+        durations.update(profile_durations(args.profile))
+
+    planner = Planner(ROOT)
+    needs = set()
+    print('plan_docs_build: %d changed path(s)' % len(paths), file=sys.stderr)
+    for path in paths:
+        need, reason = planner.classify(path)
+        needs.add(need)
+        print('  %-11s %s (%s)' % (need, path, reason), file=sys.stderr)
+    needs.discard(NOTHING)
+
+    build, reused = plan(needs)
+    skipped = [target for target in TARGETS if target not in build]
+    print('plan_docs_build: building %s' % (', '.join(build) or 'no docs'), file=sys.stderr)
+    if skipped:
+        print('plan_docs_build: skipping %s' % ', '.join(skipped), file=sys.stderr)
+    if reused:
+        print('plan_docs_build: %s does not depend on the changes and comes from the cache, '
+              'so the Sphinx read phase is skipped' % ', '.join(reused), file=sys.stderr)
+    saved = sum(durations.get(target, 0) for target in skipped + reused)
+    print('plan_docs_build: saves about %s' % format_duration(saved), file=sys.stderr)
+    print(' '.join('-' + target for target in skipped))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Assembles the docs source tree from a manifest.
+#
+# The source tree consists of docs/source, the rst of the standard
+# library, daml-script and triggers (which come as tarballs), the
+# protobuf docs and the license files. Rather than copying all of it into
+# a tarball that every docs build extracts again, `manifest` records
+# where every file of the tree comes from, with the hash of its content:
+#
+#   stage_sources.py manifest OUT --tree source=docs/source \
+#       --tarball source/daml/stdlib=daml-base-rst.tar.gz \
+#       --file source/LICENSE=LICENSE
+#
+# and `stage` puts the tree together in a directory, from the same
+# inputs:
+#
+#   stage_sources.py stage MANIFEST DIR
+#
+# Plain files are hard linked (or, across file systems, cloned where the
+# file system supports it, and copied otherwise), so staged files must be
+# replaced rather than written to. Tarball members are extracted straight
+# from the original archives, one pass per archive. The manifest is kept
+# in DIR, and staging into a directory again only touches the files whose
+# hash changed and removes the ones that are gone.
+
+import argparse
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tarfile
+
+MANIFEST_VERSION = 1
+
+# The name of the copy of the manifest in the staged directory.
+STAGED_MANIFEST = '.stage-manifest.json'
+
+# ioctl to clone a file on file systems with copy-on-write (btrfs, xfs).
+FICLONE = 0x40049409
+
+def file_hash(f):
+    h = hashlib.sha256()
+    for chunk in iter(lambda: f.read(1 << 16), b''):
+        h.update(chunk)
+    return h.hexdigest()
+
+# Manifest
+
+def tree_entries(dest, directory):
+    for root, dirs, names in os.walk(directory, followlinks=True):
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                digest = file_hash(f)
+            yield os.path.join(dest, os.path.relpath(path, directory)), {'sha256': digest, 'path': path}
+
+def tarball_entries(dest, tarball):
+    # The rst tarballs have a single top-level directory, which is
+    # dropped, as with tar --strip-components 1.
+    with tarfile.open(tarball) as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            parts = member.name.split('/')[1:]
+            if not parts:
+                continue
+            digest = file_hash(tar.extractfile(member))
+            yield os.path.join(dest, *parts), {'sha256': digest, 'path': tarball, 'member': member.name}
+
+def file_entry(dest, filename):
+    with open(filename, 'rb') as f:
+        return dest, {'sha256': file_hash(f), 'path': filename}
+
+def make_manifest(trees, tarballs, files):
+    entries = {}
+    for dest, directory in trees:
+        entries.update(tree_entries(dest, directory))
+    # Generated files replace files of the same name in the trees (e.g. the
+    # proto-docs.rst that live-preview.sh copies into docs/source), but not
+    # each other.
+    generated = {}
+    def add(dest, entry):
+        if dest in generated:
+            raise ValueError('%s is staged from both %s and %s' % (dest, generated[dest]['path'], entry['path']))
+        generated[dest] = entry
+    for dest, tarball in tarballs:
+        for dest_file, entry in tarball_entries(dest, tarball):
+            add(dest_file, entry)
+    for dest, filename in files:
+        add(*file_entry(dest, filename))
+    entries.update(generated)
+    return {'version': MANIFEST_VERSION, 'files': entries}
+
+# Staging
+
+def clone(src, dst):
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+def place(src, dst):
+    """Hard links `src` to `dst`, or clones or copies it where that is not
+    possible."""
+    # Bazel passes inputs as symlinks, and the link itself is not wanted.
+    src = os.path.realpath(src)
+    try:
+        os.link(src, dst)
+        return
+    except OSError as err:
+        if err.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            raise
+    try:
+        clone(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+def remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def stage(manifest, directory):
+    """Brings `directory` in line with `manifest`. Returns the number of
+    files placed, kept and removed."""
+    previous = {}
+    staged_manifest = os.path.join(directory, STAGED_MANIFEST)
+    if os.path.isfile(staged_manifest):
+        with open(staged_manifest) as f:
+            previous = json.load(f).get('files', {})
+
+    files = manifest['files']
+    removed = 0
+    for dest in sorted(set(previous) - set(files)):
+        remove(os.path.join(directory, dest))
+        removed += 1
+
+    kept = 0
+    wanted = {}
+    for dest, entry in sorted(files.items()):
+        target = os.path.join(directory, dest)
+        old = previous.get(dest)
+        if old is not None and old['sha256'] == entry['sha256'] and os.path.isfile(target):
+            kept += 1
+            continue
+        wanted[dest] = entry
+
+    # Clear the way for the changed files, so that hard linked files are
+    # replaced rather than written to.
+    for dest in wanted:
+        target = os.path.join(directory, dest)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        remove(target)
+
+    members = {}
+    for dest, entry in wanted.items():
+        if 'member' in entry:
+            members.setdefault(entry['path'], {})[entry['member']] = dest
+        else:
+            place(entry['path'], os.path.join(directory, dest))
+    for tarball, dests in sorted(members.items()):
+        with tarfile.open(tarball) as tar:
+            for member in tar:
+                dest = dests.get(member.name)
+                if dest is None:
+                    continue
+                with tar.extractfile(member) as src, open(os.path.join(directory, dest), 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+
+    with open(staged_manifest, 'w') as f:
+        json.dump(manifest, f, indent=0, sort_keys=True)
+    return len(wanted), kept, removed
+
+# Command line
+
+def mapping(value):
+    dest, sep, path = value.partition('=')
+    if not sep or not dest or not path:
+        raise argparse.ArgumentTypeError('expected DEST=PATH, got %r' % value)
+    return os.path.normpath(dest), path
+
+def main():
+    parser = argparse.ArgumentParser(description='Stage the docs source tree.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    manifest_parser = commands.add_parser('manifest', help='write the manifest of the source tree')
+    manifest_parser.add_argument('output')
+    manifest_parser.add_argument('--tree', type=mapping, action='append', default=[],
+                                 help='stage the files below PATH in DEST')
+    manifest_parser.add_argument('--tarball', type=mapping, action='append', default=[],
+                                 help='stage the files in the tarball PATH, without their top-level directory, in DEST')
+    manifest_parser.add_argument('--file', type=mapping, action='append', default=[],
+                                 help='stage the file PATH as DEST')
+
+    stage_parser = commands.add_parser('stage', help='put the source tree together')
+    stage_parser.add_argument('manifest')
+    stage_parser.add_argument('directory')
+
+    args = parser.parse_args()
+    if args.command == 'manifest':
+        try:
+            manifest = make_manifest(args.tree, args.tarball, args.file)
+        except ValueError as err:
+            sys.exit('stage_sources: %s' % err)
+        with open(args.output, 'w') as f:
+            json.dump(manifest, f, indent=0, sort_keys=True)
+    else:
+        with open(args.manifest) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != MANIFEST_VERSION:
+            sys.exit('stage_sources: %s is not a version %d manifest' % (args.manifest, MANIFEST_VERSION))
+        os.makedirs(args.directory, exist_ok=True)
+        placed, kept, removed = stage(manifest, args.directory)
+        print('stage_sources: %d files staged, %d unchanged, %d removed' % (placed, kept, removed))
+
+if __name__ == '__main__':
+    main()
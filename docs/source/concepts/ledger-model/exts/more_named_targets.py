@@ -36,63 +36,111 @@ except ImportError:
     # In Debain/Ubuntu, roman package is provided as roman, not as docutils.utils.roman
     from roman import toRoman
 
-def make_dlist_items_named(app, document):
-    labels = app.env.domaindata['std']['labels']
-    anonlabels = app.env.domaindata['std']['anonlabels']
-    for node in document.traverse(nodes.definition_list_item):
-        if node == node.parent.children[0]:
-            node_labels = node.parent['ids']
-        else:
-            node_labels = node['ids']
-        if node_labels:
-            docname = app.env.docname
-            term = clean_astext(node.children[0])
-
-            for label in node_labels:
-                labels[label] = (docname, label, term)
-
-def make_enumlist_items_named(app, document):
-
-    def list_item_enumerator(node):
-        start = node.parent.get('start', 1)
-        index = node.parent.children.index(node) + start
-
-        enumtype = node.parent['enumtype']
-
-        if enumtype == 'arabic':
-            suffix = str(index)
-        elif enumtype == 'loweralpha':
-            suffix = chr(ord('a') + index - 1)
-        elif enumtype == 'upperalpha':
-            suffix = chr(ord('A') + index - 1)
-        elif enumtype == 'lowerroman':
-            suffix = toRoman(index).lower()
-        elif enumtype == 'upperroman':
-            suffix = toRoman(index).upper()
-        else:
-            raise Exception("unknown enumeration list type")
-
-        if (isinstance(node.parent.parent, nodes.list_item)
-                and isinstance(node.parent.parent.parent, nodes.enumerated_list)):
-            prefix = list_item_enumerator(node.parent.parent) + '.'
-        else:
-            prefix = ''
-
-        return prefix + suffix
-
-    labels = app.env.domaindata['std']['labels']
-    anonlabels = app.env.domaindata['std']['anonlabels']
-    docname = app.env.docname
-
-    for node in document.traverse(nodes.enumerated_list):
-        child_labels = [node['ids']] + [c['ids'] for c in node.children[1:]]
-        for (i, child) in enumerate(node.children):
-            for label in child_labels[i]:
-                labels[label] = (docname, label, list_item_enumerator(child))
+# The names of list items are collected per document in
+# `env.named_list_items` (docname -> {label: name}) while reading, and
+# only copied into the labels of the standard domain once all documents
+# have been read (see `register_named_labels`). Never writing to the
+# domain data from `doctree-read` keeps the extension safe for parallel
+# reads: every worker only touches the entries of its own documents,
+# which are merged back by `merge_named_items`.
+def named_items(env):
+    if not hasattr(env, 'named_list_items'):
+        env.named_list_items = {}
+    return env.named_list_items
+
+def purge_named_items(app, env, docname):
+    named_items(env).pop(docname, None)
+
+def merge_named_items(app, env, docnames, other):
+    items = named_items(env)
+    other_items = named_items(other)
+    for docname in docnames:
+        if docname in other_items:
+            items[docname] = other_items[docname]
+
+def register_named_labels(app, env):
+    labels = env.domaindata['std']['labels']
+    for docname, items in sorted(named_items(env).items()):
+        for label, name in sorted(items.items()):
+            labels[label] = (docname, label, name)
+    # Keep the table in label order rather than in the order the documents
+    # were read in, which varies between builds (see
+    # docs/configs/static/reproducible.py).
+    env.domaindata['std']['labels'] = dict(sorted(labels.items()))
+
+def enumerator_suffix(enumtype, index):
+    if enumtype == 'arabic':
+        return str(index)
+    elif enumtype == 'loweralpha':
+        return chr(ord('a') + index - 1)
+    elif enumtype == 'upperalpha':
+        return chr(ord('A') + index - 1)
+    elif enumtype == 'lowerroman':
+        return toRoman(index).lower()
+    elif enumtype == 'upperroman':
+        return toRoman(index).upper()
+    else:
+        raise Exception("unknown enumeration list type")
+
+def term_name(term):
+    # clean_astext copies the whole node to blank out images and drop raw
+    # nodes, which is by far the most expensive part of naming an item.
+    # Terms rarely contain either, so avoid the copy where possible.
+    for node in term.traverse():
+        if isinstance(node, (nodes.image, nodes.raw)):
+            return clean_astext(term)
+    return term.astext()
+
+def list_item_names(document):
+    """Returns the names of all labelled definition and enumeration list
+    items in `document` as a dict from label to name.
+
+    The tree is walked once, in document order. Enumeration list items
+    are numbered by their position while walking, and the number of an
+    item is handed down as the prefix of lists nested directly inside of
+    it, so no number is ever computed twice."""
+    names = {}
+    # Pairs of a node and the number prefix to use if it is an
+    # enumeration list nested in an enumeration list item.
+    stack = [(document, '')]
+    while stack:
+        node, prefix = stack.pop()
+        if isinstance(node, nodes.enumerated_list):
+            start = node.get('start', 1)
+            enumtype = node['enumtype']
+            children = []
+            for i, item in enumerate(node.children):
+                number = prefix + enumerator_suffix(enumtype, start + i)
+                for label in (node['ids'] if i == 0 else item['ids']):
+                    names[label] = number
+                for child in item.children:
+                    if isinstance(child, nodes.enumerated_list):
+                        children.append((child, number + '.'))
+                    elif isinstance(child, nodes.Element):
+                        children.append((child, ''))
+            stack.extend(reversed(children))
+            continue
+        if isinstance(node, nodes.definition_list):
+            for i, item in enumerate(node.children):
+                if not isinstance(item, nodes.definition_list_item):
+                    continue
+                item_labels = node['ids'] if i == 0 else item['ids']
+                if item_labels:
+                    term = term_name(item.children[0])
+                    for label in item_labels:
+                        names[label] = term
+        stack.extend((child, '') for child in reversed(node.children)
+                     if isinstance(child, nodes.Element))
+    return names
+
+def make_list_items_named(app, document):
+    named_items(app.env)[app.env.docname] = list_item_names(document)
 
 def setup(app):
-    app.connect('doctree-read', make_dlist_items_named)
-    app.connect('doctree-read', make_enumlist_items_named)
+    app.connect('env-purge-doc', purge_named_items)
+    app.connect('env-merge-info', merge_named_items)
+    app.connect('doctree-read', make_list_items_named)
+    app.connect('env-updated', register_named_labels)
 
     return {
         'version' : '0.1',
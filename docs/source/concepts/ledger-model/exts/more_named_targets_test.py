@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021 Digital Asset (Switzerland) GmbH and/or its affiliates. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Checks that more_named_targets gives the same labels in a parallel
+# build as in a serial one.
+#
+# Generates a project whose documents have labelled enumeration and
+# definition lists, nested and referenced across documents, builds it
+# with -j1 and with -jN, and compares the label tables of the standard
+# domain, which the project writes as JSON at the end of the build.
+# Sphinx only reads in parallel with enough documents, so keep --docs
+# well above the number of jobs. Exits with 1 if the tables differ.
+#
+# Usage: more_named_targets_test.py [--docs N] [--jobs N] [--sphinx-build PATH]
+
+import json
+import os
+import sys
+
+EXTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(EXTS_DIR, '..', '..', '..', '..', 'configs', 'static'))
+
+import sphinx_testing
+
+CONF = '''
+import json
+import sys
+sys.path.insert(0, %r)
+extensions = ['more_named_targets']
+master_doc = 'index'
+
+def write_labels(app, exception):
+    if exception is None:
+        with open(%r, 'w') as f:
+            json.dump(app.env.domaindata['std']['labels'], f, default=str)
+
+def setup(app):
+    app.connect('build-finished', write_labels)
+'''
+
+def make_document(n, docs):
+    """A document with labelled items in an enumeration list with a
+    nested one, and in a definition list, referring to the items of the
+    next document."""
+    other = (n + 1) % docs
+    return '''
+Document %(n)d
+============%(underline)s
+
+.. _doc%(n)d-steps:
+
+#. The first step.
+
+   .. _doc%(n)d-step-2:
+
+#. The second step, with sub-steps:
+
+   .. _doc%(n)d-substeps:
+
+   #. The first sub-step.
+
+      .. _doc%(n)d-substep-2:
+
+   #. The second sub-step.
+
+.. _doc%(n)d-terms:
+
+first term %(n)d
+   A definition.
+
+   .. _doc%(n)d-term-2:
+
+second term %(n)d
+   Another definition.
+
+See :ref:`doc%(other)d-step-2`, :ref:`doc%(other)d-substep-2` and
+:ref:`doc%(other)d-term-2`.
+''' % {'n': n, 'other': other, 'underline': '=' * len(str(n))}
+
+def labels(project, jobs):
+    """The label table of a build with `jobs` processes."""
+    output = project.path('labels-j%d.json' % jobs)
+    project.write('conf.py', CONF % (EXTS_DIR, output))
+    status, log = project.build('j%d' % jobs, '-W', '-b', 'dummy', '-j', str(jobs))
+    if status != 0:
+        sys.exit('the build with -j%d failed:\n%s' % (jobs, log))
+    with open(output) as f:
+        return {label: tuple(entry) for label, entry in json.load(f).items()}
+
+def main():
+    args = sphinx_testing.parse_args('Compare the labels of more_named_targets with -j1 and -jN.', [
+        (['--docs'], {'type': int, 'default': 64}),
+        (['--jobs'], {'type': int, 'default': 4}),
+    ])
+    with sphinx_testing.Project(args.sphinx_build) as project:
+        names = ['doc%d' % n for n in range(args.docs)]
+        project.write('index.rst', 'Index\n=====\n\n.. toctree::\n\n%s\n' % '\n'.join('   ' + name for name in names))
+        for n, name in enumerate(names):
+            project.write(name + '.rst', make_document(n, args.docs))
+        serial = labels(project, 1)
+        parallel = labels(project, args.jobs)
+
+    named = sum(1 for _, _, name in serial.values() if name)
+    print('%d labels, %d named' % (len(serial), named))
+    failures = ['%s: -j1 %r, -j%d %r' % (label, serial.get(label), args.jobs, parallel.get(label))
+                for label in sorted(set(serial) | set(parallel))
+                if serial.get(label) != parallel.get(label)]
+    sphinx_testing.finish(failures, 'the label tables are the same')
+
+if __name__ == '__main__':
+    main()
@@ -58,6 +58,8 @@ if (!splitQuery) {
 var Search = {
 
     _index: null,
+    _shards: null,
+    _shardUrl: null,
     _queued_query: null,
     _pulse_status: -1,
     _inline: '',
@@ -67,6 +69,10 @@ var Search = {
     },
 
     init: function () {
+        // searchtools.js calls this as well when it is loaded first
+        if (this._initialized)
+            return;
+        this._initialized = true;
         var params = $.getQueryParameters();
         if (params.q) {
             var query = params.q[0];
@@ -76,6 +82,10 @@ var Search = {
     },
 
     loadIndex: function (url) {
+        if (/\.json$/.test(url)) {
+            this.loadManifest(url);
+            return;
+        }
         $.ajax({
             type: "GET", url: url, data: null,
             dataType: "script", cache: true,
@@ -87,6 +97,76 @@ var Search = {
         });
     },
 
+    /**
+     * load the manifest of a sharded index (see configs/static/search_shards.py),
+     * the terms are loaded by query() as they are needed
+     */
+    loadManifest: function (url) {
+        if (this._shardUrl !== null)
+            return;
+        this._shardUrl = url.replace(/manifest\.json$/, 'shards/');
+        this._shards = {};
+        $.getJSON(url).done(function (manifest) {
+            Search.setIndex(manifest);
+        }).fail(function () {
+            Search._shardUrl = null;
+        });
+    },
+
+    /**
+     * the shard of the index holding a term: the UTF-16 code units of its
+     * first characters in hex
+     */
+    shardKey: function (term) {
+        var key = '';
+        for (var i = 0; i < Math.min(term.length, this._index.prefixLength); i++)
+            key += ('000' + term.charCodeAt(i).toString(16)).slice(-4);
+        return key;
+    },
+
+    /**
+     * call back with the terms and title terms of the given words, loading
+     * the shards they are in first if the index is sharded
+     */
+    loadTerms: function (words, callback) {
+        var index = this._index;
+        if (index.terms) {
+            callback(index.terms, index.titleterms);
+            return;
+        }
+        var keys = [];
+        $.each(words, function (i, word) {
+            var key = Search.shardKey(word);
+            if ($u.indexOf(index.shards, key) != -1 && !$u.contains(keys, key))
+                keys.push(key);
+        });
+        var loads = $.map(keys, function (key) {
+            if (!Search._shards[key]) {
+                Search._shards[key] = $.getJSON(Search._shardUrl + key + '.json').then(function (shard) {
+                    return shard;
+                }, function () {
+                    // try again with the next query
+                    delete Search._shards[key];
+                    return $.Deferred().resolve({terms: {}, titleterms: {}});
+                });
+            }
+            return Search._shards[key];
+        });
+        $.when.apply($, loads).done(function () {
+            var terms = {};
+            var titleterms = {};
+            $.each(arguments, function (i, shard) {
+                $.each(words, function (j, word) {
+                    if (word in shard.terms)
+                        terms[word] = shard.terms[word];
+                    if (word in shard.titleterms)
+                        titleterms[word] = shard.titleterms[word];
+                });
+            });
+            callback(terms, titleterms);
+        });
+    },
+
     setIndex: function (index) {
         var q;
         this._index = index;
@@ -206,9 +286,19 @@ var Search = {
         // console.info('required: ', searchterms);
         // console.info('excluded: ', excluded);
 
-        // prepare search
-        var terms = this._index.terms;
-        var titleterms = this._index.titleterms;
+        // prepare search: load the terms of the query
+        this.loadTerms(searchterms.concat(excluded), function (terms, titleterms) {
+            Search.showResults(query, objectterms, searchterms, excluded, hlterms, highlightstring,
+                terms, titleterms);
+        });
+    },
+
+    /**
+     * look up the query and display the results
+     */
+    showResults: function (query, objectterms, searchterms, excluded, hlterms, highlightstring,
+                           terms, titleterms) {
+        var i;
 
         // array of [filename, title, anchor, descr, score]
         var results = [];
@@ -5,19 +5,106 @@
 
 window.searchEngine = 'custom'; // 'sphinx' vs 'custom'
 
+// The API search runs in the browser, on the index that
+// docs/scripts/hoogle_index.py builds from the Hoogle databases into
+// /_hoogle. The index is sharded by the first characters of the tokens, so
+// a query loads the small manifest once and then the one shard its first
+// word falls into.
+var apiIndex = {
+    url : '/_hoogle/',
+    manifest : null,
+    shards : {}
+};
+
+function loadJson(url) {
+    return fetch(url).then(function (response) {
+        if (!response.ok) {
+            throw new Error(response.status);
+        }
+        return response.json();
+    });
+}
+
+function apiShard(token) {
+    if (apiIndex.manifest === null) {
+        apiIndex.manifest = loadJson(apiIndex.url + 'manifest.json');
+    }
+    return apiIndex.manifest.then(function (manifest) {
+        var key = '';
+        var chars = Array.from(token).slice(0, manifest.prefixLength);
+        for (var i = 0; i < chars.length; i++) {
+            key += ('000' + chars[i].codePointAt(0).toString(16)).slice(-4);
+        }
+        if (manifest.shards.indexOf(key) === -1) {
+            return null;
+        }
+        if (!(key in apiIndex.shards)) {
+            apiIndex.shards[key] = loadJson(apiIndex.url + 'shards/' + key + '.json');
+        }
+        return apiIndex.shards[key];
+    });
+}
+
+function escapeHtml(text) {
+    return $('<div>').text(text).html();
+}
+
+// Finds the declarations with a token starting with the first word of the
+// query, and containing all other words in their name or signature. Exact
+// names come first, then name prefixes, then parts of names, then names in
+// the signature.
+function apiSearch(query) {
+    var words = unescape(query).toLowerCase().split(/\s+/).filter(function (w) { return w !== ''; });
+    if (words.length === 0) {
+        return Promise.resolve([]);
+    }
+    var first = words[0];
+    return apiShard(first).then(function (shard) {
+        if (shard === null) {
+            return [];
+        }
+        var scores = {};
+        for (var token in shard.tokens) {
+            if (token.lastIndexOf(first, 0) !== 0) continue;
+            var postings = shard.tokens[token];
+            for (var i = 0; i < postings.length; i++) {
+                var item = postings[i][0];
+                var match = postings[i][1];
+                var score = match === 0 ? (token === first ? 4 : 3) : (match === 1 ? 2 : 1);
+                if (!(item in scores) || scores[item] < score) scores[item] = score;
+            }
+        }
+        var results = [];
+        for (var item in scores) {
+            var decl = shard.items[item];
+            var text = (decl[0] + ' ' + decl[2]).toLowerCase();
+            if (words.slice(1).every(function (w) { return text.indexOf(w) !== -1; })) {
+                results.push({ score : scores[item], decl : decl });
+            }
+        }
+        results.sort(function (a, b) {
+            return b.score - a.score || a.decl[0].length - b.decl[0].length || (a.decl[0] < b.decl[0] ? -1 : 1);
+        });
+        return results.slice(0, 50).map(function (r) { return r.decl; });
+    });
+}
+
 window.customSearches = [
     {
         name : "hoogle",
-        url : 'https://hoogle.daml.com/?mode=json&hoogle=',
+        fetch : apiSearch,
         frequency : 100,
-        inlineMinChar : 1,
+        // The index is sharded by the first prefixLength (2) characters of
+        // the tokens (see docs/scripts/hoogle_index.py), so a query of one
+        // character would only find the names of one character.
+        inlineMinChar : 2,
         process : function(res, searchState) {
             searchState.error = null;
-            searchState.results = res.map(function(item) {
+            searchState.results = res.map(function(decl) {
                 var out = {};
-                out.link = item.url;
-                out.title = item.item;
-                out.snippet = item.docs;
+                out.link = decl[5];
+                out.title = escapeHtml(decl[2]);
+                out.snippet = escapeHtml(decl[3] + (decl[6] ? ': ' + decl[6] : ''));
                 return out;
             })
         }
@@ -314,16 +314,18 @@ function performSearch(fullSearchState, search, results, inline) {
     if (!inline || query.length >= search.inlineMinChar) {
         clearTimeout(searchState.timeout);
         searchState.timeout = setTimeout(function () {
-            var url = search.url + query;
             $('.search-inline .search-alert').removeClass('active');
-            fetch(url)
+            // Searches either define a url to which the query is appended,
+            // or fetch the results themselves.
+            var request = search.fetch ? search.fetch(query) : fetch(search.url + query)
                 .then(function (response) {
                     if (!response.ok) {
                         throw new Error(response.status);
                     } else {
                         return response.json();
                     }
-                })
+                });
+            request
                 .then(function(res) {
                     if (res !== undefined) {
                         searchState.query = query;
@@ -693,7 +695,7 @@ if (searchEngine === 'sphinx') {
                                     $('.search-inline .search-alert').removeClass('active');
                                     resultsWrapper.addClass('active');
                                     Search.setInline();
-                                    Search.loadIndex("/searchindex.js");
+                                    Search.loadIndex("/_search/manifest.json");
                                     Search.performSearch(query);
                                 }, 50);
                             } else {